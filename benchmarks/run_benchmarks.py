@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+"""Benchmarks of the reconciliation kernels, of the genetic operators and of
+the GA loop, on synthetic workloads.
+
+Each workload is a species tree simulated with a pure birth process and a
+gene tree simulated inside it with SimulModel.dlt_tree_from_sptree, pruned
+to the requested number of leaves. The simulations are seeded, so the
+workloads (and the results of two commits) can be compared.
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+
+The results are written as JSON: the run metadata and, for each benchmark
+and workload, the running times of the repeats (in seconds).
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import subprocess
+from argparse import ArgumentParser
+from functools import partial
+
+import numpy as np
+from scipy.stats import gamma
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.TreeLib import TreeUtils
+from lib.TreeLib.TreeIndex import TreeIndex
+from lib.TreeLib.SimulModel import SimulModel
+from lib.ga import GPolySolver, Utils, GArraySolver, ArrayUtils, ReconParams, DTLParams, EdgeParams
+from lib.ga.evolve import GPopulation, GSimpleGA, Scaling, Consts
+from lib.reclkl import computeQe, computeProb, nodeLimitter, computeDL
+
+DEFAULT_WORKLOADS = ["10:50", "50:250", "200:1000"]
+
+
+class StubModel(object):
+    """Likelihood model replacing raxml in the GA benchmark: the score of a
+    tree is its Sackin index (sum of the depths of its leaves), so it depends
+    on the topology and costs almost nothing"""
+    reestimate = False
+    title = "stub"
+
+    def score(self, tree):
+        depth = {}
+        total = 0
+        for node in tree.traverse("preorder"):
+            depth[node] = depth[node.up] + 1 if node.up else 0
+            if node.is_leaf():
+                total += depth[node]
+        return float(total)
+
+    def optimize_model(self, trees, **kwargs):
+        if isinstance(trees, list):
+            return [self.score(t) for t in trees], None
+        return self.score(trees), None
+
+
+class StubScaling(object):
+    """Weighted scaling of the likelihood and reconciliation scores, as the
+    ScalingParams of gatc with the default weights"""
+    _moop = False
+
+    def get_scaling_func(self):
+        return partial(Scaling.WeightScaling, weight=[1.0, 1.0], keepraw=True)
+
+
+class Workload(object):
+    """A species tree of spsize leaves and a gene tree of gsize leaves, the
+    gene leaves are named species_index"""
+
+    def __init__(self, spsize, gsize, seed):
+        self.spsize = spsize
+        self.gsize = gsize
+        random.seed(seed)
+        np.random.seed(seed)
+        model = SimulModel(seed=seed)
+        self.sptree = model.pure_birth_tree(birth=1.0, nsize=spsize)
+        # scale the height to 1, so the gene tree size only depends on the rates
+        height = self.sptree.get_farthest_leaf()[1]
+        for node in self.sptree.traverse():
+            node.dist /= height
+        self.sptree.label_internal_node()
+        death = 0.3
+        birth = max(np.log(2.0 * gsize / spsize), 0.1) + death
+        while True:
+            gtree, _ = model.dlt_tree_from_sptree(self.sptree, birth, death, 0.2)
+            if len(gtree) >= gsize:
+                break
+        leaves = gtree.get_leaves()
+        random.shuffle(leaves)
+        gtree.prune(leaves[:gsize], preserve_branch_length=True)
+        self.specmap = {}
+        for leaf in gtree:
+            leaf.add_features(species=leaf.name.rsplit('_', 1)[0])
+            self.specmap.setdefault(leaf.species, []).append(leaf.name)
+        self.gtree = gtree
+        self.spnewick = self.sptree.write(format=5)
+
+    def subtree(self, size):
+        """Copy of the gene tree, pruned to its first size leaves"""
+        gtree = self.gtree.copy()
+        if size < len(gtree):
+            gtree.prune(gtree.get_leaf_names()[:size], preserve_branch_length=True)
+        return gtree
+
+    def key(self):
+        return {"spsize": self.spsize, "gsize": self.gsize}
+
+
+def timeit(func, repeat, setup=None):
+    """Running times of func, called repeat times with the output of setup
+    (not timed)"""
+    times = []
+    for i in xrange(repeat):
+        args = setup() if setup is not None else ()
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+    return times
+
+
+def bench_dtl_mat(work, args):
+    workspace = TreeUtils.ReconWorkspace()
+    return timeit(lambda: TreeUtils.computeDTLMat(work.gtree, work.sptree, 2, 3, 1, workspace=workspace), args.repeat)
+
+
+def bench_dl_score(work, args):
+    def run():
+        lcamap = TreeUtils.lcaMapping(work.gtree, work.sptree)
+        TreeUtils.computeDLScore(work.gtree, lcamap, 1, 1)
+    return timeit(run, args.repeat)
+
+
+def bench_dtl_array(work, args):
+    # kernel of the parsimony reconciliation with transfers, the rows are
+    # computed from scratch on a copy of the gene tree (the incremental reuse
+    # of the rows is part of the evolve benchmarks)
+    spindex = TreeIndex(work.sptree)
+    return timeit(lambda gtree: TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1), args.repeat,
+                  lambda: (work.gtree.copy(),))
+
+
+def bench_dl_cost(work, args):
+    # kernel of the parsimony reconciliation without transfers (reconDL)
+    if computeDL is None:
+        return None
+    recparam = ReconParams(work.spnewick, work.gsize, parcim=True)
+    recparam.computeDLCost(work.gtree, 1, 1)
+    return timeit(lambda: recparam.computeDLCost(work.gtree, 1, 1), args.repeat)
+
+
+def _lkl_params(work, args):
+    # the number of edges of the time sliced species tree (and the size of
+    # Qef) is quadratic in the number of species, and computeProb is too slow
+    # for the whole gene tree: the lkl kernels only run on the small workloads
+    if work.spsize > args.lkl_spsize:
+        return None, None
+    recparam = ReconParams(work.spnewick, min(work.gsize, args.lkl_gsize), discrsize=args.discrsize, parcim=False)
+    qargs = (recparam.data['slicelist'], recparam.data['node_d'], recparam.discrsize, 0.3, 0.2, 0.4, recparam.stemlen)
+    return recparam, qargs
+
+
+def bench_compute_qe(work, args):
+    recparam, qargs = _lkl_params(work, args)
+    if recparam is None:
+        return None
+    return timeit(lambda: computeQe(*qargs), args.repeat)
+
+
+def bench_compute_prob(work, args):
+    recparam, qargs = _lkl_params(work, args)
+    if recparam is None:
+        return None
+    Qef = computeQe(*qargs)
+    gtree = work.subtree(recparam.gtreesize)
+    for i, node in enumerate(gtree.traverse("postorder")):
+        node.add_features(ind=i)
+    nodeLimitter(gtree, recparam.discrsize, recparam.data['leafslice'])
+    # the probabilities are indexed by the edge of the species leaves
+    edges = dict((name, node.edge_i) for name, node in recparam.sptree.name2node.items())
+    shape = (2*len(gtree) - 1, len(recparam.data['node_d']), recparam.discrsize)
+
+    def run():
+        tables = (recparam.workspace.table('prob_Ax', shape), recparam.workspace.table('prob_Se', shape))
+        computeProb(gamma(1.0), gtree, edges, recparam.data['slicelist'], recparam.data['node_d'],
+                    recparam.discrsize, recparam.stemlen, 0.3, 0.2, Qef, tables)
+    return timeit(run, args.repeat)
+
+
+def bench_tree_copy(work, args):
+    return timeit(lambda: work.gtree.copy(), args.repeat)
+
+
+def _genomes(work, genome_class, n):
+    """n genomes of the gene tree, all but the first one with a few random SPR"""
+    genome_class.setGeneMap(work.specmap)
+    utils = ArrayUtils if genome_class is GArraySolver else Utils
+    genomes = []
+    for i in xrange(n):
+        genome = genome_class(work.gtree.copy(), StubModel(), DTLParams(("1", "0", "1")),
+                              EdgeParams((1.0, 1.0)), is_init=True)
+        genome.set_species()
+        for k in xrange(3 if i else 0):
+            utils.performSPR(genome)
+        genomes.append(genome)
+    return genomes
+
+
+def _bench_operators(genome_class, utils, work, repeat):
+    g1, g2 = _genomes(work, genome_class, 2)
+    spec = sorted(work.specmap.keys())[0]
+    results = {}
+    results["crossover_recon"] = timeit(utils.no_recon_crossover, repeat, lambda: (g1, g2))
+    results["crossover_cost"] = timeit(utils.cost_preserve_crossover, repeat, lambda: (g1, g2))
+    results["mutation_spr"] = timeit(utils.performSPR, repeat, lambda: (g1.clone(),))
+    results["mutation_reroot"] = timeit(utils.reroot, repeat, lambda: (g1.clone(),))
+    results["mutation_permute"] = timeit(lambda g: utils.permute_seq(g, spec), repeat, lambda: (g1.clone(),))
+    results["clone"] = timeit(g1.clone, repeat)
+    return results
+
+
+# the operators are fast, they are run more times to reduce the noise
+def bench_tree_operators(work, args):
+    return _bench_operators(GPolySolver, Utils, work, 10*args.repeat)
+
+
+def bench_array_operators(work, args):
+    return _bench_operators(GArraySolver, ArrayUtils, work, 10*args.repeat)
+
+
+def _engine(genome_class, work, ngen, popsize):
+    """GA Engine of the evolve benchmarks: parsimony reconciliation with the
+    stub likelihood, and the gatc defaults"""
+    recparam = ReconParams(work.spnewick, work.gsize, parcim=True)
+    GPolySolver.setReconcile(recparam)
+    pop = GPopulation.GPopulation(_genomes(work, genome_class, popsize), single=False)
+    pop.setBulkEval(True)
+    pop.setPopulationEvaluator(Utils.bulk_evaluate)
+    ga = GSimpleGA.GSimpleGA(pop)
+    ga.setGenerations(ngen)
+    ga.setReconParam(recparam)
+    ga.setScaleParam(StubScaling())
+    ga.setPopulationSize(popsize)
+    ga.setMutationRate(0.6)
+    ga.setCrossoverRate(0.8)
+    ga.setFitnessCache(Consts.CDefFitnessCacheSize)
+    return (ga,)
+
+
+def bench_evolve_tree(work, args):
+    return timeit(GSimpleGA.GSimpleGA.evolve, args.repeat, partial(_engine, GPolySolver, work, args.ngen, args.popsize))
+
+
+def bench_evolve_array(work, args):
+    return timeit(GSimpleGA.GSimpleGA.evolve, args.repeat, partial(_engine, GArraySolver, work, args.ngen, args.popsize))
+
+
+BENCHMARKS = [
+    ("dtl_mat", bench_dtl_mat),
+    ("dtl_array", bench_dtl_array),
+    ("dl_score", bench_dl_score),
+    ("dl_cost", bench_dl_cost),
+    ("compute_qe", bench_compute_qe),
+    ("compute_prob", bench_compute_prob),
+    ("tree_copy", bench_tree_copy),
+    ("tree_operators", bench_tree_operators),
+    ("array_operators", bench_array_operators),
+    ("evolve_tree", bench_evolve_tree),
+    ("evolve_array", bench_evolve_array),
+]
+
+
+def summarize(name, work, times):
+    record = {"name": name, "times": times, "min": min(times), "median": float(np.median(times))}
+    record.update(work.key())
+    return record
+
+
+def git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    pattern = re.compile(args.only) if args.only else None
+    results = []
+    for spec in args.workloads:
+        spsize, gsize = [int(x) for x in spec.split(':')]
+        work = Workload(spsize, gsize, args.seed)
+        for name, bench in BENCHMARKS:
+            if pattern and not pattern.search(name):
+                continue
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            times = bench(work, args)
+            if times is None:
+                continue
+            elif not isinstance(times, dict):
+                times = {None: times}
+            for subname in sorted(times):
+                record = summarize("%s.%s" % (name, subname) if subname else name, work, times[subname])
+                logging.info("%s (%d, %d): %.6fs", record["name"], spsize, gsize, record["median"])
+                results.append(record)
+
+    return {"meta": {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.machine(), "node": platform.node(), "seed": args.seed,
+                     "repeat": args.repeat, "ngen": args.ngen, "popsize": args.popsize,
+                     "lkl_spsize": args.lkl_spsize, "lkl_gsize": args.lkl_gsize, "discrsize": args.discrsize},
+            "results": results}
+
+
+def compare(base, new, out=sys.stderr):
+    """Print the median times of new against the ones of base"""
+    key = lambda r: (r["name"], r["spsize"], r["gsize"])
+    before = dict((key(r), r) for r in base["results"])
+    out.write("%-32s %6s %6s %12s %12s %8s\n" % ("benchmark", "sp", "gene", "base", "new", "speedup"))
+    for r in new["results"]:
+        old = before.get(key(r))
+        if old is None:
+            continue
+        speedup = old["median"] / r["median"] if r["median"] > 0 else float('inf')
+        out.write("%-32s %6d %6d %12.6f %12.6f %7.2fx\n" % (r["name"], r["spsize"], r["gsize"],
+                                                           old["median"], r["median"], speedup))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Benchmarks of the GATC reconciliation kernels, genetic operators and GA loop")
+    parser.add_argument('--workloads', nargs='+', default=DEFAULT_WORKLOADS, metavar='SP:GENE',
+                        help="Workloads, as number of species tree leaves:number of gene tree leaves")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of runs of each benchmark")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the simulations and of the GA")
+    parser.add_argument('--ngen', type=int, default=5, help="Number of generations of the evolve benchmarks")
+    parser.add_argument('--popsize', type=int, default=20, help="Population size of the evolve benchmarks")
+    parser.add_argument('--lkl_spsize', type=int, default=10,
+                        help="computeQe and computeProb only run on the workloads with at most this number of species")
+    parser.add_argument('--lkl_gsize', type=int, default=6,
+                        help="computeProb runs on the gene tree pruned to this number of leaves")
+    parser.add_argument('--discrsize', type=int, default=4, help="Discretization size of computeQe and computeProb")
+    parser.add_argument('--only', help="Only run the benchmarks whose name matches this regular expression")
+    parser.add_argument('--output', '-o', help="Output JSON file (default: standard output)")
+    parser.add_argument('--compare', metavar='BASE', help="JSON results to compare with")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Log each benchmark")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(result, handle, indent=1, sort_keys=True)
+    else:
+        json.dump(result, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write("\n")
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(json.load(handle), result)
@@ -0,0 +1,326 @@
+# This file is part of profileNJ
+#
+# ArrayTree is a compact representation of a rooted binary gene tree with
+# flat arrays, used by the GA genomes. Copies are array copies and the
+# topology operators (SPR, rerooting, subtree swap/regraft) only update the
+# arrays. TreeClass trees are built only when they are needed.
+
+import numpy as np
+from TreeClass import TreeClass
+
+
+class ArrayTree(object):
+    """Rooted binary tree stored in arrays. The n leaves are the nodes
+    0..n-1 and the n-1 internal nodes are n..2n-2. genes and species are
+    the name lists shared by all the trees of a population, gene and
+    specie are the index of the leaf names in these lists (-1 for the
+    internal nodes)"""
+
+    def __init__(self, nleaves, genes, species):
+        size = 2 * nleaves - 1
+        self.nleaves = nleaves
+        self.genes = genes
+        self.species = species
+        self.root = size - 1
+        self.parent = np.empty(size, dtype=np.int32)
+        self.left = np.empty(size, dtype=np.int32)
+        self.right = np.empty(size, dtype=np.int32)
+        self.gene = np.empty(size, dtype=np.int32)
+        self.specie = np.empty(size, dtype=np.int32)
+        self.dist = np.ones(size)
+        for arr in (self.parent, self.left, self.right, self.gene, self.specie):
+            arr.fill(-1)
+
+    @classmethod
+    def from_tree(cls, tree, genes, species):
+        """Build the ArrayTree of a binary TreeClass, with leaves named by genes
+        and having the feature 'species'"""
+        gene2ind = dict((g, i) for i, g in enumerate(genes))
+        spec2ind = dict((s, i) for i, s in enumerate(species))
+        nodes = list(tree.traverse("postorder"))
+        nleaves = (len(nodes) + 1) // 2
+        atree = cls(nleaves, genes, species)
+        leafpos = 0
+        intpos = nleaves
+        node2ind = {}
+        for node in nodes:
+            children = node.get_children()
+            if not children:
+                i = leafpos
+                leafpos += 1
+                atree.gene[i] = gene2ind[node.name]
+                atree.specie[i] = spec2ind[node.species]
+            elif len(children) == 2:
+                i = intpos
+                intpos += 1
+                atree.left[i], atree.right[i] = [node2ind[c] for c in children]
+                atree.parent[atree.left[i]] = i
+                atree.parent[atree.right[i]] = i
+            else:
+                raise ValueError("The tree should be binary")
+            atree.dist[i] = node.dist
+            node2ind[node] = i
+        atree.root = node2ind[tree]
+        return atree
+
+    def copy(self):
+        """Copy of the tree, the name lists are shared"""
+        other = ArrayTree.__new__(ArrayTree)
+        other.nleaves = self.nleaves
+        other.genes = self.genes
+        other.species = self.species
+        other.root = self.root
+        other.parent = self.parent.copy()
+        other.left = self.left.copy()
+        other.right = self.right.copy()
+        other.gene = self.gene.copy()
+        other.specie = self.specie.copy()
+        other.dist = self.dist.copy()
+        return other
+
+    def is_leaf(self, i):
+        return self.left[i] < 0
+
+    def sibling(self, i):
+        p = self.parent[i]
+        return self.right[p] if self.left[p] == i else self.left[p]
+
+    def _replace_child(self, p, old, new):
+        if self.left[p] == old:
+            self.left[p] = new
+        else:
+            self.right[p] = new
+
+    def _attach(self, p, old, new):
+        """Put node new in place of the child old of p (or at the root)"""
+        self.parent[new] = p
+        if p < 0:
+            self.root = new
+        else:
+            self._replace_child(p, old, new)
+
+    def postorder(self, start=None):
+        """List of the nodes of the subtree of start (the root by default) in postorder"""
+        order = []
+        stack = [self.root if start is None else start]
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            if self.left[i] >= 0:
+                stack.append(self.left[i])
+                stack.append(self.right[i])
+        order.reverse()
+        return order
+
+    def is_ancestor(self, i, j):
+        """Return True if node i is an ancestor of node j (or j itself)"""
+        while j >= 0:
+            if j == i:
+                return True
+            j = self.parent[j]
+        return False
+
+    def incomparable(self, i):
+        """Index of the nodes incomparable to node i (neither in its subtree
+        nor its ancestors)"""
+        mask = np.ones(len(self.parent), dtype=bool)
+        mask[self.postorder(i)] = False
+        j = self.parent[i]
+        while j >= 0:
+            mask[j] = False
+            j = self.parent[j]
+        return np.flatnonzero(mask)
+
+    def leaf_genes(self, i):
+        """Gene index of the leaves under node i"""
+        return [self.gene[x] for x in self.postorder(i) if self.left[x] < 0]
+
+    def spr(self, donor, receiver):
+        """Prune the subtree of donor and regraft it on the edge above
+        receiver. The parent of donor is reused as the new node. Return False
+        if the move is not possible (the nodes are not incomparable, or the
+        donor parent or the receiver is the root, or they are sisters)"""
+        p = self.parent[donor]
+        if p < 0 or receiver == self.root or p == self.root or self.parent[receiver] == p or \
+                self.is_ancestor(donor, receiver) or self.is_ancestor(receiver, donor):
+            return False
+        s = self.sibling(donor)
+        self._attach(self.parent[p], p, s)
+        self._attach(self.parent[receiver], receiver, p)
+        self.left[p], self.right[p] = donor, receiver
+        self.parent[receiver] = p
+        self.dist[p] = 1.0
+        return True
+
+    def random_spr(self):
+        """SPR between a random node and a random incomparable node"""
+        size = len(self.parent)
+        donor = np.random.randint(size)
+        while donor == self.root:
+            donor = np.random.randint(size)
+        incomp = self.incomparable(donor)
+        if not len(incomp):
+            return False
+        return self.spr(donor, incomp[np.random.randint(len(incomp))])
+
+    def reroot(self, c):
+        """Root the tree on the edge above node c, the root node is reused as
+        the new root"""
+        r = self.root
+        if c == r or self.parent[c] == r:
+            return False
+        path = [c]
+        while self.parent[path[-1]] != r:
+            path.append(self.parent[path[-1]])
+        top = path[-1]
+        other = self.sibling(top)
+        odist = [self.dist[x] for x in path]
+        # the two children of the old root are joined
+        self.dist[other] += self.dist[top]
+        # reverse the path, each node gets its old parent as child
+        for k in xrange(len(path) - 1, 0, -1):
+            v, below = path[k], path[k - 1]
+            newchild = other if k == len(path) - 1 else path[k + 1]
+            self._replace_child(v, below, newchild)
+            self.parent[newchild] = v
+            self.parent[v] = below
+            self.dist[v] = odist[k - 1] if k > 1 else odist[0] / 2.0
+        # the old root is now above c and its old parent
+        v1 = path[1]
+        self.left[r], self.right[r] = c, v1
+        self.parent[c] = r
+        self.parent[v1] = r
+        self.dist[c] = odist[0] / 2.0
+        return True
+
+    def random_reroot(self):
+        """Reroot the tree on a random edge"""
+        return self.reroot(np.random.randint(len(self.parent)))
+
+    def permute_genes(self, i, j):
+        """Exchange the genes at leaves i and j"""
+        self.gene[i], self.gene[j] = self.gene[j], self.gene[i]
+
+    def _copy_subtree(self, other, j, slots, p, old):
+        """Write the subtree of node j of other at the free nodes of slots
+        (leaves, internals) and attach it in place of the child old of p.
+        Return the new index of j"""
+        leafslots, intslots = list(slots[0]), list(slots[1])
+        newind = {}
+        for x in other.postorder(j):
+            if other.left[x] < 0:
+                y = leafslots.pop()
+                self.left[y] = self.right[y] = -1
+                self.gene[y] = other.gene[x]
+                self.specie[y] = other.specie[x]
+            else:
+                y = intslots.pop()
+                self.left[y] = newind[other.left[x]]
+                self.right[y] = newind[other.right[x]]
+                self.parent[self.left[y]] = y
+                self.parent[self.right[y]] = y
+                self.gene[y] = self.specie[y] = -1
+            self.dist[y] = other.dist[x]
+            newind[x] = y
+        self._attach(p, old, newind[j])
+        return newind[j]
+
+    def _split_slots(self, nodes):
+        return [x for x in nodes if x < self.nleaves], [x for x in nodes if x >= self.nleaves]
+
+    def swap_subtree(self, i, other, j):
+        """Exchange the subtree of node i with the subtree of node j of other.
+        The subtrees should have the same number of leaves of each species, the
+        genes outside the subtrees are then renamed to keep each gene once"""
+        nodes1, nodes2 = self.postorder(i), other.postorder(j)
+        if len(nodes1) != len(nodes2):
+            raise ValueError("The subtrees should have the same size")
+        genes1, genes2 = self._leaf_map(i), other._leaf_map(j)
+        copy1, copy2 = self.copy(), other.copy()
+        self._copy_subtree(copy2, j, self._split_slots(nodes1), self.parent[i], i)
+        other._copy_subtree(copy1, i, other._split_slots(nodes2), other.parent[j], j)
+        self._fix_genes(genes1, genes2, set(nodes1))
+        other._fix_genes(genes2, genes1, set(nodes2))
+
+    def _leaf_map(self, i):
+        """Gene index to specie index of the leaves under node i"""
+        return dict((self.gene[x], self.specie[x]) for x in self.postorder(i) if self.left[x] < 0)
+
+    def _fix_genes(self, lost, gained, keep):
+        """Rename the genes outside of the nodes keep that were gained by a swap,
+        with the lost genes of the same species"""
+        missing = {}
+        for g in set(lost) - set(gained):
+            missing.setdefault(lost[g], []).append(g)
+        for x in xrange(self.nleaves):
+            if x not in keep and self.gene[x] in gained:
+                self.gene[x] = missing[self.specie[x]].pop()
+
+    def prune_regraft(self, other, j, target=None):
+        """Remove the leaves under node j of other and graft the subtree of j
+        on the edge above target (a random remaining node by default)"""
+        genes = set(other.leaf_genes(j))
+        freed = []
+        for leaf in xrange(self.nleaves):
+            if self.gene[leaf] in genes:
+                p = self.parent[leaf]
+                s = self.sibling(leaf)
+                self._attach(self.parent[p], p, s)
+                freed.extend((leaf, p))
+        if target is None:
+            remain = self.postorder()
+            target = remain[np.random.randint(len(remain))]
+        leafslots, intslots = self._split_slots(freed)
+        join = intslots.pop()
+        p = self.parent[target]
+        sub = self._copy_subtree(other, j, (leafslots, intslots), join, -1)
+        self._attach(p, target, join)
+        self.left[join], self.right[join] = sub, target
+        self.parent[target] = join
+        self.parent[sub] = join
+        self.gene[join] = self.specie[join] = -1
+        self.dist[join] = 1.0
+        return True
+
+    def species_signatures(self, table):
+        """Integer signature of the species labeled topology of the subtree of
+        each node. table maps a species or the sorted signatures of the two
+        children to their signature, it can be shared by several trees"""
+        sig = {}
+        for i in self.postorder():
+            if self.left[i] < 0:
+                key = self.species[self.specie[i]]
+            else:
+                key = tuple(sorted((sig[self.left[i]], sig[self.right[i]])))
+            sig[i] = table.setdefault(key, len(table))
+        return sig
+
+    def to_tree(self):
+        """Return the tree as a TreeClass, leaves have the feature 'species'"""
+        nodes = {}
+        for i in self.postorder():
+            node = TreeClass()
+            node.dist = self.dist[i]
+            if self.left[i] < 0:
+                node.name = self.genes[self.gene[i]]
+                node.add_features(species=self.species[self.specie[i]])
+            else:
+                node.add_child(nodes.pop(self.left[i]))
+                node.add_child(nodes.pop(self.right[i]))
+            nodes[i] = node
+        return nodes[self.root]
+
+    def write(self, dist=True):
+        """Newick of the tree (same as TreeClass.write with format 0 if dist, else 9)"""
+        nw = {}
+        for i in self.postorder():
+            if self.left[i] < 0:
+                nw[i] = self.genes[self.gene[i]]
+            else:
+                nw[i] = "(%s,%s)" % (nw.pop(self.left[i]), nw.pop(self.right[i]))
+            if dist and i != self.root:
+                nw[i] += ":%0.6g" % self.dist[i]
+        return nw[self.root] + ";"
+
+    def __len__(self):
+        return self.nleaves
@@ -5,6 +5,7 @@
 #
 
 from TreeClass import TreeClass
+from TreeIndex import TreeIndex
 import random
 from collections import defaultdict as ddict
 import logging
@@ -482,6 +483,7 @@ class SimulModel(object):
         # initialize gene tree
         sptree.compute_branches_length()
         sptree.label_internal_node()
+        spindex = TreeIndex(sptree, lca=False)
         removeloss = kwargs.get("removeloss", True)
         disallow_suc_trn = kwargs.get("disallow_suc_trn", True)
         leave_names = kwargs.get("names_library", [])
@@ -512,7 +514,7 @@ class SimulModel(object):
                     # get branches event for branch (snode, schild)
                     # during time = schild.dist
                     recnode, died, transfered, smap = self.sample_event_on_branches(schild.dist,
-                        schild, birth, death, gain, keeplosses=(not removeloss), ign_suc_trn=disallow_suc_trn, ecounter=true_event_counter)
+                        schild, birth, death, gain, keeplosses=(not removeloss), ign_suc_trn=disallow_suc_trn, ecounter=true_event_counter, spindex=spindex)
                     gnode.add_child(recnode)
                     # update ist of losses
                     losses.update(died)
@@ -563,8 +565,9 @@ class SimulModel(object):
         return gtree, recon, events, true_event_counter, transfers
 
 
-    def sample_event_on_branches(self, time, spnode, birth, death, transfer, gnode=None, keeplosses=False, ign_suc_trn=False, ecounter={}):
-        """Simulate a reconstructed birth death tree"""
+    def sample_event_on_branches(self, time, spnode, birth, death, transfer, gnode=None, keeplosses=False, ign_suc_trn=False, ecounter={}, spindex=None):
+        """Simulate a reconstructed birth death tree, spindex is the TreeIndex
+        of the species tree (built if not given)"""
         
         # we are going with a poisson process 
         # so the rate of having an event is
@@ -577,6 +580,8 @@ class SimulModel(object):
         if gnode is None:
             gnode = TreeClass()
             map_to_spec[gnode] = spnode
+        if spindex is None:
+            spindex = TreeIndex(spnode.get_tree_root(), lca=False)
 
         def event_in_time(time, node, spnode):
             # time for an event
@@ -616,7 +621,8 @@ class SimulModel(object):
                     died.add(node)
                 else:
                     # give gene to another species ==> transfer
-                    contemp_transfer_nodes =  list(spnode.get_incomparable_list(timeconsistent=True, wtime=next_t))
+                    contemp_transfer_nodes = [spindex.nodes[x] for x in spindex.incomparable(
+                        spindex.node2ind[spnode], timeconsistent=True, wtime=next_t)]
                     if contemp_transfer_nodes and not(ign_suc_trn and node.up and node.up.has_feature('type', name=TreeClass.TRANSFER)):
                         cand_receiver = random.choice(contemp_transfer_nodes)
                        
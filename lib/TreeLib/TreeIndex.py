@@ -0,0 +1,222 @@
+# This file is part of profileNJ
+#
+# TreeIndex is an array representation of a rooted tree, computed once
+# and used by the reconciliation algorithms instead of walking the TreeClass
+# nodes (species tree preprocessing)
+
+import numpy as np
+
+
+class TreeIndex(object):
+    """Array encoding of a rooted tree. Nodes are numbered in postorder, so
+    the subtree of node i is the index range [first[i], i]. The lca tables
+    are only computed if lca is True"""
+
+    def __init__(self, tree, lca=True):
+        self.tree = tree
+        # preorder visiting the children from the last one, the reverse of
+        # this order is the postorder. Filled as lists, since the element
+        # access of numpy arrays is slow
+        nodes = []
+        preparent = []
+        predepth = []
+        stack = [(tree, -1, 0)]
+        while stack:
+            node, p, d = stack.pop()
+            pos = len(nodes)
+            nodes.append(node)
+            preparent.append(p)
+            predepth.append(d)
+            for c in node.children:
+                stack.append((c, pos, d + 1))
+        n = len(nodes)
+        size = [1] * n
+        for pos in xrange(n - 1, 0, -1):
+            size[preparent[pos]] += size[pos]
+
+        nodes.reverse()
+        self.nodes = nodes
+        self.size = n
+        self.root = n - 1
+        self.node2ind = dict((node, i) for i, node in enumerate(nodes))
+        self.name2ind = dict((node.name, i) for i, node in enumerate(nodes))
+
+        # the subtree of node i (at preorder position n-1-i) is [i-size+1, i]
+        self.parent = n - 1 - np.array(preparent[::-1], dtype=int)
+        self.parent[self.root] = -1
+        self.first = np.arange(n) - np.array(size[::-1], dtype=int) + 1
+        self.nchild = np.bincount(self.parent[:-1], minlength=n)
+        self.is_leaf = (self.nchild == 0)
+        self.leaves = np.flatnonzero(self.is_leaf)
+        self.internals = np.flatnonzero(~self.is_leaf)
+        # the last child is just before its parent, the first child starts its subtree
+        self.child1 = np.empty(n, dtype=int)
+        self.child2 = np.empty(n, dtype=int)
+        self.child1.fill(-1)
+        self.child2.fill(-1)
+        self.child2[self.internals] = self.internals - 1
+        nonroot = np.arange(n - 1)
+        firstchild = nonroot[self.first[nonroot] == self.first[self.parent[nonroot]]]
+        self.child1[self.parent[firstchild]] = firstchild
+
+        # depth, and the node list of each depth level
+        self.depth = np.array(predepth[::-1], dtype=int)
+        bydepth = np.argsort(self.depth, kind='mergesort')
+        self.levels = np.split(bydepth, np.cumsum(np.bincount(self.depth))[:-1])
+
+        # sibling of each node in a binary tree
+        self.sibling = np.empty(n, dtype=int)
+        self.sibling.fill(-1)
+        binary = self.internals[self.nchild[self.internals] == 2]
+        self.sibling[self.child1[binary]] = self.child2[binary]
+        self.sibling[self.child2[binary]] = self.child1[binary]
+
+        self.brlen = None
+        if lca:
+            self._euler_preprocess()
+
+    def _euler_preprocess(self):
+        """Euler tour of the tree and sparse table of the tour depth, for
+        constant time lca queries (range minimum query)"""
+        tour = []
+        stack = [(self.root, 0)]
+        while stack:
+            i, k = stack.pop()
+            tour.append(i)
+            children = self.nodes[i].get_children()
+            if k < len(children):
+                stack.append((i, k + 1))
+                stack.append((self.node2ind[children[k]], 0))
+        self.euler = np.array(tour, dtype=np.int32)
+        self.euler_first = np.empty(self.size, dtype=np.int32)
+        self.euler_first.fill(-1)
+        for p, i in enumerate(tour):
+            if self.euler_first[i] < 0:
+                self.euler_first[i] = p
+
+        # sparse[k, p] is the position of the min depth node in euler[p:p+2**k]
+        m = len(tour)
+        nlog = max(1, int(np.floor(np.log2(m))) + 1)
+        sparse = np.zeros((nlog, m), dtype=np.int32)
+        sparse[0] = np.arange(m)
+        tdepth = self.depth[self.euler]
+        for k in xrange(1, nlog):
+            half = 1 << (k - 1)
+            left = sparse[k - 1, :m - half]
+            right = sparse[k - 1, half:]
+            sparse[k, :m - half] = np.where(tdepth[right] < tdepth[left], right, left)
+            sparse[k, m - half:] = sparse[k - 1, m - half:]
+        self.sparse = sparse
+
+    def lca(self, i, j):
+        """Return the index of the lca of nodes i and j"""
+        a, b = sorted((self.euler_first[i], self.euler_first[j]))
+        k = int(np.log2(b - a + 1))
+        left, right = self.sparse[k, a], self.sparse[k, b - (1 << k) + 1]
+        if self.depth[self.euler[right]] < self.depth[self.euler[left]]:
+            return self.euler[right]
+        return self.euler[left]
+
+    def encode_genetree(self, genetree):
+        """Integer encoding of a genetree (leaves should have the feature
+        'species'), in postorder: the parent array and the species index of
+        the leaves (-1 for the internal nodes)"""
+        gnodes = list(genetree.traverse("postorder"))
+        gmap = dict((gn, i) for i, gn in enumerate(gnodes))
+        parent = np.empty(len(gnodes), dtype=np.int32)
+        leafsp = np.empty(len(gnodes), dtype=np.int32)
+        leafsp.fill(-1)
+        parent[-1] = -1
+        for i, gn in enumerate(gnodes[:-1]):
+            parent[i] = gmap[gn.up]
+        for i, gn in enumerate(gnodes):
+            if gn.is_leaf():
+                leafsp[i] = self.name2ind[gn.species]
+        return parent, leafsp
+
+    def is_binary(self):
+        """Return True if all the internal nodes have two children"""
+        return np.all(self.nchild[self.internals] == 2)
+
+    def is_ancestor(self, i, j):
+        """Return True if node i is an ancestor of node j (or j itself)"""
+        return self.first[i] <= j <= i
+
+    def is_incomparable(self, i, j):
+        """Check if two nodes are incomparable (none is an ancestor of the other),
+        the root being comparable with every node"""
+        return not (self.is_ancestor(i, j) or self.is_ancestor(j, i))
+
+    def incomparable_slices(self, i):
+        """Return the (start, stop) index ranges of the nodes incomparable to
+        node i. In postorder, these are the nodes before the subtree of i, and
+        for each node c on the path from i to the root, the nodes between c
+        and its parent (the subtrees of the next siblings of c)"""
+        slices = []
+        if self.first[i] > 0:
+            slices.append((0, self.first[i]))
+        c = i
+        while self.parent[c] >= 0:
+            p = self.parent[c]
+            if p > c + 1:
+                slices.append((c + 1, p))
+            c = p
+        return slices
+
+    def incomparable(self, i, exclude_sis=False, timeconsistent=False, wtime=None):
+        """Return the index of the nodes incomparable to node i (same as
+        TreeClass.get_incomparable_list). With timeconsistent, only the nodes
+        whose branch contains the time brlen[i] - dist[i] + wtime are kept"""
+        slices = self.incomparable_slices(i)
+        if not slices:
+            return np.empty(0, dtype=int)
+        incomp = np.concatenate([np.arange(start, stop) for start, stop in slices])
+        if exclude_sis:
+            incomp = incomp[(self.parent[incomp] != self.parent[i]) | (incomp == i)]
+        if timeconsistent:
+            self._time_preprocess()
+            if not wtime:
+                wtime = self.dist[i]
+            tlen = self.brlen[i] - self.dist[i] + wtime
+            incomp = incomp[(self.brlen[incomp] >= tlen) & (self.uplen[incomp] <= tlen)]
+        return incomp
+
+    def _time_preprocess(self):
+        """Time interval [uplen, brlen] of the branch of each node (uplen is
+        the brlen of the parent), from the 'brlen' features of the tree
+        (computed if missing)"""
+        if self.brlen is not None:
+            return
+        if not self.tree.has_feature('brlen'):
+            self.tree.compute_branches_length()
+        self.brlen = np.array([node.brlen for node in self.nodes])
+        self.dist = np.array([node.dist for node in self.nodes])
+        self.uplen = self.brlen.copy()
+        self.uplen[:self.root] = self.brlen[self.parent[:self.root]]
+
+    def ancestors(self, i):
+        """Return the index of node i and of all its ancestors, up to the root"""
+        anc = []
+        while i >= 0:
+            anc.append(i)
+            i = self.parent[i]
+        return anc
+
+    def subtree_min(self, values):
+        """Return, for each node, the minimum of values in its subtree"""
+        sub = np.array(values, dtype=float)
+        for lvl in reversed(self.levels[1:]):
+            np.minimum.at(sub, self.parent[lvl], sub[lvl])
+        return sub
+
+    def incomparable_min(self, values):
+        """Return, for each node x, the minimum of values over the nodes
+        incomparable to x (np.inf if there is none). The tree should be binary.
+        The nodes incomparable to x are the subtrees of the siblings of x and
+        of its ancestors, so the minimum is propagated from the root"""
+        sub = self.subtree_min(values)
+        out = np.empty(self.size)
+        out[self.root] = np.inf
+        for lvl in self.levels[1:]:
+            out[lvl] = np.minimum(out[self.parent[lvl]], sub[self.sibling[lvl]])
+        return out
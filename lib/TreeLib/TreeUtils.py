@@ -17,6 +17,7 @@ import urllib2
 import numpy as np
 import random
 from TreeClass import TreeClass
+from TreeIndex import TreeIndex
 from collections import defaultdict as ddict
 from ete3 import Phyloxml, Tree
 from ete3 import orthoxml
@@ -126,6 +127,35 @@ class MatrixRep(object):
         for i, sn in enumerate(self.stree):
             print("%s: %.2f"%(sn.name, row[i]))
 
+
+class ReconWorkspace(object):
+    """Preallocated reconciliation tables, reused between calls (and between
+    the individuals of a run) instead of allocating them for each score.
+    Each named table is a contiguous buffer, grown when a call needs a
+    larger one, and is returned as a view of the requested shape"""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def reserve(self, name, shape, dtype=np.float):
+        """Allocate the buffer of table name for tables up to shape"""
+        size = int(np.prod(shape))
+        buf = self.buffers.get(name)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = np.empty(size, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+    def table(self, name, shape, defval=0, dtype=np.float):
+        """Return table name with this shape, filled with defval"""
+        size = int(np.prod(shape))
+        view = self.reserve(name, shape, dtype)[:size].reshape(shape)
+        view.fill(defval)
+        return view
+
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self.buffers.values())
+
     
 def fetch_ensembl_genetree_by_id(treeID=None, aligned=0, sequence="none", output="nh", nh_format="full"):
     """Fetch genetree from ensembl tree ID
@@ -590,58 +620,61 @@ return np.min(cost_table[genetree])
 def computeDTLScore(genetree, speciestree, Dc=1, Tc=1, Lc=1, flag=True, timeconsistent=False, timeframe=None):
     return np.min(computeDTLMat(genetree, speciestree, Dc, Tc, Lc, flag=flag, timeconsistent=timeconsistent, timeframe=timeframe))
 
-def computeDTLMat(genetree, speciestree, Dc=1, Tc=1, Lc=1, flag=True, timeconsistent=False, timeframe=None):
+def computeDTLMat(genetree, speciestree, Dc=1, Tc=1, Lc=1, flag=True, timeconsistent=False, timeframe=None, workspace=None):
     """Compute DTL cost for a genetree, given event cost and the 
-    corresponding species tree"""
-    if not speciestree.has_feature('lcaprocess', True):
-        speciestree.label_internal_node()
-        lcaPreprocess(speciestree)
-    leafMap = {}
-    for leaf in genetree:
-        if not leaf.has_feature('species'):
-            raise ValueError("You should set species before calling")
-        leafMap[leaf] = speciestree&leaf.species
-    
-    cost_table = MatrixRep(genetree, speciestree, np.inf)
-    spec_table = MatrixRep(genetree, speciestree, np.inf)
-    dup_table = MatrixRep(genetree, speciestree, np.inf)
-    trf_table = MatrixRep(genetree, speciestree, np.inf)
-    in_table = MatrixRep(genetree, speciestree, np.inf)
-    out_table = MatrixRep(genetree, speciestree, np.inf)
-    
-    for gleaf in genetree:
-        glsmap = leafMap[gleaf]
-        cost_table[gleaf, glsmap] = 0
-        comp_spec = glsmap
-        while comp_spec is not None:
-            in_table[gleaf, comp_spec] = Lc*(-comp_spec.depth + glsmap.depth) + cost_table[gleaf, glsmap] 
-            comp_spec =  comp_spec.up
+    corresponding species tree. The tables are indexed by the postorder
+    index of the nodes, and taken from workspace (a ReconWorkspace reused
+    between calls) if it is given"""
+    if workspace is None:
+        workspace = ReconWorkspace()
+    spindex = TreeIndex(speciestree, lca=False)
+    leafind = dict((spindex.nodes[s].name, s) for s in spindex.leaves)
+    gnodes = list(genetree.traverse("postorder"))
+    gind = dict((gn, i) for i, gn in enumerate(gnodes))
+    shape = (len(gnodes), spindex.size)
+    cost_table = workspace.table('cost', shape, np.inf)
+    spec_table = workspace.table('spec', shape, np.inf)
+    dup_table = workspace.table('dup', shape, np.inf)
+    trf_table = workspace.table('trf', shape, np.inf)
+    in_table = workspace.table('in', shape, np.inf)
+    out_table = workspace.table('out', shape, np.inf)
+    # incomparable species nodes of each species node, computed once
+    incomparables = [spindex.incomparable(s, timeconsistent=timeconsistent, wtime=timeframe) for s in xrange(spindex.size)]
+    depth = spindex.depth
+    sproot = spindex.root
 
-        for snode_inc in glsmap.get_incomparable_list(timeconsistent=timeconsistent, wtime=timeframe):
-            out_table[gleaf, snode_inc] = cost_table[gleaf, glsmap]
+    for gleaf in genetree:
+        if not gleaf.has_feature('species'):
+            raise ValueError("You should set species before calling")
+        g = gind[gleaf]
+        glsmap = leafind[gleaf.species]
+        cost_table[g, glsmap] = 0
+        anc = spindex.ancestors(glsmap)
+        in_table[g, anc] = Lc*(-depth[anc] + depth[glsmap]) + cost_table[g, glsmap]
+        out_table[g, incomparables[glsmap]] = cost_table[g, glsmap]
 
     for gnode in genetree.iter_internal_node(strategy="postorder", enable_root=True):
-        for snode in speciestree.traverse("postorder"):
-
-            gchild1, gchild2 = gnode.get_children()
-            if snode.is_leaf():
-                spec_table[gnode, snode] = np.inf
-                dup_table[gnode, snode] = Dc + cost_table[gchild1, snode] + cost_table[gchild2, snode]
+        g = gind[gnode]
+        gchild1, gchild2 = [gind[c] for c in gnode.get_children()]
+        for snode in xrange(spindex.size):
+            if spindex.is_leaf[snode]:
+                spec_table[g, snode] = np.inf
+                dup_table[g, snode] = Dc + cost_table[gchild1, snode] + cost_table[gchild2, snode]
                 # because we can't have transfer at root
-                if not snode.is_root():
+                if snode != sproot:
                     # one child is incomparable and the second
-                    trf_table[gnode, snode] = Tc + min(in_table[gchild1, snode]+out_table[gchild2, snode], in_table[gchild2, snode] + out_table[gchild1, snode])
+                    trf_table[g, snode] = Tc + min(in_table[gchild1, snode]+out_table[gchild2, snode], in_table[gchild2, snode] + out_table[gchild1, snode])
                 
-                cost_table[gnode, snode] = min(
-                    spec_table[gnode, snode], 
-                    dup_table[gnode,snode], 
-                    trf_table[gnode, snode]
+                cost_table[g, snode] = min(
+                    spec_table[g, snode], 
+                    dup_table[g, snode], 
+                    trf_table[g, snode]
                     )
-                in_table[gnode, snode] = cost_table[gnode, snode]
+                in_table[g, snode] = cost_table[g, snode]
                 
             else:
-                schild1, schild2 = snode.get_children()
-                spec_table[gnode, snode] =  min(
+                schild1, schild2 = spindex.child1[snode], spindex.child2[snode]
+                spec_table[g, snode] =  min(
                     in_table[gchild1, schild1] + in_table[gchild2, schild2], 
                     in_table[gchild1, schild2] + in_table[gchild2, schild1]
                     )
@@ -662,28 +695,180 @@ def computeDTLMat(genetree, speciestree, Dc=1, Tc=1, Lc=1, flag=True, timeconsis
                 else: 
                     dcost_g_s = in_table[gchild1, snode] + in_table[gchild2, snode]
                 
-                dup_table[gnode, snode] = Dc + dcost_g_s
-                if not snode.is_root():
-                    trf_table[gnode, snode] = Tc + min(
+                dup_table[g, snode] = Dc + dcost_g_s
+                if snode != sproot:
+                    trf_table[g, snode] = Tc + min(
                         in_table[gchild1, snode]+out_table[gchild2, snode], 
                         in_table[gchild2, snode] + out_table[gchild1, snode]
                         )
 
-                cost_table[gnode, snode] = min(
-                    spec_table[gnode, snode],
-                    dup_table[gnode, snode],
-                    trf_table[gnode, snode]
+                cost_table[g, snode] = min(
+                    spec_table[g, snode],
+                    dup_table[g, snode],
+                    trf_table[g, snode]
                 )
                 
-                in_table[gnode, snode] = cost_table[gnode, snode]
-                #for snode_desc in snode.get_children():
-                #    in_table[gnode, snode] = min(in_table[gnode, snode], cost_table[gnode, snode_desc] + Lc*(-snode_desc.depth + snode.depth))
+                in_table[g, snode] = cost_table[g, snode]
                     
-            if not snode.is_root():
-                for snode_inc in snode.get_incomparable_list(timeconsistent=timeconsistent, wtime=timeframe):
-                    out_table[gnode, snode_inc] = min(out_table[gnode, snode_inc], cost_table[gnode, snode])
+            if snode != sproot:
+                inc = incomparables[snode]
+                out_table[g, inc] = np.minimum(out_table[g, inc], cost_table[g, snode])
+
+    # the tables are reused by the next call
+    return cost_table[gind[genetree]].copy()
+
+
+def computeDTLArrayScore(genetree, spindex, Dc=1, Tc=1, Lc=1, flag=True):
+    return np.min(computeDTLArray(genetree, spindex, Dc, Tc, Lc, flag=flag))
+
+def computeDTLArray(genetree, spindex, Dc=1, Tc=1, Lc=1, flag=True):
+    """Compute DTL cost for a genetree, given event cost and the TreeIndex
+    of the species tree. Same costs as computeDTLMat (without time consistency),
+    but each row of the cost, in and out tables is filled at once with numpy
+    operations. Return the cost row of the genetree root, in the postorder
+    of the species tree"""
+    if not spindex.is_binary():
+        raise ValueError("The species tree should be binary")
+    rows = {}
+    leafrows = {}
+    for gnode in genetree.traverse("postorder"):
+        if gnode.is_leaf():
+            if not gnode.has_feature('species'):
+                raise ValueError("You should set species before calling")
+            s = spindex.name2ind[gnode.species]
+            if s not in leafrows:
+                leafrows[s] = _dtlLeafRows(spindex, s, Lc)
+            rows[gnode] = leafrows[s]
+        else:
+            gchild1, gchild2 = gnode.get_children()
+            rows[gnode] = _dtlNodeRows(spindex, rows[gchild1], rows[gchild2], Dc, Tc, Lc, flag)
+
+    return rows[genetree][0]
+
+
+def _dtlLeafRows(spindex, s, Lc):
+    """Cost, in and out rows of a gene leaf of species s"""
+    cost = np.empty(spindex.size)
+    cost.fill(np.inf)
+    cost[s] = 0
+    inrow = np.empty(spindex.size)
+    inrow.fill(np.inf)
+    anc = spindex.ancestors(s)
+    inrow[anc] = Lc*(-spindex.depth[anc] + spindex.depth[s]) + cost[s]
+    return cost, inrow, spindex.incomparable_min(cost)
+
+
+def _dtlNodeRows(spindex, rows1, rows2, Dc, Tc, Lc, flag):
+    """Cost, in and out rows of an internal gene node from the rows of its children"""
+    nsp = spindex.size
+    sint = spindex.internals
+    schild1 = spindex.child1[sint]
+    schild2 = spindex.child2[sint]
+    cost1, in1, out1 = rows1
+    cost2, in2, out2 = rows2
+
+    # speciation, only at internal species nodes
+    spec = np.empty(nsp)
+    spec.fill(np.inf)
+    spec[sint] = np.minimum(in1[schild1] + in2[schild2], in1[schild2] + in2[schild1])
+
+    # duplication, the species leaves only allow both children to map to it
+    dup = Dc + cost1 + cost2
+    if flag:
+        c1, c2 = cost1[sint], cost2[sint]
+        i11, i12, i21, i22 = in1[schild1], in1[schild2], in2[schild1], in2[schild2]
+        dcost = np.minimum.reduce([
+            c1 + i21 + Lc, # loss in one child
+            c1 + i22 + Lc,
+            c2 + i11 + Lc,
+            c2 + i12 + Lc,
+            c2 + c1, #both map to snode
+            i11 + i21 + 2*Lc, #both map to descendant of snode
+            i11 + i22 + 2*Lc,
+            i12 + i22 + 2*Lc,
+            i12 + i21 + 2*Lc,
+        ])
+    else:
+        dcost = in1[sint] + in2[sint]
+    dup[sint] = Dc + dcost
+
+    # transfer, one child is incomparable. No transfer at the root
+    trf = Tc + np.minimum(in1 + out2, in2 + out1)
+    trf[spindex.root] = np.inf
+
+    cost = np.minimum(np.minimum(spec, dup), trf)
+    return cost, cost, spindex.incomparable_min(cost)
+
+
+def computeDTLArrayInc(genetree, spindex, Dc=1, Tc=1, Lc=1, flag=True, feature='dtlrows'):
+    """Same as computeDTLArray, but the rows of each node are kept in a node
+    feature and only the invalid rows are recomputed. The rows of a node are
+    valid if they were computed with the same costs, from the current rows of
+    its current children. Functions modifying the tree under a node should
+    call invalidateRows on it, since its ancestors can't detect the change"""
+    if not spindex.is_binary():
+        raise ValueError("The species tree should be binary")
+    key = (Dc, Tc, Lc, flag)
+    leafrows = {}
+    stack = [(genetree, False)]
+    while stack:
+        gnode, expanded = stack.pop()
+        if not expanded:
+            if _validRows(gnode, key, feature):
+                continue
+            stack.append((gnode, True))
+            stack.extend((c, False) for c in gnode.get_children())
+        elif gnode.is_leaf():
+            if not gnode.has_feature('species'):
+                raise ValueError("You should set species before calling")
+            s = spindex.name2ind[gnode.species]
+            if s not in leafrows:
+                leafrows[s] = (key + (gnode.species,), (), _dtlLeafRows(spindex, s, Lc))
+            gnode.add_feature(feature, leafrows[s])
+        else:
+            gchild1, gchild2 = gnode.get_children()
+            entry1, entry2 = getattr(gchild1, feature), getattr(gchild2, feature)
+            rows = _dtlNodeRows(spindex, entry1[2], entry2[2], Dc, Tc, Lc, flag)
+            gnode.add_feature(feature, (key, (entry1, entry2), rows))
+
+    return getattr(genetree, feature)[2][0]
 
-    return cost_table[genetree]
+
+def _validRows(gnode, key, feature):
+    """Check the rows entry (key, children entries, rows) of a node"""
+    entry = getattr(gnode, feature, None)
+    if entry is None:
+        return False
+    children = gnode.get_children()
+    if not children:
+        return entry[0] == key + (getattr(gnode, 'species', None),)
+    # the rows are symmetric in the children, their order is not checked
+    return entry[0] == key and _sameEntries(children, entry[1], feature)
+
+
+def _sameEntries(children, entries, feature):
+    return sorted(id(getattr(c, feature, None)) for c in children) == sorted(id(e) for e in entries)
+
+
+def invalidateRows(node, feature='dtlrows'):
+    """Remove the rows entry of node and of all its ancestors"""
+    while node is not None:
+        if node.has_feature(feature):
+            node.del_feature(feature)
+        node = node.up
+
+
+def invalidateChangedRows(tree, feature='dtlrows'):
+    """Invalidate the rows on the path to the root of the nodes whose children
+    changed since their rows were computed (when the modified nodes are not
+    known, e.g. after a rerooting)"""
+    changed = []
+    for node in tree.traverse("postorder"):
+        entry = getattr(node, feature, None)
+        if entry is not None and entry[1] and not _sameEntries(node.children, entry[1], feature):
+            changed.append(node)
+    for node in changed:
+        invalidateRows(node, feature)
 
 
 def computeDL(genetree, lcaMap=None):
@@ -961,6 +1146,19 @@ def treeHash(tree, addinfos=''):
     return hashlib.sha384(newick_str + addinfos).hexdigest()
 
 
+def canonicalTreeHash(tree, attr="name", addinfos=''):
+    """Hashing the labeled rooted topology of the tree. Children are sorted
+    at every internal node, so the hash does not depend on the children
+    order nor on the branch lengths"""
+    canon = {}
+    for node in tree.traverse("postorder"):
+        if node.is_leaf():
+            canon[node] = str(getattr(node, attr))
+        else:
+            canon[node] = "(" + ",".join(sorted(canon.pop(c) for c in node.children)) + ")"
+    return hashlib.sha384(canon[tree] + addinfos).hexdigest()
+
+
 def newickPreprocessing(newick, gene_sep=None):
     """Newick format pre-processing in order to assure its correctness"""
     DEF_SEP_LIST = [';;', '-', '|', '%', ':', ';', '+', '/']
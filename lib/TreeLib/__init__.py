@@ -1,5 +1,7 @@
 from TreeClass import TreeClass
+from TreeIndex import TreeIndex
+from ArrayTree import ArrayTree
 import TreeUtils, ClusterUtils, SimulModel, TreeFun
 from memorize import memorize
 import params
-__all__= ["TreeUtils", "ClusterUtils", "TreeClass", "memorize", "params", 'SimulModel', 'TreeFun']
+__all__= ["TreeUtils", "ClusterUtils", "TreeClass", "TreeIndex", "ArrayTree", "memorize", "params", 'SimulModel', 'TreeFun']
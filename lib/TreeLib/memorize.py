@@ -1,55 +1,214 @@
-from collections import Hashable as hashable
+from collections import Hashable as hashable, OrderedDict
 from functools import partial
-import shelve
+import cPickle as pickle
+import hashlib
+import numpy as np
+import atexit
 import os
+import shutil
+import sys
+import tempfile
+
+
+def sizeof(value):
+	"""Approximate memory size of a cached value, numpy arrays
+	are counted with their data"""
+	if isinstance(value, np.ndarray):
+		# getsizeof counts the data of the arrays owning it (recent numpy)
+		return max(value.nbytes, sys.getsizeof(value))
+	elif isinstance(value, (tuple, list)):
+		return sys.getsizeof(value) + sum(sizeof(x) for x in value)
+	elif isinstance(value, dict):
+		return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.iteritems())
+	return sys.getsizeof(value)
+
+
+class LRUCache(object):
+	"""In memory cache keeping the most recently used values,
+	up to maxbytes (approximated with sizeof)"""
+	def __init__(self, maxbytes=512*1024**2):
+		self.maxbytes = maxbytes
+		self.data = OrderedDict()
+		self.nbytes = 0
+
+	def get(self, key):
+		"""Return the value of key, raise KeyError if it's not cached"""
+		value, size = self.data.pop(key)
+		self.data[key] = (value, size)
+		return value
+
+	def set(self, key, value):
+		"""Cache value and return the list of (key, value) evicted to make room"""
+		self.discard(key)
+		size = sizeof(value)
+		if size > self.maxbytes:
+			return [(key, value)]
+		self.data[key] = (value, size)
+		self.nbytes += size
+		return self.resize(self.maxbytes)
+
+	def resize(self, maxbytes):
+		"""Change the memory limit, and return the evicted (key, value)"""
+		self.maxbytes = maxbytes
+		evicted = []
+		while self.nbytes > self.maxbytes:
+			okey, (ovalue, osize) = self.data.popitem(last=False)
+			self.nbytes -= osize
+			evicted.append((okey, ovalue))
+		return evicted
+
+	def discard(self, key):
+		if key in self.data:
+			self.nbytes -= self.data.pop(key)[1]
+
+	def clear(self):
+		self.data.clear()
+		self.nbytes = 0
+
+	def __len__(self):
+		return len(self.data)
+
+
+class DiskCache(object):
+	"""Disk cache of a run, in the directory dirname. Numpy arrays (alone or
+	in a tuple/list) are saved as .npy files and loaded with mmap, other
+	values are pickled. Without dirname, the cache is in a new temporary
+	directory, removed by close"""
+	def __init__(self, dirname=None):
+		self.temporary = dirname is None
+		if self.temporary:
+			dirname = tempfile.mkdtemp(prefix="memorize_")
+		elif not os.path.exists(dirname):
+			os.makedirs(dirname)
+		self.dirname = dirname
+		self.pid = os.getpid()
+
+	def close(self):
+		"""Remove the temporary directory, only in the process that created it"""
+		if self.temporary and self.pid == os.getpid():
+			shutil.rmtree(self.dirname, ignore_errors=True)
+			self.temporary = False
+
+	def _path(self, key, ext):
+		return os.path.join(self.dirname, hashlib.sha1(repr(key)).hexdigest() + ext)
+
+	def _write(self, path, writer):
+		# write then rename, so other processes of the run never read a partial file
+		fd, tmp = tempfile.mkstemp(dir=self.dirname)
+		with os.fdopen(fd, 'wb') as handle:
+			writer(handle)
+		os.rename(tmp, path)
+
+	def get(self, key):
+		"""Return the value of key, raise KeyError if it's not cached"""
+		path = self._path(key, ".pkl")
+		if not os.path.exists(path):
+			raise KeyError(key)
+		with open(path, 'rb') as handle:
+			value = pickle.load(handle)
+		if isinstance(value, tuple) and value and value[0] == '__npy__':
+			arrays = [np.load(self._path((key, i), ".npy"), mmap_mode='r') for i in xrange(value[2])]
+			return arrays[0] if value[1] == 'array' else value[1](arrays)
+		return value
+
+	def set(self, key, value):
+		if isinstance(value, np.ndarray):
+			value, kind = [value], 'array'
+		elif isinstance(value, (tuple, list)) and value and all(isinstance(x, np.ndarray) for x in value):
+			kind = type(value)
+		else:
+			self._write(self._path(key, ".pkl"), partial(pickle.dump, value, protocol=2))
+			return
+		for i, arr in enumerate(value):
+			self._write(self._path((key, i), ".npy"), partial(np.save, arr=arr))
+		self._write(self._path(key, ".pkl"), partial(pickle.dump, ('__npy__', kind, len(value)), protocol=2))
 
-cur_dir = ".memorize/"
-try :
-	if not os.path.exists(cur_dir):
-		os.makedirs(cur_dir)
-except:
-	cur_dir = ""
-filename = os.path.join(cur_dir, "memo")
 
 class memorize(object):
 	"""Cache function output when it's called and return it
 	later when the same function is called with the same input,
-	in this case, memorize use a hash to determine value to reevalute
+	in this case, memorize use a hash to determine value to reevalute.
+	The values are kept in an in memory LRU cache, and also written to the
+	optional disk cache of the run (see configure), shared by its processes
 	"""
+	instances = []
+	maxbytes = 512*1024**2
+	diskcache = None
+
 	def __init__(self, function):
-		self.function=function
-		self.cache=shelve.open(filename)
+		self.function = function
+		self.cache = LRUCache(memorize.maxbytes)
+		self.hits = 0
+		self.diskhits = 0
+		self.misses = 0
+		self.evictions = 0
+		memorize.instances.append(self)
+
+	@classmethod
+	def configure(clc, maxbytes=None, diskdir=None, disk=False):
+		"""Set the memory limit of each cache, and enable the disk cache
+		(in diskdir, or in a new temporary directory)"""
+		if maxbytes is not None:
+			clc.maxbytes = maxbytes
+			for inst in clc.instances:
+				inst.evictions += len(inst.cache.resize(maxbytes))
+		if disk or diskdir:
+			clc.close()
+			clc.diskcache = DiskCache(diskdir)
+
+	@classmethod
+	def close(clc):
+		"""Disable the disk cache, its temporary directory is removed"""
+		if clc.diskcache is not None:
+			clc.diskcache.close()
+			clc.diskcache = None
+
+	@classmethod
+	def stats(clc):
+		"""Return the hits, disk hits, misses and evictions of each memorized function"""
+		return dict((inst.function.__name__, (inst.hits, inst.diskhits, inst.misses, inst.evictions)) for inst in clc.instances)
 
 	def __call__(self, hashrep, *args, **kwargs):
 		"""Call to memorize, (as decorator)"""
 
-		if self.cache.has_key(hashrep):
-			return self.cache[hashrep]
-
-		elif not isinstance(hashrep, hashable) or hashrep is None:
+		if hashrep is None or not isinstance(hashrep, hashable):
 			#hashrep is None or uncachable
 			return self.function(*args, **kwargs)
 
-		else:
-			output = self.function(*args, **kwargs)
-			self.cache[hashrep]=output
+		try:
+			output = self.cache.get(hashrep)
+			self.hits += 1
 			return output
+		except KeyError:
+			pass
 
-	def __repr__(self):
-		"""Return cached data"""
-		for hashrep, data in self.cache:
-			print hashrep, '=============>\n', data
+		if memorize.diskcache is not None:
+			try:
+				output = memorize.diskcache.get(hashrep)
+				self.diskhits += 1
+				self.evictions += len(self.cache.set(hashrep, output))
+				return output
+			except KeyError:
+				pass
 
+		self.misses += 1
+		output = self.function(*args, **kwargs)
+		self.evictions += len(self.cache.set(hashrep, output))
+		if memorize.diskcache is not None:
+			memorize.diskcache.set(hashrep, output)
+		return output
 
-	def __exit__(self):
-		try:
-			self.cache.close()
-		except:
-			pass
+	def clear(self):
+		self.cache.clear()
 
-	def __del__(self):
-		self.__exit__()
+	def __repr__(self):
+		"""Return cache statistics"""
+		return "%s: %d values (%d bytes), %d hits, %d disk hits, %d misses, %d evictions" % (
+			self.function.__name__, len(self.cache), self.cache.nbytes, self.hits, self.diskhits, self.misses, self.evictions)
 
 	def __get__(self, obj, objtype):
 		"""Instance methods support"""
 		return partial(self.__call__,obj )
+
+
+atexit.register(memorize.close)
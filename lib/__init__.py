@@ -1,6 +1,6 @@
-from ga import GPolySolver, Utils, DTLParams, ReconParams, EdgeParams
-from raxmlib import RAxMLModel, LklModel
+from ga import GPolySolver, GArraySolver, Utils, DTLParams, ReconParams, EdgeParams
+from raxmlib import RAxMLModel, LklModel, NumpyModel
 from TreeLib import TreeClass, TreeUtils, params
 from PolytomySolver import solvePolytomy
 
-__all__ = ["EdgeParams", "ReconParams", "DTLParams", "TreeClass", 'TreeUtils', "GPolySolver", "Utils", "RAxMLModel", "LklModel", "params", "solvePolytomy"]
\ No newline at end of file
+__all__ = ["EdgeParams", "ReconParams", "DTLParams", "TreeClass", 'TreeUtils', "GPolySolver", "GArraySolver", "Utils", "RAxMLModel", "LklModel", "NumpyModel", "params", "solvePolytomy"]
\ No newline at end of file
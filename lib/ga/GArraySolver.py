@@ -0,0 +1,204 @@
+from .evolve.GenomeBase import GenomeBase
+from GPolySolver import GPolySolver
+from ..TreeLib import TreeClass, ArrayTree
+import numpy as np
+
+
+class ArrayUtils:
+    """Genetic operators of GArraySolver, working on the ArrayTree of the
+    genomes instead of their TreeClass"""
+
+    @staticmethod
+    def permute_seq(genome, spec):
+        atree = genome.get_atree()
+        try:
+            specind = atree.species.index(spec)
+        except ValueError:
+            return
+        leaves = np.flatnonzero(atree.specie[:atree.nleaves] == specind)
+        if len(leaves) > 1:
+            n1, n2 = np.random.choice(leaves, 2, replace=False)
+            atree.permute_genes(n1, n2)
+            genome.touch()
+
+    @staticmethod
+    def performSPR(genome):
+        if genome.get_atree().random_spr():
+            genome.touch()
+            genome.set_done_transfer()
+        return genome
+
+    @staticmethod
+    def reroot(genome):
+        if genome.get_atree().random_reroot():
+            genome.touch()
+        return genome
+
+    @staticmethod
+    def mutate(genome, **args):
+        n_mutation = 0
+        nspec = genome.get_spec_len()
+        av_mutation = args["pmut"]*nspec
+        engine = args["ga_engine"]
+        spec_list = genome.spcount.keys()
+        if engine.getParam('fastconv', False) and av_mutation > 1.0:
+            for i in range(int(np.ceil(av_mutation))):
+                if np.random.rand() > 0.5:
+                    spec = np.random.choice(spec_list)
+                    ArrayUtils.permute_seq(genome, spec)
+                else:
+                    ArrayUtils.performSPR(genome)
+                n_mutation += 1
+
+        else:
+            probmut = np.random.rand()
+            if probmut <= args['pmut']:
+                if genome.reconcile:
+                    # choose between SPR, reroot, edge and dlt
+                    selection = engine.recparam.select_event(genome)
+                    if selection == 'ROOT':
+                        ArrayUtils.reroot(genome)
+                    elif selection == 'DTL':
+                        genome.dtlrates.mutate()
+                    elif selection == "EDGE":
+                        genome.erates.mutate()
+                    else:
+                        ArrayUtils.performSPR(genome)
+                else:
+                    spec = np.random.choice(spec_list)
+                    ArrayUtils.permute_seq(genome, spec)
+                n_mutation += 1
+
+        return n_mutation
+
+    @staticmethod
+    def crossover(obj, **args):
+        if args['mom'].reconcile:
+            return ArrayUtils.no_recon_crossover(args['dad'], args['mom'])
+        else:
+            return ArrayUtils.cost_preserve_crossover(args['dad'], args['mom'])
+
+    @staticmethod
+    def _random_clade(atree):
+        j = np.random.randint(len(atree.parent))
+        while j == atree.root:
+            j = np.random.randint(len(atree.parent))
+        return j
+
+    @staticmethod
+    def no_recon_crossover(gdad, gmom):
+        # each child receives a random clade of the other parent
+        gchild1 = gdad.clone()
+        gchild2 = gmom.clone()
+        tree1, tree2 = gchild1.get_atree(), gchild2.get_atree()
+        tmp1, tmp2 = tree1.copy(), tree2.copy()
+        tree2.prune_regraft(tmp1, ArrayUtils._random_clade(tmp1))
+        tree1.prune_regraft(tmp2, ArrayUtils._random_clade(tmp2))
+        gchild1.touch()
+        gchild2.touch()
+        return gchild1, gchild2
+
+    @staticmethod
+    def cost_preserve_crossover(gdad, gmom):
+        # swap two clades with the same species labeled topology,
+        # their parent should not be the root
+        genome1 = gdad.clone()
+        genome2 = gmom.clone()
+        prob = max(genome1.intbrnp, genome2.intbrnp)
+        tree1, tree2 = genome1.get_atree(), genome2.get_atree()
+        table = {}
+        sig1, sig2 = tree1.species_signatures(table), tree2.species_signatures(table)
+        cands = {}
+        for gind, atree, sig in [(0, tree1, sig1), (1, tree2, sig2)]:
+            for i, s in sig.items():
+                if i != atree.root and atree.parent[i] != atree.root:
+                    cands.setdefault(s, ([], []))[gind].append(i)
+        candidates = []
+        for s, (nodes1, nodes2) in cands.items():
+            if nodes1 and nodes2:
+                candidates.append((1 - tree1.is_leaf(nodes1[0]), nodes1[0], nodes2[0]))
+        if not candidates:
+            return genome1, genome2
+        internal_or_leaf = np.random.choice([1, 0], p=[prob, 1-prob])
+        new_cands = [x for x in candidates if x[0] == internal_or_leaf] or candidates
+        _, i, j = new_cands[np.random.randint(len(new_cands))]
+        tree1.swap_subtree(i, tree2, j)
+        genome1.touch()
+        genome2.touch()
+        return genome1, genome2
+
+
+class GArraySolver(GPolySolver):
+    """GPolySolver genome storing its tree as an ArrayTree. The TreeClass tree
+    is only built when it is accessed (evaluation and output), and the
+    genetic operators work on the arrays"""
+
+    genes = []
+    species = []
+
+    def __init__(self, tree, model, dtlrates, erates, intbrnp=0.95, gmap={}, is_init=False):
+        self.atree = None
+        self._tree = None
+        GPolySolver.__init__(self, tree, model, dtlrates, erates, intbrnp=intbrnp, gmap=gmap, is_init=is_init)
+        self.mutator.set(ArrayUtils.mutate)
+        self.crossover.set(ArrayUtils.crossover)
+
+    @classmethod
+    def setGeneMap(clc, val):
+        GPolySolver.setGeneMap(val)
+        clc.species = sorted(clc.gmap.keys())
+        clc.genes = sorted(clc.reversemap.keys())
+
+    def _get_tree(self):
+        if self._tree is None and self.atree is not None:
+            self._tree = self.atree.to_tree()
+        return self._tree
+
+    def _set_tree(self, tree):
+        self._tree = tree
+        self.atree = None
+
+    tree = property(_get_tree, _set_tree)
+
+    def get_atree(self):
+        """Return the ArrayTree of the genome, built from its tree if needed"""
+        if self.atree is None:
+            self.set_species()
+            self.atree = ArrayTree.from_tree(self._tree, self.genes, self.species)
+        return self.atree
+
+    def touch(self):
+        """Called after a change of the ArrayTree, the tree will be rebuilt"""
+        self._tree = None
+
+    def copy(self, g):
+        """ Copy the current genome to 'g', only the arrays are copied """
+        GenomeBase.copy(self, g)
+        g.atree = self.get_atree().copy()
+        g._tree = None
+        g.dtlrates = self.dtlrates.clone()
+        g.erates = self.erates.clone()
+        g.spcount = self.spcount
+        g.intbrnp = self.intbrnp
+        g.model = self.model
+        g.is_init = self.is_init
+        g._done_transfer = False
+
+    def clone(self):
+        """ Clone this genome """
+        newcopy = GArraySolver(None, None, None, None)
+        self.copy(newcopy)
+        return newcopy
+
+    def encode(self):
+        """Compact representation of the genome (newick and rates)"""
+        if self._tree is None and self.atree is not None:
+            return self.atree.write(), self.dtlrates, self.erates
+        return GPolySolver.encode(self)
+
+    def decode(self, code):
+        """Build a genome from the output of encode, sharing this genome model"""
+        newick, dtlrates, erates = code
+        g = GArraySolver(TreeClass(newick), self.model, dtlrates, erates, intbrnp=self.intbrnp, is_init=True)
+        g.set_species()
+        return g
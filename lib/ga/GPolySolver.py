@@ -3,45 +3,12 @@ from collections import Counter, defaultdict as ddict
 import numpy as np
 import random
 import math
-import hashlib
 from functools import partial
 from itertools import permutations, product
-from ..TreeLib import TreeClass, TreeUtils
+from ..TreeLib import TreeClass, TreeUtils, TreeIndex
 from heapq import heappushpop, heappush
 
 
-class BranchRep:
-    # BranchRep(node, partition, isinternal)
-    def __init__(self, node, partition, nodetype):
-        self.node = node
-        self.node.sort_descendants(attr="species")
-
-        self.in_node, self.out_node = partition
-        self.part1 = [x.species for x in self.in_node]
-        self.part2 = [x.species for x in self.out_node]        
-        self.nodetype =  nodetype
-    
-    def get_hash(self, partition):
-        return hashlib.sha384(",".join(sorted(partition))).hexdigest()
-
-    def _get_spec_nw(self):
-        new_t = self.node.copy()
-        for node in new_t:
-            node.name = node.species
-        return new_t.write(format=9)
-
-    def __hash__(self):
-        hashp = self.get_hash(self.part1) + self.get_hash(self.part2)
-        return hash(hashlib.sha384(self._get_spec_nw()).hexdigest() + hashp)
-    
-
-    def __eq__(self, other):
-        same_hash = self.__hash__() == other.__hash__()
-        p1 = (sorted(self.part1), sorted(self.part2))
-        p2 = (sorted(other.part1), sorted(other.part2))
-        return same_hash and self.nodetype == other.nodetype and (p1 == p2 or p1 == p2[::-1])
-
-
 class Utils:
     
     @staticmethod
@@ -54,6 +21,7 @@ class Utils:
     @staticmethod
     def reroot(genome):
         genome.tree = next(genome.tree.edge_reroot())
+        TreeUtils.invalidateChangedRows(genome.tree)
         return genome
     
     @staticmethod
@@ -131,12 +99,20 @@ class Utils:
     
 
     @staticmethod
-    def iter_partition(tree):
-        for node in tree.iter_descendants("levelorder"):
-            leafset1 = set(node.get_leaves())
-            leafset2 = set(tree.get_leaves()) - leafset1
-            if(not node.up.is_root()):
-                yield node, (leafset1, leafset2), 1-node.is_leaf()
+    def clade_signatures(tree, table):
+        """Integer signature of the species labeled topology of the subtree
+        of each node, computed in one postorder pass. table maps a species
+        or the sorted signatures of the children to their signature, nodes
+        of trees sharing it have the same signature if their subtrees have
+        the same unordered topology and leaf species"""
+        sig = {}
+        for node in tree.traverse("postorder"):
+            if node.is_leaf():
+                key = node.species
+            else:
+                key = tuple(sorted(sig[c] for c in node.children))
+            sig[node] = table.setdefault(key, len(table))
+        return sig
 
 
     @staticmethod
@@ -144,7 +120,7 @@ class Utils:
         # this is the probability of choosing 
         # internal branch over leaves
         internal_or_leaf = np.random.choice([1,0], p=[prob, 1-prob])
-        new_cands = [x for x in candbranches if x[0].nodetype == internal_or_leaf]
+        new_cands = [x for x in candbranches if x[0] == internal_or_leaf]
         # if it's empty, then the list only contains compatible leaves
         # in that case, just selected a random branch
         if not new_cands:
@@ -155,20 +131,11 @@ class Utils:
 
     @staticmethod
     def find_and_swap(br, g1, g2):
-        branch, nodelist = br
-        g1_list = []
-        g2_list = []
-        for x  in nodelist:
-            if x[-1] == 0:
-                g1_list.append(x[0])
-            else:
-                g2_list.append(x[0])
-        #print g1_list
-        #print g2_list
-        g1swap = g1_list[0]
-        g2swap = g2_list[0]
+        _, g1swap, g2swap = br
         g1_parent = g1swap.up
         g2_parent = g2swap.up
+        TreeUtils.invalidateRows(g1_parent)
+        TreeUtils.invalidateRows(g2_parent)
 
         # fix problem due to same name multiple time
 
@@ -213,27 +180,14 @@ class Utils:
             n1.name, n2.name = n2.name, n1.name            
          
 
-    @staticmethod
-    def branch_is_valid(branch, gholder):
-        # branch should be present at both genome
-        # parent trees
-        gholder_type = set([x[-1] for x in gholder])
-        if len(gholder_type) < 2:
-            return False
-        else:
-            # branch should have the same count of leaves of same 
-            # species under it
-            # counter for species count at leaves
-            ln = [Counter([leaf.species for leaf in v[0]]) for v in gholder]
-            return all(x==ln[0] for x in ln)
-        
-
     @staticmethod
     def get_candtransfer_branches(genome):
 
-        candlist = genome.tree.get_descendants()
-        cand =  random.choice(candlist)
-        incomp_cand = random.choice(list(cand.get_incomparable_list()))
+        index = TreeIndex(genome.tree, lca=False)
+        # any node except the root
+        cand = random.randrange(index.root)
+        incomp_cand = index.nodes[random.choice(index.incomparable(cand))]
+        cand = index.nodes[cand]
         return (cand.up, cand), (incomp_cand.up, incomp_cand)
 
 
@@ -263,6 +217,7 @@ class Utils:
             raise ValueError("Edge not found")
         else:
             nodeup = node.up
+            TreeUtils.invalidateRows(nodeup)
             node.detach()
             subtree.detach()
             newNode = TreeClass()  
@@ -294,6 +249,7 @@ class Utils:
         lset1 = subtree1.get_leaf_names()
         for l in gchild2.tree:
             if l.name in lset1:
+                TreeUtils.invalidateRows(l.up)
                 l.delete()
         gchild2.tree.delete_single_child_internal(enable_root=True)
         selected_node = np.random.choice([x for x in gchild2.tree.traverse()])
@@ -315,6 +271,7 @@ class Utils:
         lset2 = subtree2.get_leaf_names()
         for l in gchild1.tree:
             if l.name in lset2:
+                TreeUtils.invalidateRows(l.up)
                 l.delete()
         gchild1.tree.delete_single_child_internal(enable_root=True)
         selected_node = np.random.choice([x for x in gchild1.tree.traverse()])
@@ -327,6 +284,9 @@ class Utils:
 
     @staticmethod
     def SPR_move(tree, donor, receiver):
+        # only the rows on the path from the modified edges to the root change
+        TreeUtils.invalidateRows(donor[0])
+        TreeUtils.invalidateRows(receiver[0])
         # detach 
         intruit =  donor[1].detach()
         donor[0].delete()
@@ -365,12 +325,18 @@ class Utils:
         genome1 = gdad.clone()
         genome2 = gmom.clone()
         prob = max(genome1.intbrnp, genome2.intbrnp)
-        current_dict = ddict(list)
+        # branches whose subtree has the same species labeled topology in
+        # both genomes, their parent should not be the root
+        table = {}
+        branches = {}
         for (gind, g) in enumerate([genome1, genome2]):
-            for node, partition, isinternal in Utils.iter_partition(g.tree):
-                brnch = BranchRep(node, partition, isinternal)
-                current_dict[brnch].append((node, gind))
-        candidates = [(k,v) for k,v in current_dict.items() if Utils.branch_is_valid(k,v)]
+            sig = Utils.clade_signatures(g.tree, table)
+            for node in g.tree.iter_descendants("levelorder"):
+                if not node.up.is_root():
+                    branches.setdefault(sig[node], ([], []))[gind].append(node)
+        candidates = [(1-nodes1[0].is_leaf(), nodes1[0], nodes2[0]) for nodes1, nodes2 in branches.values() if nodes1 and nodes2]
+        if not candidates:
+            return genome1, genome2
         selected_branch = Utils.two_step_branch_selection(candidates, prob)
 
         return Utils.find_and_swap(selected_branch, genome1, genome2)
@@ -448,6 +414,19 @@ class Utils:
 
         return [-x for x in scores]
 
+    @staticmethod
+    def batch_evaluate(genomes, **args):
+        """Evaluate all the genomes in a single session of their model: the
+        branch lengths of the trees are optimized and the genomes updated"""
+        raxmlmodel = args.get('model', genomes[0].model)
+        scores, trees = raxmlmodel.optimize_batch([g.tree for g in genomes], **args)
+        if not len(scores) == len(trees) == len(genomes):
+            raise ValueError("Evaluation of %d genomes returned %d scores and %d trees, see ==> %s"
+                             % (len(genomes), len(scores), len(trees), raxmlmodel.title))
+        for genome, tree in zip(genomes, trees):
+            genome.update_tree(tree)
+        return [-x for x in scores]
+
 
 class GPolySolver(GenomeBase):
     
@@ -524,6 +503,7 @@ class GPolySolver(GenomeBase):
                         (t&node.name).add_feature(feat, node.get_feature(feat))
                     else:
                         t.get_common_ancestor(node.get_leaf_names()).add_feature(feat, node.get_feature(feat))
+        TreeUtils.invalidateChangedRows(t)
         self.tree = t
 
     def get_tree_with_br(self):
@@ -584,6 +564,23 @@ class GPolySolver(GenomeBase):
         self.copy(newcopy)
         return newcopy
 
+    def get_cache_key(self):
+        """Key of the genome score: its labeled rooted topology and rates"""
+        rates = (self.dtlrates.getDTL(), (self.erates.mu, self.erates.sigma))
+        return TreeUtils.canonicalTreeHash(self.tree, addinfos=repr(rates))
+
+    def encode(self):
+        """Compact representation of the genome (newick and rates),
+        used to send it to other processes"""
+        return self.tree.write(), self.dtlrates, self.erates
+
+    def decode(self, code):
+        """Build a genome from the output of encode, sharing this genome model"""
+        newick, dtlrates, erates = code
+        g = GPolySolver(TreeClass(newick), self.model, dtlrates, erates, intbrnp=self.intbrnp, is_init=True)
+        g.set_species()
+        return g
+
     def set_species(self):
         for node in self.tree:
             if not node.has_feature("species"):
@@ -1,6 +1,7 @@
 import copy
-from ..TreeLib import TreeClass, TreeUtils, TreeFun, memorize
-from ..reclkl import  computeQe, get_discr_size, computeProb, nodeLimitter
+from ..TreeLib import TreeClass, TreeUtils, TreeFun, TreeIndex, memorize, params
+from ..reclkl import  computeQe, get_discr_size, computeProb, nodeLimitter, computeDL
+from .evolve import Profiler
 from scipy.stats import gamma
 import numpy as np
 import random
@@ -120,12 +121,27 @@ class ReconParams(object):
         self.sptree = TreeClass(sptree)
         self.gtreesize = gtreesize
         self.discrsize =  discrsize
+        self.maxdiscrsize = discrsize
         self.stemlen = stemlen
         self.parcim = parcim
         self.data = {}
+        # reconciliation tables reused by all the individuals
+        self.workspace = TreeUtils.ReconWorkspace()
         self.default_event_selector = self._fixed_event_list(event_selector)
         self._spectree_preprocess()
-          
+        self._genetree_preprocess()
+
+    def for_genetree_size(self, gtreesize):
+        """Return the ReconParams of gene trees with gtreesize leaves, sharing
+        the preprocessed species tree of this one (so the Qef matrices
+        cached for a discretization are also shared)"""
+        other = copy.copy(self)
+        other.gtreesize = gtreesize
+        other.discrsize = self.maxdiscrsize
+        other.data = dict(self.data)
+        other.default_event_selector = list(self.default_event_selector)
+        other._genetree_preprocess()
+        return other
 
     def _fixed_event_list(self, event_selector=None):
         if not event_selector:
@@ -149,6 +165,9 @@ class ReconParams(object):
         if self.parcim:
             self.sptree.label_internal_node()
             TreeUtils.lcaPreprocess(self.sptree)
+            self.spindex = TreeIndex(self.sptree)
+            self.data['spparent'] = self.spindex.parent.astype(np.int32)
+            self.data['spdepth'] = self.spindex.depth.astype(np.int32)
         else:
             if not self.sptree.is_ultrametric():
                 TreeFun.make_clock_like(self.sptree)
@@ -160,10 +179,25 @@ class ReconParams(object):
             self.data['slicelist'] = dict(slicelist)
             self.data['node_d'] = node_data
             self.data['leafslice'] = max(self.data['slicelist'].keys())
-            self.discrsize = get_discr_size(self.gtreesize, self.discrsize, self.data['leafslice'])
             self.sptree.add_features(name2node=dict((x.name, x) for x in self.sptree.get_leaves()))
+            self.data['spnewick'] = self.sptree.write(format=1)
+
+    def _genetree_preprocess(self):
+        # the discretization depends on the gene tree size
+        if not self.parcim and self.gtreesize:
+            self.discrsize = get_discr_size(self.gtreesize, self.maxdiscrsize, self.data['leafslice'])
+            # computeMat results depend on the species tree and the discretization
+            self.data['qkey'] = (self.data['spnewick'], self.discrsize, self.stemlen)
+            shape = (2*self.gtreesize - 1, len(self.data['node_d']), self.discrsize)
+            self.workspace.reserve('prob_Ax', shape)
+            self.workspace.reserve('prob_Se', shape)
 
     def computeRecCost(self, gind, **kwargs):
+        Profiler.count("reconciliations")
+        with Profiler.timer("reconciliation"):
+            return self._computeRecCost(gind, **kwargs)
+
+    def _computeRecCost(self, gind, **kwargs):
         # get Qef ==> memorize or not
         #mu, sigma =  edgeparams.get_mu(), edgeparams.get_sigma()
         #k = (mu/sigma)**2
@@ -172,7 +206,9 @@ class ReconParams(object):
         gind.set_species()
         if self.parcim:
             if dtlparams.hastrans():
-                return TreeUtils.computeDTLScore(gind.tree, self.sptree, dtlparams.getDup(), dtlparams.getTrans(), dtlparams.getLoss())
+                return np.min(TreeUtils.computeDTLArrayInc(gind.tree, self.spindex, dtlparams.getDup(), dtlparams.getTrans(), dtlparams.getLoss()))
+            elif computeDL is not None:
+                return self.computeDLCost(gind.tree, dtlparams.getDup(), dtlparams.getLoss())
             else:
                 lcamap = TreeUtils.lcaMapping(gind.tree, self.sptree)
                 score = TreeUtils.computeDLScore(gind.tree, lcamap, dtlparams.getDup(), dtlparams.getLoss()) 
@@ -180,7 +216,7 @@ class ReconParams(object):
         else:
             k = 1.0
             theta = 1.0
-            Qef = computeMat(dtlparams.getHash(), self, dtlparams)
+            Qef = computeMat((self.data['qkey'], dtlparams.getHash()), self, dtlparams)
 
             edgeparams = gind.erates#kwargs.get('edgeparams', None)
             if edgeparams:
@@ -188,15 +224,52 @@ class ReconParams(object):
                 theta = edgeparams.get_scale()
             ratedens = gamma(k, scale=theta)
             nodeLimitter(gind.tree, self.discrsize, self.data['leafslice'])
-            prob_Ax = computeProb(ratedens, gind.tree, self.sptree.name2node, self.data['slicelist'], self.data['node_d'], self.discrsize, self.stemlen, dtlparams.getDup(), dtlparams.getTrans(), Qef)
+            shape = (2*len(gind.tree) - 1, len(self.data['node_d']), self.discrsize)
+            tables = (self.workspace.table('prob_Ax', shape), self.workspace.table('prob_Se', shape))
+            prob_Ax = computeProb(ratedens, gind.tree, self.sptree.name2node, self.data['slicelist'], self.data['node_d'], self.discrsize, self.stemlen, dtlparams.getDup(), dtlparams.getTrans(), Qef, tables)
             val = np.asarray(prob_Ax)[gind.tree.ind, self.sptree.edge_i, self.discrsize-1]
             #print val, -np.log(val)
             return -np.log(val)
 
+    def _dlcost_arrays(self, dupcost, losscost):
+        # per species node costs used by the compiled dup/loss kernel,
+        # with the same rules as TreeUtils.computeDLScore
+        key = (dupcost, losscost)
+        costs = self.data.setdefault('dlcost', {})
+        if key not in costs:
+            sp = self.spindex
+            spdup = np.array([params.getdup(x) for x in sp.nodes], dtype=np.float)
+            if losscost:
+                sploss = np.empty(sp.size, dtype=np.float)
+                sploss.fill(losscost)
+            else:
+                sploss = np.array([params.getloss(x) for x in sp.nodes], dtype=np.float)
+            dupw = spdup.copy()
+            if dupcost:
+                dupw.fill(dupcost)
+            nonroot = np.arange(sp.size - 1)
+            childloss = np.zeros(sp.size)
+            np.add.at(childloss, sp.parent[nonroot], sploss[nonroot])
+            sibloss = np.zeros(sp.size)
+            sibloss[nonroot] = childloss[sp.parent[nonroot]] - sploss[nonroot]
+            sibcount = np.zeros(sp.size, dtype=np.int32)
+            sibcount[nonroot] = sp.nchild[sp.parent[nonroot]] - 1
+            costs[key] = (dupw, (spdup != 0).astype(np.uint8), sibloss, sibcount)
+        return costs[key]
+
+    def computeDLCost(self, genetree, dupcost=None, losscost=None):
+        """Dup/loss cost of a genetree with the compiled kernel"""
+        sp = self.spindex
+        dupw, dupflag, sibloss, sibcount = self._dlcost_arrays(dupcost, losscost)
+        gparent, gleafsp = sp.encode_genetree(genetree)
+        ndup, nloss, dscore, lscore = computeDL(gparent, gleafsp, self.data['spparent'], sp.euler, sp.euler_first,
+                                                sp.sparse, self.data['spdepth'], dupw, dupflag, sibloss, sibcount)
+        return dscore + lscore
+
 
 @memorize
 def computeMat(rec, dtlparams):
-    return computeQe(rec.sptree, rec.data['slicelist'], rec.data['node_d'], rec.discrsize, dtlparams.getDup(), dtlparams.getTrans(), dtlparams.getLoss(), rec.stemlen)
+    return computeQe(rec.data['slicelist'], rec.data['node_d'], rec.discrsize, dtlparams.getDup(), dtlparams.getTrans(), dtlparams.getLoss(), rec.stemlen)
 
 
 
@@ -1,4 +1,5 @@
 from GPolySolver import Utils, GPolySolver
+from GArraySolver import ArrayUtils, GArraySolver
 from ReconParams import DTLParams, ReconParams, EdgeParams
 
-__all__ = ['GPolySolver', 'Utils', 'DTLParams', 'EdgeParams', 'ReconParams']
\ No newline at end of file
+__all__ = ['GPolySolver', 'Utils', 'GArraySolver', 'ArrayUtils', 'DTLParams', 'EdgeParams', 'ReconParams']
\ No newline at end of file
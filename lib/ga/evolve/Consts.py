@@ -165,6 +165,9 @@ CDefGACrossoverRate = 0.7
 CDefGASelector = Selectors.GRankSelector
 CDefGAElitismReplacement = 1
 
+# - Fitness cache, maximum number of scores kept
+CDefFitnessCacheSize = 10000
+
 # - This is general used by integer/real ranges defaults
 CDefRangeMin = 0
 CDefRangeMax = 100
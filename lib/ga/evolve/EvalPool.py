@@ -0,0 +1,176 @@
+"""
+
+:mod:`EvalPool` -- persistent evaluation pool
+============================================================================
+
+This module contains the :class:`EvalPool.EvalPool` class, a pool of worker
+processes which live for the whole evolution. Each worker receives a copy of
+a template genome (and with it the likelihood model) when it starts, then
+only compact genome encodings are sent to it and only scores are sent back.
+
+The genomes evaluated by the pool must implement the *encode()* and
+*decode(code)* methods. With a population evaluator (bulk evaluation), the
+genomes are sent in one chunk per worker, each chunk being evaluated at once.
+
+"""
+
+import logging
+import itertools
+import numpy as np
+from .GPopulation import bulk_evaluate
+
+try:
+    import pathos.multiprocessing as mp
+    CPU_COUNT = mp.cpu_count()
+    MULTI_PROCESSING = True if CPU_COUNT > 1 else False
+except ImportError:
+    MULTI_PROCESSING = False
+
+# state of the current worker process, set by the pool initializer
+_worker = {}
+
+
+class WorkerEngine(object):
+    """ WorkerEngine Class - A light stand-in for the GA Engine in the workers
+
+    The evaluators only need the reconciliation parameters and the
+    engine parameters, so the whole engine and its population are never
+    sent to the workers.
+
+    :param recparam: the reconciliation parameters of the GA Engine
+    :param params: the internal params of the GA Engine
+
+    """
+
+    def __init__(self, recparam=None, params={}):
+        self.recparam = recparam
+        self.internalParams = dict(params)
+
+    def getParam(self, key, nvl=None):
+        """ Gets an internal parameter """
+        return self.internalParams.get(key, nvl)
+
+
+def _init_worker(template, args, evaluator=None):
+    """ Internal used by the pool to set the worker state """
+    _worker['template'] = template
+    _worker['args'] = args
+    _worker['evaluator'] = evaluator
+
+
+def _evaluate(job):
+    """ Internal used by the pool, returns the score of a genome encoding """
+    pos, code = job
+    args = dict(_worker['args'])
+    args['ext'] = str(pos)
+    ind = _worker['template'].decode(code)
+    ind.evaluate(**args)
+    return ind.score
+
+def _evaluate_full(job):
+    """ Internal used by the pool (full copy), also returns the genome encoding """
+    pos, code = job
+    args = dict(_worker['args'])
+    args['ext'] = str(pos)
+    ind = _worker['template'].decode(code)
+    ind.evaluate(**args)
+    return ind.score, ind.encode()
+
+def _evaluate_bulk(job):
+    """ Internal used by the pool, evaluates a chunk of genome encodings with
+    the population evaluator and returns their (score, encoding) """
+    pos, codes = job
+    args = dict(_worker['args'])
+    args['ext'] = "b%d" % pos
+    individuals = [_worker['template'].decode(code) for code in codes]
+    bulk_evaluate(individuals, _worker['evaluator'], args)
+    return [(ind.score, ind.encode()) for ind in individuals]
+
+
+class EvalPool(object):
+    """ EvalPool Class - Persistent pool of evaluation workers
+
+    Example:
+       >>> pool = EvalPool(genome, 8, ga_engine=ga)
+       >>> scores = pool.map(population.internalPop)
+       >>> pool.close()
+
+    :param template: the genome used to decode the encodings in the workers
+    :param processes: the number of workers, None for the number of cores
+    :param ga_engine: the GA Engine, only its reconciliation parameters are kept
+    :param evaluator: the population evaluator (FunctionSlot) used by map_bulk
+    :param args: extra parameters passed to the evaluators
+
+    """
+
+    def __init__(self, template, processes=None, ga_engine=None, evaluator=None, **args):
+        """ The EvalPool Class creator """
+        if not MULTI_PROCESSING:
+            raise EnvironmentError("The evaluation pool needs the pathos module and more than one core")
+        wargs = dict(args)
+        if ga_engine is not None:
+            wargs['ga_engine'] = WorkerEngine(ga_engine.recparam, ga_engine.internalParams)
+        self.processes = processes
+        self.pool = mp.Pool(processes=processes, initializer=_init_worker, initargs=(template, wargs, evaluator))
+        logging.debug("Evaluation pool started with %s workers", processes or CPU_COUNT)
+
+    def map(self, individuals, full_copy=False):
+        """ Evaluate the individuals in the workers
+
+        :param individuals: the list of genomes to evaluate
+        :param full_copy: also return the genomes updated by the workers
+        :rtype: the list of scores, or of (score, encoding) with full_copy
+
+        """
+        jobs = [(pos, ind.encode()) for pos, ind in enumerate(individuals)]
+        if full_copy:
+            return self.pool.map(_evaluate_full, jobs)
+        return self.pool.map(_evaluate, jobs)
+
+    def map_bulk(self, individuals):
+        """ Evaluate the individuals with the population evaluator, the
+        population is split in one chunk per worker
+
+        :param individuals: the list of genomes to evaluate
+        :rtype: the list of (score, encoding), the evaluator can update the genomes
+
+        """
+        nchunks = max(1, min(len(individuals), self.size()))
+        bounds = np.linspace(0, len(individuals), nchunks + 1).astype(int)
+        codes = [ind.encode() for ind in individuals]
+        jobs = [(k, codes[bounds[k]:bounds[k + 1]]) for k in xrange(nchunks)]
+        return list(itertools.chain(*self.pool.map(_evaluate_bulk, jobs)))
+
+    def submit(self, individual, pos=0):
+        """ Start the evaluation of an individual in a worker and return
+        without waiting for it
+
+        :param individual: the genome to evaluate
+        :param pos: the job number, should be unique among the running jobs
+        :rtype: the AsyncResult of the job, its get() returns (score, encoding)
+
+        """
+        return self.pool.apply_async(_evaluate_full, ((pos, individual.encode()),))
+
+    def size(self):
+        """ Return the number of workers """
+        return self.processes or CPU_COUNT
+
+    def close(self, wait=True):
+        """ Stop the workers
+
+        :param wait: wait for the running jobs, else they are dropped
+
+        """
+        if self.pool is not None:
+            if wait:
+                self.pool.close()
+            else:
+                self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            logging.debug("Evaluation pool closed")
+
+    def isAlive(self):
+        """ Return True if the workers are running """
+        return self.pool is not None
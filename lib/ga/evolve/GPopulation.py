@@ -22,6 +22,7 @@ Class
 
 import Consts
 import Util
+import Profiler
 import numpy as np
 from .FunctionSlot import FunctionSlot
 from .Statistics import Statistics
@@ -75,6 +76,18 @@ def multiprocessing_eval_full(ind, args):
     ind.evaluate(**args)
     return ind
 
+def bulk_evaluate(individuals, evaluator, args):
+    """ Evaluate the individuals with the population evaluator, then add
+    their reconciliation cost (last evaluator of the individuals) """
+    scores = np.zeros(len(individuals))
+    for it in evaluator.applyFunctions(individuals, **args):
+        scores += np.asarray(it)
+    for pos, ind in enumerate(individuals):
+        ind.resetStats()
+        ind.score.append(scores[pos])
+        if len(ind.evaluator) > 1:
+            ind.score.append(ind.evaluator.apply(-1, ind, **args))
+
 
 class GPopulation(object):
     """ GPopulation Class - The container for the population
@@ -128,6 +141,8 @@ class GPopulation(object):
             self.bulkEval = genome.bulkEval
             self.internalParams = genome.internalParams
             self.multiProcessing = genome.multiProcessing
+            self.evalPool = genome.evalPool
+            self.fitnessCache = genome.fitnessCache
             self.statted = False
             self.stats = Statistics()
             return
@@ -146,6 +161,8 @@ class GPopulation(object):
 
         self.internalParams = {}
         self.multiProcessing = (False, False, None)
+        self.evalPool = None
+        self.fitnessCache = None
 
         # Bulk evaluation
         self.bulkEval = bulkEval
@@ -198,6 +215,26 @@ class GPopulation(object):
         """
         self.multiProcessing = (flag, full_copy, max_processes)
 
+    def setFitnessCache(self, cache):
+        """ Sets the cache of already computed raw scores, consulted before
+        evaluating the individuals. The individuals must implement the
+        *get_cache_key()*, *encode()* and *decode()* methods: an individual
+        found in the cache is replaced by the genome evaluated.
+
+        :param cache: an :class:`Util.FitnessCache` instance or None
+
+        """
+        self.fitnessCache = cache
+
+    def setEvalPool(self, pool):
+        """ Sets the persistent evaluation pool used instead of a new
+        process pool at each evaluation
+
+        :param pool: an :class:`EvalPool.EvalPool` instance or None
+
+        """
+        self.evalPool = pool
+
 
     def __repr__(self):
         """ Returns the string representation of the population """
@@ -417,57 +454,124 @@ class GPopulation(object):
         self.clearFlags()
 
     def evaluate(self, **args):
-        """ Evaluate all individuals in population, calls the evaluate() method of individuals
+        """ Evaluate all individuals in population, calls the evaluate() method of individuals.
+        When a fitness cache is set, the individuals already scored are not evaluated again.
 
         :param args: this params are passed to the evaluation function
 
         """
-        # We have multiprocessing
         args.update(self.internalParams)
+        individuals = self.internalPop
+        keys = None
+        duplicates = {}
+        # position of each individual, to replace it by its evaluated copy
+        positions = dict((id(ind), i) for i, ind in enumerate(self.internalPop))
+        if self.fitnessCache is not None:
+            individuals = []
+            keys = []
+            for ind in self.internalPop:
+                key = ind.get_cache_key()
+                if key in duplicates:
+                    # same genome already waiting for its evaluation
+                    duplicates[key].append(ind)
+                    continue
+                cached = self.fitnessCache.get(key)
+                if cached is None:
+                    individuals.append(ind)
+                    keys.append(key)
+                    duplicates[key] = []
+                else:
+                    self._replace_cached(positions, ind, *cached)
+            logging.debug("Fitness cache: %d individuals to evaluate", len(individuals))
+            Profiler.count("cache_hits", len(self.internalPop) - len(individuals))
+
+        if individuals:
+            Profiler.count("evaluations", len(individuals))
+            with Profiler.timer("evaluation"):
+                individuals = self._evaluate(individuals, positions, **args)
+            if keys is not None:
+                for key, ind in zip(keys, individuals):
+                    code = ind.encode()
+                    self.fitnessCache.set(key, ind.score, code)
+                    for other in duplicates[key]:
+                        self._replace_cached(positions, other, list(ind.score), code)
+        self.clearFlags()
+
+    def _replace_cached(self, positions, individual, score, code):
+        """ Replace an individual found in the fitness cache by the genome
+        evaluated (code), with its score """
+        copy = individual.decode(code) if code is not None else individual
+        copy.resetStats()
+        copy.score = score
+        if copy is not individual:
+            self._replace(positions, individual, copy)
+
+    def _evaluate(self, individuals, positions, **args):
+        """ Evaluate the given individuals and return them, they can be
+        replaced by their copy in multiprocessing full_copy mode (positions
+        gives the index of each individual in the population) """
+        # We have multiprocessing
         m_e_f = partial(multiprocessing_eval_full, args=args)
         m_e = partial(multiprocessing_eval, args=args)
-        if self.multiProcessing[0] and MULTI_PROCESSING:
+        if self.multiProcessing[0] and self.evalPool is not None and self.evalPool.isAlive():
+            bulk = self.bulkEval and not self.blkevaluator.isEmpty()
+            if bulk:
+                logging.debug("Evaluating the population using the bulk evaluator in the evaluation pool")
+                results = self.evalPool.map_bulk(individuals)
+            else:
+                logging.debug("Evaluating the population using the evaluation pool")
+                results = self.evalPool.map(individuals, full_copy=self.multiProcessing[1])
+            if bulk or self.multiProcessing[1]:
+                for i, (score, code) in enumerate(results):
+                    copy = self.oneSelfGenome.decode(code)
+                    copy.score = score
+                    self._replace(positions, individuals[i], copy)
+                    individuals[i] = copy
+            else:
+                for individual, score in zip(individuals, results):
+                    individual.score = score
+
+        elif self.multiProcessing[0] and MULTI_PROCESSING:
             # print("Multiprocessing evaluation chosen")
             logging.debug("Evaluating the population using the multiprocessing method")
             proc_pool = mp.Pool(processes=self.multiProcessing[2])
 
         # Multiprocessing full_copy parameter
             if self.multiProcessing[1]:
-                results = proc_pool.map(m_e_f, enumerate(self.internalPop))
+                results = proc_pool.map(m_e_f, enumerate(individuals))
                 proc_pool.close()
                 proc_pool.join()
-                for i in xrange(len(self.internalPop)):
-                    self.internalPop[i] = results[i]
+                for i in xrange(len(individuals)):
+                    self._replace(positions, individuals[i], results[i])
+                    individuals[i] = results[i]
             else:
-                results = proc_pool.map(m_e, enumerate(self.internalPop))
+                results = proc_pool.map(m_e, enumerate(individuals))
                 proc_pool.close()
                 proc_pool.join()
-                for individual, score in zip(self.internalPop, results):
+                for individual, score in zip(individuals, results):
                     individual.score = score
         
         elif self.bulkEval and not self.blkevaluator.isEmpty():
             # print("*** Bulk evaluate chosen")
             logging.debug("Evaluating the population using bulk evaluator")
 
-            scores = np.zeros(len(self.internalPop))
-            for it in self.blkevaluator.applyFunctions(self, **args):
-                scores += np.asarray(it)
-            for pos, ind in enumerate(self.internalPop):
-                ind.resetStats()
-                ind.score.append(scores[pos])
-
-            # look at recon cost function now
-            if len(ind.evaluator) > 1:
-                for ind in self.internalPop:
-                    reccost = ind.evaluator.apply(-1, ind, **args)
-                    ind.score.append(reccost)
+            bulk_evaluate(individuals, self.blkevaluator, args)
         
         else:
             print("*** Single evaluate chosen")
-            for ind in self.internalPop:
+            for ind in individuals:
                 ind.evaluate(**args)
-        self.clearFlags()
+        return individuals
 
+    def _replace(self, positions, individual, other):
+        """ Replace an individual of the population by other
+
+        :param positions: the index in the population of each individual, by id
+        """
+        i = positions.pop(id(individual), None)
+        if i is not None:
+            self.internalPop[i] = other
+            positions[id(other)] = i
 
 
     def scale(self, **args):
@@ -476,8 +580,9 @@ class GPopulation(object):
         :param args: this parameter is passed to the scale method
 
         """
-        for it in self.scaleMethod.applyFunctions(self, **args):
-            pass
+        with Profiler.timer("scale"):
+            for it in self.scaleMethod.applyFunctions(self, **args):
+                pass
 
         fit_sum = 0
         for ind in xrange(len(self)):
@@ -506,6 +611,8 @@ class GPopulation(object):
         pop.scaleMethod = self.scaleMethod
         pop.internalParams = self.internalParams
         pop.multiProcessing = self.multiProcessing
+        pop.evalPool = self.evalPool
+        pop.fitnessCache = self.fitnessCache
         pop.bulkEval = self.bulkEval
 
 
@@ -36,6 +36,10 @@ Default Parameters
 
    The Rank Selection method
 
+*Steady-state mode*
+
+   Disabled by default, see :meth:`GSimpleGA.setSteadyState`
+
 Class
 -------------------------------------------------------------
 
@@ -52,6 +56,8 @@ from .FunctionSlot import FunctionSlot
 from .GenomeBase import GenomeBase
 from . import Consts
 from . import Util
+from . import EvalPool
+from . import Profiler
 
 
 def ConvergenceCriteria(ga_engine):
@@ -151,6 +157,11 @@ class GSimpleGA(object):
         self.scaleparam = None
         self.time_init = None
         self.max_time = None
+        self.evalPool = None
+        self.steadyState = False
+        self._pending = []
+        self._ready = []
+        self._njobs = 0
 
         self.selector = FunctionSlot("Selector")
         self.stepCallback = FunctionSlot("Generation Step Callback")
@@ -281,6 +292,66 @@ class GSimpleGA(object):
 
         self.internalPop.setMultiProcessing(flag, full_copy, max_processes)
 
+    def setFitnessCache(self, size=Consts.CDefFitnessCacheSize):
+        """ Sets the cache of the raw scores, so genomes with an already scored
+        topology and rates are not evaluated again
+
+        :param size: the maximum number of scores kept, 0 to disable the cache
+
+        """
+        if size < 0:
+            Util.raiseException("The fitness cache size must be >= 0", ValueError)
+        self.internalPop.setFitnessCache(Util.FitnessCache(size) if size else None)
+
+    def getFitnessCache(self):
+        """ Return the fitness cache, with its hits and misses counters
+
+        :rtype: the :class:`Util.FitnessCache` instance or None
+
+        """
+        return self.internalPop.fitnessCache
+
+    def startEvalPool(self):
+        """ Starts the persistent evaluation pool used by the population when
+        multiprocessing is enabled. The workers are kept until :meth:`stopEvalPool`
+        so the likelihood model stay loaded in each of them.
+        """
+        flag, full_copy, max_processes = self.internalPop.multiProcessing
+        if not flag or self.evalPool is not None:
+            return
+        if not EvalPool.MULTI_PROCESSING:
+            logging.debug("No multiprocessing support, the evaluation pool is not started")
+            return
+        self.evalPool = EvalPool.EvalPool(self.internalPop.oneSelfGenome, max_processes, ga_engine=self,
+                                          evaluator=self.internalPop.blkevaluator)
+        self.internalPop.setEvalPool(self.evalPool)
+
+    def stopEvalPool(self):
+        """ Stops the persistent evaluation pool, the evaluations still
+        running in steady-state mode are dropped """
+        if self.evalPool is not None:
+            self.evalPool.close(wait=not self._pending)
+            self.evalPool = None
+            self.internalPop.setEvalPool(None)
+        self._pending = []
+        self._ready = []
+
+    def setSteadyState(self, flag=True):
+        """ Sets the steady-state (asynchronous) mode. Instead of breeding
+        and evaluating a whole new population at each generation, the
+        offspring are sent to the evaluation pool as soon as they are created
+        and each evaluated offspring is inserted in the population when it is
+        received, so the workers are never waiting for the master. A
+        generation is then the insertion of as many offspring as the
+        population size.
+
+        :param flag: True (default) or False
+
+        """
+        if type(flag) != BooleanType:
+            Util.raiseException("Steady-state option must be True or False", TypeError)
+        self.steadyState = flag
+
 
     def setPopulationSize(self, size):
         """ Sets the population size, calls setPopulationSize() of GPopulation
@@ -438,6 +509,146 @@ class GSimpleGA(object):
         """
         return self.internalPop.getStatistics()
 
+    def _breed(self, crossover_empty=False):
+        """ Select two parents and return their two mutated children """
+        with Profiler.timer("selection"):
+            genomeMom = self.select(popID=self.currentGeneration)
+            genomeDad = self.select(popID=self.currentGeneration)
+        with Profiler.timer("crossover"):
+            if not crossover_empty and Util.randomFlipCoin(self.pCrossover):
+                for it in genomeMom.crossover.applyFunctions(mom=genomeMom, dad=genomeDad):#, ga_engine=self):
+                    (sister, brother) = it
+                    break
+            else:
+                sister = genomeMom.clone()
+                brother = genomeDad.clone()
+
+        with Profiler.timer("mutation"):
+            sister.mutate(pmut=self.pMutation, ga_engine=self)
+            brother.mutate(pmut=self.pMutation, ga_engine=self)
+        return sister, brother
+
+    def _timeExceeded(self):
+        """ Return True if the maximum evolve time is reached """
+        return bool(self.max_time) and time() - self.time_init > self.max_time
+
+    def _terminationFlags(self):
+        """ Return the result of each termination criteria """
+        if self.terminationCriteria.isEmpty():
+            return []
+        return list(self.terminationCriteria.applyFunctions(self))
+
+    def _submit(self, child):
+        """ Start the evaluation of an offspring (steady-state mode), in the
+        evaluation pool when it is running """
+        if self.evalPool is None or not self.evalPool.isAlive():
+            offspring = GPopulation(self.internalPop)
+            offspring.internalPop = [child]
+            offspring.evaluate(ga_engine=self)
+            # the child is replaced by the cached genome on a cache hit
+            self._ready.extend(offspring.internalPop)
+            return
+        cache = self.getFitnessCache()
+        key = child.get_cache_key() if cache is not None else None
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            Profiler.count("cache_hits")
+            score, code = cached
+            if code is not None:
+                child = child.decode(code)
+            child.resetStats()
+            child.score = score
+            self._ready.append(child)
+        else:
+            Profiler.count("evaluations")
+            self._njobs += 1
+            self._pending.append((self.evalPool.submit(child, self._njobs), key))
+
+    def _collect(self, timeout=0.1):
+        """ Return the offspring evaluated since the last call, waiting at
+        most timeout seconds for the first one if there is none """
+        if not self._ready and self._pending:
+            with Profiler.timer("evaluation"):
+                self._pending[0][0].wait(timeout)
+        running = []
+        for result, key in self._pending:
+            if result.ready():
+                score, code = result.get()
+                child = self.internalPop.oneSelfGenome.decode(code)
+                child.score = score
+                if key is not None:
+                    self.getFitnessCache().set(key, score, code)
+                self._ready.append(child)
+            else:
+                running.append((result, key))
+        self._pending = running
+        ready, self._ready = self._ready, []
+        return ready
+
+    def insertIndividuals(self, individuals):
+        """ Insert evaluated individuals in the population, keeping its size:
+        Pareto replacement in the MOOP framework, else the worst individuals
+        are removed
+
+        :param individuals: the list of individuals, with their score
+
+        """
+        pop = self.internalPop
+        size = len(pop)
+        with Profiler.timer("sort"):
+            if self.scaleparam and self.scaleparam._moop:
+                nextPop = Util.compNextGen(individuals, pop.internalPop, size,
+                                           crowding=self.getParam("crowding", False))
+                pop.clearFlags()
+                pop.moop_sort(nextPop)
+            else:
+                pop.internalPop.extend(individuals)
+                pop.clearFlags()
+                pop.sort()
+                removed = set(id(x) for x in pop.internalPop[size:])
+                del pop.internalPop[size:]
+                pop.internalPopRaw = [x for x in pop.internalPopRaw if id(x) not in removed]
+        pop.statted = False
+
+    def steadyStep(self):
+        """ Do one generation in steady-state mode: pairs of offspring are
+        bred from the current population and submitted until the evaluation
+        pool is full, and each offspring is inserted in the population as
+        soon as it is evaluated. The time limit is checked at each insertion
+        and the termination criteria after each round of evaluations (one
+        per worker). The evaluations still running at the end of the
+        generation are received in the next one.
+
+        :rtype: True if the evolution should stop
+
+        """
+        popsize = len(self.internalPop)
+        nslots = 1
+        if self.evalPool is not None and self.evalPool.isAlive():
+            nslots = self.evalPool.size()
+        crossover_empty = self.select(popID=self.currentGeneration).crossover.isEmpty()
+
+        received = 0
+        while received < popsize:
+            while len(self._pending) < 2 * nslots and not self._ready:
+                for child in self._breed(crossover_empty):
+                    self._submit(child)
+            for child in self._collect():
+                self.insertIndividuals([child])
+                received += 1
+                if self._timeExceeded():
+                    return True
+                if received % nslots == 0 and any(self._terminationFlags()):
+                    logging.debug("Evolution stopped by the Termination Criteria !")
+                    return True
+
+        logging.debug("The steady-state generation %d was finished (%d evaluations running).",
+                      self.currentGeneration, len(self._pending))
+        self.currentGeneration += 1
+        if self._timeExceeded():
+            return True
+        return self.currentGeneration == self.nGenerations
+
     def step(self):
         """ Just do one step in evolution, one generation """
         newPop = GPopulation(self.internalPop)
@@ -452,51 +663,36 @@ class GSimpleGA(object):
         crossover_empty = self.select(popID=self.currentGeneration).crossover.isEmpty()
 
         for i in xrange(0, size_iterate, 2):
-            genomeMom = self.select(popID=self.currentGeneration)
-            genomeDad = self.select(popID=self.currentGeneration)
-            t = time()
-            if not crossover_empty and self.pCrossover >= 1.0:
-                for it in genomeMom.crossover.applyFunctions(mom=genomeMom, dad=genomeDad):#, ga_engine=self):
-                    (sister, brother) = it
-                    break
-            else:
-                if not crossover_empty and Util.randomFlipCoin(self.pCrossover):
-                    for it in genomeMom.crossover.applyFunctions(mom=genomeMom, dad=genomeDad):#, ga_engine=self):
-                        (sister, brother) = it
-                        break
-                else:
-                    sister = genomeMom.clone()
-                    brother = genomeDad.clone()
-            
-            #self.printTimeElapsed("Crossover")
-            sister.mutate(pmut=self.pMutation, ga_engine=self)
-            brother.mutate(pmut=self.pMutation, ga_engine=self)
-            #self.printTimeElapsed("Mutation")
+            sister, brother = self._breed(crossover_empty)
             newPop.internalPop.append(sister)
             newPop.internalPop.append(brother)
 
         if len(self.internalPop) % 2 != 0:
-            genomeMom = self.select(popID=self.currentGeneration)
-            genomeDad = self.select(popID=self.currentGeneration)
+            with Profiler.timer("selection"):
+                genomeMom = self.select(popID=self.currentGeneration)
+                genomeDad = self.select(popID=self.currentGeneration)
 
             if Util.randomFlipCoin(self.pCrossover):
-                for it in genomeMom.crossover.applyFunctions(mom=genomeMom, dad=genomeDad):#, ga_engine=self):
-                    (sister, brother) = it
-                    break
+                with Profiler.timer("crossover"):
+                    for it in genomeMom.crossover.applyFunctions(mom=genomeMom, dad=genomeDad):#, ga_engine=self):
+                        (sister, brother) = it
+                        break
             else:
                 sister = random.choice([genomeMom, genomeDad])
                 sister = sister.clone()
-                sister.mutate(pmut=self.pMutation, ga_engine=self)
+                with Profiler.timer("mutation"):
+                    sister.mutate(pmut=self.pMutation, ga_engine=self)
 
             newPop.internalPop.append(sister)
 
         logging.debug("Evaluating the new created population.")
         newPop.evaluate(ga_engine=self)
-        # self.printTimeElapsed("Step")
 
         if self.scaleparam._moop:
-            nextPop = Util.compNextGen(newPop.internalPop, self.internalPop.internalPop, len(self.internalPop))
-            newPop.moop_sort(nextPop)
+            with Profiler.timer("sort"):
+                nextPop = Util.compNextGen(newPop.internalPop, self.internalPop.internalPop, len(self.internalPop),
+                                           crowding=self.getParam("crowding", False))
+                newPop.moop_sort(nextPop)
 
         elif self.elitism:
             t = time()
@@ -532,16 +728,15 @@ class GSimpleGA(object):
 
 
         self.internalPop = newPop
-        self.internalPop.sort() #important
+        with Profiler.timer("sort"):
+            self.internalPop.sort() #important
 
         logging.debug("The generation %d was finished.", self.currentGeneration)
 
         self.currentGeneration += 1
 
-        if self.max_time:
-           total_time = time() - self.time_init
-           if total_time > self.max_time:
-              return True
+        if self._timeExceeded():
+            return True
         return self.currentGeneration == self.nGenerations
 
     def printStats(self):
@@ -558,6 +753,8 @@ class GSimpleGA(object):
         sys_stdout.flush()
         self.internalPop.statistics()
         stat_ret = self.internalPop.printStats()
+        if self.getFitnessCache() is not None:
+            logging.info("Fitness cache hits/misses [%d/%d]", self.getFitnessCache().hits, self.getFitnessCache().misses)
         return message + stat_ret
 
     def printTimeElapsed(self, msg=""):
@@ -591,27 +788,29 @@ class GSimpleGA(object):
         self.time_init = time()
         
         self.initialize()
-        # self.printTimeElapsed("Initialize")
+        self.startEvalPool()
         self.internalPop.evaluate(ga_engine=self)
-        # self.printTimeElapsed("Evaluate")
-        if self.scaleparam._moop:
-            nextPop = Util.compNextGen([], self.internalPop.internalPop, len(self.internalPop))
-            self.internalPop.moop_sort(nextPop)
-        else:
-            self.internalPop.sort()
-        # self.printTimeElapsed("Sort")
+        with Profiler.timer("sort"):
+            if self.scaleparam._moop:
+                nextPop = Util.compNextGen([], self.internalPop.internalPop, len(self.internalPop),
+                                           crowding=self.getParam("crowding", False))
+                self.internalPop.moop_sort(nextPop)
+            else:
+                self.internalPop.sort()
+        Profiler.dump(generation=self.currentGeneration, phase="init", popsize=len(self.internalPop))
         logging.debug("Starting loop over evolutionary algorithm.")
         try:
             while True:
                 stopFlagTerminationCriteria = []
 
-                if not self.stepCallback.isEmpty():
-                    for it in self.stepCallback.applyFunctions(self):
-                        stopFlagCallback = it
+                with Profiler.timer("callbacks"):
+                    if not self.stepCallback.isEmpty():
+                        for it in self.stepCallback.applyFunctions(self):
+                            stopFlagCallback = it
 
-                if not self.terminationCriteria.isEmpty():
-                    for it in self.terminationCriteria.applyFunctions(self):
-                        stopFlagTerminationCriteria.append(it)
+                    if not self.terminationCriteria.isEmpty():
+                        for it in self.terminationCriteria.applyFunctions(self):
+                            stopFlagTerminationCriteria.append(it)
 
                 if freq_stats:
                     if (self.currentGeneration % freq_stats == 0) or (self.getCurrentGeneration() == 0):
@@ -633,7 +832,12 @@ class GSimpleGA(object):
                         print("\n\tEvolution stopped by Step Callback function !\n")
                     break
 
-                if self.step():
+                if self.steadyState:
+                    stop = self.steadyStep()
+                else:
+                    stop = self.step()
+                Profiler.dump(generation=self.currentGeneration, phase="step", popsize=len(self.internalPop))
+                if stop:
                     break
 
         except KeyboardInterrupt:
@@ -641,6 +845,10 @@ class GSimpleGA(object):
             if freq_stats:
                 print("\n\tA break was detected, you have interrupted the evolution !\n")
 
+        finally:
+            self.stopEvalPool()
+            Profiler.dump(generation=self.currentGeneration, phase="end", popsize=len(self.internalPop))
+
         if freq_stats != 0:
             self.printStats()
             self.printTimeElapsed("Generations %d [%d ind]"%(self.currentGeneration, len(self.internalPop)))
@@ -0,0 +1,242 @@
+"""
+
+:mod:`Islands` -- island model
+============================================================================
+
+This module contains the island model: several copies of a GA Engine
+(the islands) evolve their population independently in separate
+processes, and every *interval* generations each island sends its best
+individuals to the next one (ring topology). The migrants are sent as
+(score, encoding) pairs through a transport:
+
+   * :class:`QueueTransport`, multiprocessing queues between the local processes
+   * :class:`FileTransport`, files in a directory, which can be shared by the
+     nodes of a cluster (each node running some of the islands)
+
+The genomes of the islands must implement the *encode()* and
+*decode(code)* methods.
+
+"""
+
+import os
+import glob
+import random
+import logging
+import tempfile
+import cPickle as pickle
+import multiprocessing as mp
+from Queue import Empty
+import numpy as np
+
+
+class Transport(object):
+    """ Transport Class - Base class of the migration transports
+
+    A transport delivers the migrants sent to an island when this island
+    asks for them, the receive() method should not block.
+
+    """
+
+    def send(self, island, migrants):
+        """ Send a list of migrants to an island
+
+        :param island: the index of the destination island
+        :param migrants: the list of (score, encoding) of the migrants
+
+        """
+        raise NotImplementedError
+
+    def receive(self, island):
+        """ Return the migrants received by an island since the last call
+
+        :param island: the index of the island
+        :rtype: the list of (score, encoding)
+
+        """
+        raise NotImplementedError
+
+
+class QueueTransport(Transport):
+    """ QueueTransport Class - Migration between local processes, with one
+    multiprocessing queue per island. It should be created before the
+    islands processes.
+
+    :param nislands: the number of islands
+
+    """
+
+    def __init__(self, nislands):
+        self.queues = [mp.Queue() for i in xrange(nislands)]
+
+    def send(self, island, migrants):
+        self.queues[island].put(migrants)
+
+    def receive(self, island):
+        migrants = []
+        while True:
+            try:
+                migrants.extend(self.queues[island].get_nowait())
+            except Empty:
+                break
+        return migrants
+
+
+class FileTransport(Transport):
+    """ FileTransport Class - Migration through the files of a directory,
+    one subdirectory per island. The directory can be on a filesystem
+    shared by several nodes.
+
+    :param dirname: the directory, created if needed
+
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+
+    def _islanddir(self, island):
+        path = os.path.join(self.dirname, "island%d" % island)
+        if not os.path.exists(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                pass
+        return path
+
+    def send(self, island, migrants):
+        # write then rename, so the island never reads a partial file
+        fd, tmp = tempfile.mkstemp(dir=self._islanddir(island), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as handle:
+            pickle.dump(migrants, handle, protocol=2)
+        os.rename(tmp, tmp[:-len(".tmp")] + ".mig")
+
+    def receive(self, island):
+        migrants = []
+        for path in sorted(glob.glob(os.path.join(self._islanddir(island), "*.mig"))):
+            with open(path, 'rb') as handle:
+                migrants.extend(pickle.load(handle))
+            os.remove(path)
+        return migrants
+
+
+class Migration(object):
+    """ Migration Class - Step callback of the GA Engine of an island,
+    sending its best individuals to the next island every interval
+    generations, and inserting the migrants it received in its population
+
+    :param transport: the :class:`Transport` instance
+    :param island: the index of the island
+    :param nislands: the number of islands
+    :param interval: the number of generations between two migrations
+    :param nmigrants: the number of individuals sent at each migration
+
+    """
+
+    def __init__(self, transport, island, nislands, interval=10, nmigrants=1):
+        self.transport = transport
+        self.island = island
+        self.target = (island + 1) % nislands
+        self.interval = interval
+        self.nmigrants = nmigrants
+
+    def __call__(self, ga_engine):
+        generation = ga_engine.getCurrentGeneration()
+        if generation > 0 and generation % self.interval == 0:
+            migrants = [(ind.score, ind.encode()) for ind in ga_engine.bestNIndividuals(self.nmigrants)]
+            self.transport.send(self.target, migrants)
+            logging.debug("Island %d sent %d migrants to island %d", self.island, len(migrants), self.target)
+
+        received = self.transport.receive(self.island)
+        if received:
+            ga_engine.insertIndividuals(decodeIndividuals(ga_engine, received))
+            logging.debug("Island %d received %d migrants", self.island, len(received))
+        # never stops the evolution
+        return False
+
+
+def decodeIndividuals(ga_engine, codes):
+    """ Build the individuals from their (score, encoding) """
+    genome = ga_engine.getPopulation().oneSelfGenome
+    individuals = []
+    for score, code in codes:
+        ind = genome.decode(code)
+        ind.score = list(score)
+        individuals.append(ind)
+    return individuals
+
+
+def _run_island(ga_engine, island, nislands, transport, interval, nmigrants, setup, results):
+    """ Internal used to run an island in a child process """
+    # each island should have its own random sequence
+    random.seed()
+    np.random.seed()
+    runIsland(ga_engine, island, nislands, transport, interval, nmigrants, setup=setup)
+    results.put([(ind.score, ind.encode()) for ind in ga_engine.bestNIndividuals(len(ga_engine.getPopulation()))])
+
+
+def runIsland(ga_engine, island, nislands, transport, interval=10, nmigrants=1, freq_stats=0, setup=None):
+    """ Evolve a single island in this process
+
+    :param ga_engine: the GA Engine of the island
+    :param island: the index of the island, from 0 to nislands-1
+    :param nislands: the number of islands
+    :param transport: the :class:`Transport` shared by the islands
+    :param interval: the number of generations between two migrations
+    :param nmigrants: the number of individuals sent at each migration
+    :param freq_stats: passed to the evolve() method of the engine
+    :param setup: called with the engine and the island index before the evolution
+    :rtype: the best individual of the island
+
+    """
+    if setup is not None:
+        setup(ga_engine, island)
+    ga_engine.stepCallback.add(Migration(transport, island, nislands, interval, nmigrants))
+    return ga_engine.evolve(freq_stats=freq_stats)
+
+
+def evolveIslands(ga_engine, nislands, transport=None, interval=10, nmigrants=1, freq_stats=0, setup=None):
+    """ Evolve nislands copies of the GA Engine on this node. The islands 1 to
+    nislands-1 are run in child processes and the island 0 in this process,
+    at the end the final populations of the other islands are inserted in
+    the population of ga_engine.
+
+    Example:
+       >>> Islands.evolveIslands(ga, 4, interval=5, nmigrants=2)
+       >>> best = ga.bestIndividual()
+
+    :param ga_engine: the configured GA Engine
+    :param nislands: the number of islands
+    :param transport: the :class:`Transport`, local queues by default
+    :param interval: the number of generations between two migrations
+    :param nmigrants: the number of individuals sent at each migration
+    :param freq_stats: passed to the evolve() method of the island 0
+    :param setup: called in each island with its engine and index before the evolution
+    :rtype: the best individual
+
+    """
+    if transport is None:
+        transport = QueueTransport(nislands)
+    results = mp.Queue()
+    procs = []
+    for island in xrange(1, nislands):
+        proc = mp.Process(target=_run_island, args=(ga_engine, island, nislands, transport,
+                                                    interval, nmigrants, setup, results))
+        proc.start()
+        procs.append(proc)
+    logging.debug("%d islands started", nislands)
+
+    runIsland(ga_engine, 0, nislands, transport, interval, nmigrants, freq_stats, setup)
+
+    received = []
+    while len(received) < len(procs):
+        try:
+            received.append(results.get(timeout=1))
+        except Empty:
+            if not any(proc.is_alive() for proc in procs):
+                logging.warning("%d islands ended without results", len(procs) - len(received))
+                break
+    for proc in procs:
+        proc.join()
+
+    for codes in received:
+        ga_engine.insertIndividuals(decodeIndividuals(ga_engine, codes))
+    return ga_engine.bestIndividual()
@@ -0,0 +1,147 @@
+"""
+
+:mod:`Profiler` -- timers and counters of the evolution
+============================================================================
+
+This module contains the instrumentation of the GA loop. The timers and
+counters of the instrumented code are accumulated by a single
+:class:`Profiler` per process, and the GA Engine writes them as one JSON
+line per generation to the trace file given to :func:`enable`. Nothing is
+recorded when the profiler is disabled (the default).
+
+The timers measure self time: the time of the timers running inside
+another one is not counted by the outer timer, so the timers of a
+generation can be summed. The timers of the workers of the evaluation
+pool are not reported, their evaluations are counted in the time of the
+pool call.
+
+Example:
+   >>> Profiler.enable("trace.jsonl")
+   >>> with Profiler.timer("crossover"):
+   >>>    ...
+   >>> Profiler.count("evaluations", 10)
+
+"""
+
+import os
+import json
+from time import time
+from collections import defaultdict
+
+
+class _Timer(object):
+    """ Context manager adding its self time to a timer of the profiler """
+    __slots__ = ('profiler', 'name', 'start', 'inner')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.inner = 0.0
+        self.profiler.stack.append(self)
+        self.start = time()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time() - self.start
+        stack = self.profiler.stack
+        stack.pop()
+        if stack:
+            stack[-1].inner += elapsed
+        self.profiler.timers[self.name] += elapsed - self.inner
+        return False
+
+
+class _NoTimer(object):
+    """ Context manager of the disabled profiler """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOTIMER = _NoTimer()
+
+
+class Profiler(object):
+    """ Profiler Class - Accumulates the timers and counters until they
+    are written to the trace by :meth:`dump` """
+
+    def __init__(self):
+        self.handle = None
+        self.pid = None
+        self.time_init = time()
+        self.stack = []
+        self.gauges = {}
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def enable(self, filename):
+        """ Start recording, the trace is written to filename """
+        self.disable()
+        self.handle = open(filename, 'w')
+        self.pid = os.getpid()
+        self.time_init = time()
+        self.reset()
+
+    def disable(self):
+        """ Stop recording and close the trace """
+        if self.handle is not None and self.pid == os.getpid():
+            self.handle.close()
+        self.handle = None
+
+    def isEnabled(self):
+        return self.handle is not None
+
+    def reset(self):
+        """ Clear the timers and counters """
+        self.timers.clear()
+        self.counters.clear()
+
+    def timer(self, name):
+        """ Return a context manager timing its block in the timer name """
+        if self.handle is None:
+            return _NOTIMER
+        return _Timer(self, name)
+
+    def count(self, name, n=1):
+        """ Add n to the counter name """
+        if self.handle is not None:
+            self.counters[name] += n
+
+    def addGauge(self, name, func):
+        """ Add a value to each record, func is called when the record is
+        written and should return a JSON serializable value """
+        self.gauges[name] = func
+
+    def dump(self, **fields):
+        """ Write a record with the fields, the timers and counters since the
+        last record, then clear them. Only the process that enabled the
+        profiler writes to the trace (not the forked workers or islands) """
+        if self.handle is None or self.pid != os.getpid():
+            return
+        record = dict(fields)
+        record["elapsed"] = time() - self.time_init
+        record["timers"] = dict(self.timers)
+        record["counters"] = dict(self.counters)
+        for name, func in self.gauges.iteritems():
+            record[name] = func()
+        self.handle.write(json.dumps(record, sort_keys=True) + "\n")
+        self.handle.flush()
+        self.reset()
+
+
+# the profiler of this process
+profiler = Profiler()
+
+enable = profiler.enable
+disable = profiler.disable
+isEnabled = profiler.isEnabled
+timer = profiler.timer
+count = profiler.count
+addGauge = profiler.addGauge
+dump = profiler.dump
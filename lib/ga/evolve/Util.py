@@ -10,56 +10,96 @@ use, like list item swap, random utilities and etc.
 
 from random import random as rand_random
 from math import sqrt as math_sqrt
+from collections import OrderedDict
+from bisect import bisect_left
 import logging
 import Consts
 
-def compNextGen(newPop, oldPop, requiredSize):
-    Pstar = list(newPop + oldPop)
-    Waves = []
-    prevlen = len(Pstar)
-    wave_ind = 1
-    dranklist = __computeDominanceRank(Pstar)
-
-    while(True):
-        wave_i = []
-        keeplist = []
-        for i, p in enumerate(Pstar):
-            if dranklist[i]==0:
-                p.fitness = wave_ind
-                wave_i.append(p)
-            else:
-                keeplist.append(p)
-        if len(wave_i) == 0:
-            break
-        Waves.extend(wave_i)
-        Pstar = keeplist
-        
-        newlen = len(Pstar)
-        assert(prevlen > newlen) , "Wrong"
-        newlen = prevlen
-        
-        dranklist = __computeDominanceRank(Pstar)
-        wave_ind += 1
-    
-    for i, p in enumerate(Pstar):
-        p.fitness = wave_ind + dranklist[i]
-        Waves.append(p)
-
-    Waves.sort(key=lambda x: [x.score[-1], x.score[0]])
-    Waves.sort(cmp=cmp_individual_fitness)
-
-    nextPop = Waves[:requiredSize]
-    return nextPop
-
-def __computeDominanceRank(pop):
-    dranklist = []
-    for i, pi in enumerate(pop):
-        drank = 0
-        for pj in pop:
-            if (pj.score[0] < pi.score[0]) and (pj.score[1] < pi.score[1]):
-                drank += 1
-        dranklist.append(drank)
-    return dranklist
+def compNextGen(newPop, oldPop, requiredSize, crowding=False):
+    """ Select the next population among the individuals of newPop and oldPop,
+    for the minimization of their two scores. The individuals are ordered by
+    Pareto front (their fitness is set to the front number, 1 for the
+    non-dominated ones), then by crowding distance if crowding is set, then
+    by their last and first score.
+
+    :param newPop: the offspring individuals
+    :param oldPop: the individuals of the current population
+    :param requiredSize: the size of the next population
+    :param crowding: prefer the individuals in the less crowded regions of their front
+    :rtype: the list of the selected individuals
+
+    """
+    Pstar = list(newPop) + list(oldPop)
+    for p, rank in zip(Pstar, nonDominatedRanks(Pstar)):
+        p.fitness = rank
+
+    if crowding:
+        fronts = {}
+        for p in Pstar:
+            fronts.setdefault(p.fitness, []).append(p)
+        crowd = {}
+        for front in fronts.itervalues():
+            for p, dist in zip(front, crowdingDistance(front)):
+                crowd[id(p)] = dist
+        Pstar.sort(key=lambda x: (x.fitness, -crowd[id(x)], x.score[-1], x.score[0]))
+    else:
+        Pstar.sort(key=lambda x: (x.fitness, x.score[-1], x.score[0]))
+
+    return Pstar[:requiredSize]
+
+def nonDominatedRanks(pop):
+    """ Returns the Pareto front of each individual for the minimization of
+    its two scores, an individual being dominated by another one if both its
+    scores are strictly greater. The individuals are sorted on their first
+    score, then each one is placed with a binary search on the lowest second
+    score of each front found so far, O(N log N) instead of peeling the
+    fronts one at a time.
+
+    :param pop: the list of individuals
+    :rtype: the list of the front numbers (starting at 1)
+
+    """
+    order = sorted(xrange(len(pop)), key=lambda i: pop[i].score[0])
+    ranks = [0] * len(pop)
+    # lowest second score of each front, strictly increasing
+    frontmin = []
+    start = 0
+    while start < len(order):
+        # the individuals with the same first score do not dominate each other
+        end = start + 1
+        while end < len(order) and pop[order[end]].score[0] == pop[order[start]].score[0]:
+            end += 1
+        group = order[start:end]
+        for i in group:
+            ranks[i] = bisect_left(frontmin, pop[i].score[1]) + 1
+        for i in group:
+            rank, s = ranks[i], pop[i].score[1]
+            if rank > len(frontmin):
+                frontmin.append(s)
+            elif s < frontmin[rank - 1]:
+                frontmin[rank - 1] = s
+        start = end
+    return ranks
+
+def crowdingDistance(front):
+    """ Returns the crowding distance of the individuals of a Pareto front:
+    the sum over the two scores of the normalized distance between the two
+    neighbours of the individual, infinite for the extreme individuals.
+
+    :param front: the list of individuals of the front
+    :rtype: the list of distances
+
+    """
+    dist = [0.0] * len(front)
+    for k in (0, 1):
+        order = sorted(xrange(len(front)), key=lambda i: front[i].score[k])
+        low, high = front[order[0]].score[k], front[order[-1]].score[k]
+        dist[order[0]] = dist[order[-1]] = float('inf')
+        if high == low:
+            continue
+        for j in xrange(1, len(order) - 1):
+            dist[order[j]] += (front[order[j + 1]].score[k] - front[order[j - 1]].score[k]) / float(high - low)
+    return dist
 
 
 def randomFlipCoin(p):
@@ -192,6 +232,77 @@ class ErrorAccumulator(object):
         return self.acc_square / float(self.acc_len)
 
 
+class FitnessCache(object):
+    """ A bounded LRU cache of the raw scores of already evaluated genomes,
+    with the encoded genomes they were computed on (the evaluation can
+    change the genome, e.g. optimize the branch lengths of its tree)
+
+    Example:
+       >>> cache = FitnessCache(1000)
+       >>> cache.set(key, [-1020.5, 12.0], genome.encode())
+       >>> score, code = cache.get(key)
+       >>> score
+       [-1020.5, 12.0]
+       >>> cache.hits, cache.misses
+       (1, 0)
+
+    :param maxsize: the maximum number of scores kept
+
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Return a copy of the score cached for key and the encoded genome
+        evaluated, or None
+
+        :param key: the genome cache key
+        """
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # re-insert as the most recently used
+        self.data[key] = value
+        self.hits += 1
+        return list(value[0]), value[1]
+
+    def set(self, key, value, code=None):
+        """ Cache the score of a genome, dropping the least recently used
+        scores when the cache is full
+
+        :param key: the genome cache key
+        :param value: the raw score list
+        :param code: the genome evaluated, as returned by its *encode()*
+        """
+        self.data.pop(key, None)
+        self.data[key] = (tuple(value), code)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        """ Remove all the cached scores and reset the counters """
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """ Return the number of cached scores """
+        return len(self.data)
+
+    def __repr__(self):
+        """ The string representation of the cache """
+        ret = "- FitnessCache\n"
+        ret += "\tSize:\t\t %d/%d\n" % (len(self.data), self.maxsize)
+        ret += "\tHits:\t\t %d\n" % self.hits
+        ret += "\tMisses:\t\t %d\n" % self.misses
+        return ret
+
+
 class Graph(object):
     """ The Graph class
 
@@ -10,9 +10,9 @@ written by Christian S. Perone. Modifications were made on almost all files
 of the package to accomodate it for GaPol.
 
 """
-__all__ = ["Consts", "FunctionSlot",
+__all__ = ["Consts", "EvalPool", "FunctionSlot",
                      "GenomeBase", "GPopulation",
-                     "GSimpleGA", "Scaling", "Selectors",
+                     "GSimpleGA", "Islands", "Profiler", "Scaling", "Selectors",
                      "Statistics", "Util"]
 
 from . import Consts
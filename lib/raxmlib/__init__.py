@@ -1,15 +1,19 @@
 
 # python libraries
-import sys, os, re
-import shutil
+import sys, os
 import subprocess
-import glob
 import tempfile
 import uuid
+import numpy as np
 # import RAxML SWIG module
 import raxml
+from model import LikelihoodModel
+from npmodel import NumpyModel, is_numpy_model
+from scratch import Scratch
+from patterns import SitePatterns, site_patterns
+from output import read_tree_likelihoods, read_log_likelihoods, read_persite_likelihoods
 from ..TreeLib import TreeClass
-from Bio import AlignIO
+from ..ga.evolve import Profiler
 from scipy.stats import norm
 sf = norm.sf
 
@@ -20,93 +24,60 @@ def get_rid_of(listfile):
         except OSError:
             pass
 
-def calculate_likelihood(cmd, title, ext="", basedir=os.path.abspath(os.getcwd()), size=1, log=False):
-    cmd = cmd+ "-n %s -w %s" % (title+ext, basedir)
+def calculate_likelihood(cmd, scratch, run, size=1, log=False):
+    cmd = cmd+ "-n %s -w %s" % (run, scratch.workdir)
     rst = executeCMD(cmd)
-    infofiles = glob.glob("%s/RAxML*.%s" % (basedir,title+ext))
-    trees = []
-    if size == 1 and log :
-        f = [x for x in infofiles if '_log' in x][0]
-        likelihoods = extractLikelihoodFromLog(f, size)
-        trees = [TreeClass(x) for x in infofiles if '_result' in x]
-    else:
-        f = [x for x in infofiles if 'info' in x][0]
-        likelihoods = extractRAXMLikelihood(f, size)
-    get_rid_of(infofiles)
-    return likelihoods, trees
-
-
-def get_bootstrap(cmd, title, ext="", basedir=os.path.abspath(os.getcwd())):
-    cmd = cmd+ "-n %s -w %s" % (title+ext, basedir)
+    with Profiler.timer("lkl_parse"):
+        trees = []
+        if size == 1 and log :
+            likelihoods = read_log_likelihoods(scratch.output('log', run), size)
+            if os.path.exists(scratch.output('result', run)):
+                trees = [TreeClass(scratch.output('result', run))]
+        else:
+            likelihoods = read_tree_likelihoods(scratch.output('info', run), size)
+        scratch.discard(run)
+    return likelihoods.tolist(), trees
+
+
+def calculate_batch_likelihood(cmd, scratch, run, size=1):
+    cmd = cmd+ "-n %s -w %s" % (run, scratch.workdir)
+    rst = executeCMD(cmd)
+    with Profiler.timer("lkl_parse"):
+        likelihoods = read_tree_likelihoods(scratch.output('info', run), size)
+        trees = []
+        if os.path.exists(scratch.output('result', run)):
+            with open(scratch.output('result', run)) as RES_IN:
+                trees.extend(TreeClass(line.strip()) for line in RES_IN if line.strip())
+        scratch.discard(run)
+    return likelihoods.tolist(), trees
+
+
+def get_bootstrap(cmd, scratch, run):
+    cmd = cmd+ "-n %s -w %s" % (run, scratch.workdir)
     rst = executeCMD(cmd)
-    infofiles = glob.glob("%s/RAxML*.%s" % (basedir,title+ext))
-    boot_file = [x for x in infofiles if 'RAxML_bootstrap' in x][0]
     trees = []
-    with open(boot_file) as BOOT_IN:
+    with open(scratch.output('bootstrap', run)) as BOOT_IN:
         for line in BOOT_IN:
             trees.append(TreeClass(line.strip()))
-    get_rid_of(infofiles)
+    scratch.discard(run)
     return trees
 
 
-def compute_sh_test(cmd, title,ext="", basedir=os.path.abspath(os.getcwd())):
-    cmd = cmd+ "-n %s -w %s" % (title+ext, basedir)
-    rst = executeCMD(cmd)
-    infofiles = glob.glob("%s/RAxML*.%s" % (basedir,title+ext))
-    f = [x for x in infofiles if 'info' in x][0]
-    results = extractSHTest(f)  
-    get_rid_of(infofiles)
-    return results
-
-def run_consel(inputfile, type, sort=9, basedir=os.getcwd(), basename="RAxML_perSiteLLs"):
-    fname = os.path.join(basedir, basename)
-    makermtcmd = "makermt --%s %s %s" % (type, inputfile, fname)
-    conselcmd = "consel %s" % fname
-    catpvcmd = "catpv %s > %s-pv.txt" % (fname, fname)
-    if sort:
-        catpvcmd += " -s %s" % sort
-    executeCMD(makermtcmd)
-    executeCMD(conselcmd)
-    executeCMD(catpvcmd)
-    conselOut = fname + "-pv.txt"
-    return parseConselOutfile(conselOut, sort)
-
-def parseConselOutfile(file, sort):
-    title = []
-    content = []
-    first = True
-    with open(file, 'r') as CONSELOUT:
-        for line in CONSELOUT:
-            if(line.startswith('#')):
-                if first and 'reading' not in line and ("%s+" % sort not in line):
-                    title.extend(
-                        line.replace('#', '').replace('|', '').strip().split())
-                    first = False
-                elif not first:
-                    values = line.replace('#', '').replace(
-                        '|', '').strip().split()
-                    content.append([float(x) for x in values])
-    return dict(zip(title, zip(*content)))
-
-
-def consel(cmd, title, ext="", basedir=os.getcwd(), sort=9):
-    title = "consel"+title
-    cmd = cmd+ " -n %s -w %s" % (title+ext, basedir)
-    # run raxml
+def persite_likelihood(cmd, scratch, run, size):
+    cmd = cmd+ " -n %s -w %s" % (run, scratch.workdir)
     executeCMD(cmd)
-    infofiles = glob.glob("%s/RAxML*.%s" % (basedir,title+ext))
-    cons_input = glob.glob("%s/RAxML_perSiteLLs.%s" % (basedir,title+ext))[0]
-    # run consel
-    consel_output = run_consel(cons_input, 'puzzle', sort=sort, basedir=basedir, basename=title+ext)
-    infofiles.extend(glob.glob("%s/*%s*" % (basedir, title+ext)))
-    get_rid_of(infofiles)
-    return consel_output
+    with Profiler.timer("lkl_parse"):
+        lnl = read_persite_likelihoods(scratch.output('perSiteLLs', run), size)
+    scratch.discard(run)
+    return lnl
 
 
 def executeCMD(cmd, dispout=False):
-    p = subprocess.Popen(
-        cmd, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-    out, err = p.communicate()
+    Profiler.count("raxml_calls")
+    with Profiler.timer("lkl_spawn"):
+        p = subprocess.Popen(
+            cmd, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        out, err = p.communicate()
     #print "STDERR\n---------\n", err
     if dispout:
         #print("\nSTDOUT\n---------\n", out)
@@ -115,220 +86,211 @@ def executeCMD(cmd, dispout=False):
         print(out)
     return err
 
-def extractLikelihoodFromLog(filename, n):
-    lkls = []
-    with open(filename) as IN:
-        for line in IN:
-            lkls.append(float(line.strip().split()[-1]))
-            n -= 1
-            if n <= 0:
-                break
-    return lkls
-
-def extractRAXMLikelihood(filename, n):
-    likelihoods = []
-
-    with open(filename) as IN:
-        patern = re.compile('Tree [0-9]+: ')
-        for line in reversed(IN.readlines()):
-            if (patern.match(line)):
-                likelihoods.append(float(line.split(':')[1].strip()))
-                n -= 1
-            if(n <= 0):
-                break
-    return list(reversed(likelihoods))
-
-
-def extractSHTest(filename):
-    bestLK, treeLK = 0, 0
-    alpha5, alpha2, alpha1 = False, False, False
-    
-    with open(filename) as IN:
-        patern = re.compile('Model optimization, best Tree:')
-        prevpatern = re.compile('Likelihood:')
-        previous_line = ""
-        for i, line in enumerate(reversed(IN.readlines())):
-            if (patern.match(line)):
-                bestLK = float(line.split(':')[-1].strip())
-                if not prevpatern.search(previous_line):
-                    raise IndexError("Cannot parse raxml info file")
-                lline = previous_line.split(":")
-                treeLK = float(lline[2].rstrip("D(LH)").strip())
-                alpha5, alpha2, alpha1 = [not x.strip().upper().startswith("YES") for x in lline[5].split(",")]
-                break
-            previous_line = line
-    return bestLK, treeLK, alpha5, alpha2, alpha1                        
-    
+def write_patterns(model, alignment):
+    """Write the site patterns of the alignment and their weights once in
+    the scratch directory of the model, as the input of raxml (-s and -a)"""
+    model.patterns = site_patterns(alignment)
+    model.alignment = model.scratch.filename("patterns.phy")
+    model.weightfile = model.scratch.filename("patterns.weights")
+    model.patterns.write_phylip(model.alignment)
+    model.patterns.write_weights(model.weightfile)
+    model.data = "-s %s -a %s" % (model.alignment, model.weightfile)
+
+
+class LklModel(LikelihoodModel):
+    """computes statitic using raxml command line
 
-class LklModel():
-    """computes statitic using raxml command line"""
-    def __init__(self, alignment, cmd="raxmlHPC-SSE3", model="GTRGAMMA", eps=2.0, title="test", extra_string="", reestimate=True):
-        self.alignment = alignment
+    The alignment, the trees and the raxml outputs are written in a
+    Scratch directory, under scratch (a RAM-backed directory by default)"""
+    def __init__(self, alignment, cmd="raxmlHPC-SSE3", model="GTRGAMMA", eps=2.0, title="test", extra_string="", reestimate=True, scratch=None):
         self.cmd = cmd
-        fd, self.alignment = tempfile.mkstemp('.align')
-        os.close(fd)
-        AlignIO.write(alignment, self.alignment, format="phylip-relaxed")
+        self.title  = title
+        self.scratch = Scratch("gatc_" + self.title, scratch)
+        write_patterns(self, alignment)
         self.model = model
         self.reestimate = reestimate
         self.eps = eps
-        self.title  = title
         self.extra = extra_string 
         self.currLH = 0
-        self.wdir = os.path.join(os.path.abspath(os.getcwd()), '.tmp_'+self.title)
-        if not os.path.exists(self.wdir):
-            try:
-                os.makedirs(self.wdir)
-            except OSError:
-                pass
-
-        get_rid_of(glob.glob("%s/RAxML*.%s*" % (self.wdir,self.title)))
 
     def __del__(self):
-        # release wdir garbage
-        os.remove(self.alignment)
-        shutil.rmtree(self.wdir, ignore_errors=True)
-        #get_rid_of(glob.glob("%s/RAxML*.%s*" % (self.wdir,self.title)))
+        # release scratch garbage
+        self.scratch.close()
 
-    def _build_lkl_line(self, treefile, consel=False, forcelog=False):
+    def _build_lkl_line(self, treefile, persite=False, forcelog=False):
         use_log = False
         if forcelog:
             bcmd = "-f e -t "
             use_log = True
         elif self.reestimate:
-            if consel:
+            if persite:
                 bcmd = "-f G -z" 
             else:
                 use_log = True
                 bcmd = "-f e -t "
         else:
             bcmd = "-f g -z "
-        cmdline = "%s %s %s -s %s -m %s %s"%(self.cmd, bcmd, treefile, self.alignment, self.model, self.extra)
+        cmdline = "%s %s %s %s -m %s %s"%(self.cmd, bcmd, treefile, self.data, self.model, self.extra)
         return cmdline, use_log     
 
-    def _build_treecomp_line(self, besttree, othertree):
-        cmdline = "%s -f h -t %s -z %s -s %s -m %s %s"%(self.cmd, besttree, othertree, self.alignment, self.model, self.extra)
-        return cmdline
-
-    def optimize_model(self, gtree, **args):
-        """Optimizes the RAxML model"""
-        fd, treefile = tempfile.mkstemp('.tree')
-        os.close(fd)
-        size = 1
-        if isinstance(gtree, list):
-            size = len(gtree)
+    def _write_trees(self, run, gtrees):
+        """Write the trees of the run in the scratch directory"""
+        with Profiler.timer("lkl_io"):
+            treefile = self.scratch.filename(run + ".trees")
             with open(treefile, 'w') as GOUT:
-                for gt in gtree:
+                for gt in gtrees:
                     GOUT.write(gt.write()+"\n")
-        else:
-            gtree.write(outfile=treefile)
+        return treefile
 
+    def optimize_model(self, gtree, **args):
+        """Optimizes the RAxML model"""
+        run = self.scratch.run_name()
+        gtrees = gtree if isinstance(gtree, list) else [gtree]
+        treefile = self._write_trees(run, gtrees)
         cmdline, use_log = self._build_lkl_line(treefile, forcelog=args.get('forcelog', False))
-        self.currLH, best_trees = calculate_likelihood(cmdline, self.title, ext=args.get("ext", uuid.uuid4().hex[:5]), basedir=self.wdir, size=size, log=use_log)
-        #print treefile
-        os.remove(treefile)
+        self.currLH, best_trees = calculate_likelihood(cmdline, self.scratch, run, size=len(gtrees), log=use_log)
+        self.scratch.discard(run, treefile)
 
         if args.get('expect_tree', False):
             return self.currLH, best_trees
         return self.currLH,  None
 
+    def optimize_batch(self, gtrees, **args):
+        """Optimizes the branch lengths of all the trees in a single RAxML run
+        and return their likelihoods and the optimized trees. With reestimate,
+        the model parameters are re-estimated on each tree (-f N), as with a
+        -f e run per tree; otherwise they are estimated on the first tree
+        only (-f n)"""
+        run = self.scratch.run_name("batch")
+        treefile = self._write_trees(run, gtrees)
+        bcmd = "-f N" if self.reestimate else "-f n"
+        cmdline = "%s %s -z %s %s -m %s %s"%(self.cmd, bcmd, treefile, self.data, self.model, self.extra)
+        self.currLH, best_trees = calculate_batch_likelihood(cmdline, self.scratch, run, size=len(gtrees))
+        self.scratch.discard(run, treefile)
+        return self.currLH, best_trees
+
     def print_raxml_tree(self, *args, **kargs):
         """Draw raxml tr -- adef and tr must have been previously defined"""
         print(self.curr_LH)
     
     def generate_bootstrap(self, nboot, **kwargs):
         """Generate bootstrap replicate for the sequence alignment"""            
-        bcmd = "%s -m %s -p 12345 -x 12345 -N %d -s %s "%(self.cmd, self.model, nboot, self.alignment) 
-        btrees = get_bootstrap(bcmd, self.title, ext=kwargs.get("ext", uuid.uuid4().hex[:3])+"_boot", basedir=self.wdir)
+        bcmd = "%s -m %s -p 12345 -x 12345 -N %d %s "%(self.cmd, self.model, nboot, self.data) 
+        btrees = get_bootstrap(bcmd, self.scratch, self.scratch.run_name("boot"))
         return btrees
 
-    def compute_consel_test(self, *args, **kwargs):
-        """Compute consel output for a bunch of trees in argument"""
-        # start by building a file with th two trees
-        fd, treefile = tempfile.mkstemp('.trees')
-        alpha = kwargs.get('alpha', 0.05)
-        # get query tree position
-        # best tree at second position by default
-        accept = True
-        querypos = kwargs.get('querypos', 1)
-        compare_np = kwargs.get('compare_np', False)
-        os.close(fd)
-        trees = []
-        for t in args:
-            trees.append(t.write())
-        with open(treefile, 'w') as IN:
-            IN.write("\n".join(trees))
-        cmdline, _ = self._build_lkl_line(treefile, consel=True)
-        consel_output = consel(cmdline, self.title, ext=kwargs.get('ext',uuid.uuid4().hex[:5]), basedir=self.wdir)
-        os.remove(treefile)
-        if compare_np:
-            item_pos = [int(x) for x in consel_output['item']].index(querypos)
-            accept = abs(consel_output['np'][0] - consel_output['np'][item_pos]) < alpha*2
-
-        return all([x > alpha for x in consel_output['au']]) and accept
+    def site_likelihoods(self, trees):
+        """Site log-likelihoods of the trees, from a single RAxML run"""
+        run = self.scratch.run_name("persite")
+        treefile = self._write_trees(run, trees)
+        cmdline, _ = self._build_lkl_line(treefile, persite=True)
+        lnl = persite_likelihood(cmdline, self.scratch, run, len(trees))
+        self.scratch.discard(run, treefile)
+        if lnl.shape[1] == len(self.patterns):
+            return lnl, self.patterns.weights.astype(float)
+        # one value per site of the alignment
+        return lnl, None
     
-    def compute_lik_test(self, besttree, tree, test="SH", alpha=0.05):
-        """Compute sh test between two trees"""
-        fd, besttreefile = tempfile.mkstemp('.btree')
-        os.close(fd)
-        fd, curtreefile = tempfile.mkstemp('.tree')
-        os.close(fd)
-        besttree.write(besttreefile)
-        tree.write(curtreefile)
-        cmdline  =  self._build_treecomp_line(besttreefile, curtreefile)
-        if test == 'SH':
-            bestlk, treelk, p5, p2, p1 = compute_sh_test(cmdline, self.title, ext=uuid.uuid4().hex[:5], basedir=self.wdir)
-        else:
-            raise NotImplementedError("%s test statistic not implemented" % test)
-        os.remove(curtreefile)
-        os.remove(besttreefile)
-        p = {0.05:p5, 0.02:p2, 0.01:p1}
-        return bestlkl, p.get(alpha, p5), treelk - bestlkl
-
     def __eq__(self, other):
         return (self.alignment == other.alignment) and (self.model == other.model) and (self.cmd == other.cmd)
         
       
 
-class RAxMLModel():
-    """Computes test statistics using RAxML site-wise likelihoods"""
+class RAxMLModel(LikelihoodModel):
+    """Computes test statistics using RAxML site-wise likelihoods
 
-    def __init__(self, alignment, model="GTRGAMMA", eps=2.0, title="", extra_string=""):
+    The alignment and the model are loaded only once in the RAxML library,
+    at the first call to optimize_model. Subsequent trees are scored on the
+    resident data, without spawning any process."""
+
+    def __init__(self, alignment, model="GTRGAMMA", eps=2.0, title="", extra_string="", reestimate=True, scratch=None):
         """Initializes the RAxML model"""
         self._raxml = RAxML()
         self.model = model
-        self.alignment = alignment
-        self.reestimate = True
-        fd, self.alignment = tempfile.mkstemp('.align')
-        os.close(fd)
-        AlignIO.write(alignment, self.alignment, format="phylip-relaxed")
-
+        self.reestimate = reestimate
         self.eps = eps
         self.title = title
         if not title:
             self.title = uuid.uuid4().hex[:5]
+        self.scratch = Scratch("gatc_" + self.title, scratch)
+        write_patterns(self, alignment)
         self.extra = extra_string
+        # data and model optimized on the reference tree of the tests
+        self._tests = None
 
     def __del__(self):
         """Cleans up the RAxML model"""
         del self._raxml
-        os.remove(self.alignment)
+        del self._tests
+        self.scratch.close()
 
 
-    def optimize_model(self, gtree, **args):
-        """Optimizes the RAxML model"""
-        fd, treefile = tempfile.mkstemp('.tree')
-        os.close(fd)
+    def _load(self, gtree, wrapper=None, title=None):
+        """Loads the alignment and the model, using gtree as starting tree"""
+        # unique name, the forked workers share the scratch directory
+        run = self.scratch.run_name("start")
+        treefile = self.scratch.filename(run + ".tree")
         gtree.write(outfile=treefile)
-        self._raxml.optimize_model(treefile, self.alignment,
-                                   "-m %s -e %s -n %s %s" % (self.model, self.eps, self.title+args.get("ext", ""), self.extra))
-        os.remove(treefile)
-        return self._raxml.best_LH, None
+        try:
+            (wrapper or self._raxml).load_data(treefile, self.alignment,
+                                               "-a %s -m %s -e %s -n %s %s" % (self.weightfile, self.model, self.eps, title or self.title, self.extra))
+        finally:
+            self.scratch.discard(run, treefile)
 
-    def compute_lik_test(self, besttree, tree, test="SH", alpha=0.05):
-        """Computes the test statistic 'stat' using RAxML likelihoods"""
-        bestlk = self.optimize_model(besttree)
-        pval, dnl = self._raxml.compute_lik_test(tree, test)
-        return bestlk, pval>alpha, dnl
+    def optimize_model(self, gtree, **args):
+        """Optimizes the RAxML model"""
+        trees = gtree if isinstance(gtree, list) else [gtree]
+        if not self._raxml.loaded:
+            self._load(trees[0])
+        likelihoods = []
+        best_trees = []
+        for gt in trees:
+            Profiler.count("raxml_calls")
+            with Profiler.timer("lkl_library"):
+                likelihoods.append(self._raxml.evaluate_tree(gt, reestimate=self.reestimate))
+            if args.get('expect_tree', False):
+                with Profiler.timer("lkl_parse"):
+                    best_trees.append(TreeClass(self._raxml.tree_to_string()))
+
+        if not isinstance(gtree, list):
+            likelihoods = likelihoods[0]
+        return likelihoods, (best_trees or None)
+
+    def optimize_batch(self, gtrees, **args):
+        """Optimizes the branch lengths of all the trees on the loaded data
+        and return their likelihoods and the optimized trees"""
+        likelihoods, best_trees = self.optimize_model(list(gtrees), expect_tree=True)
+        return likelihoods, best_trees or []
+
+    def site_likelihoods(self, trees):
+        """Log-likelihoods of the alignment patterns of the trees, with the
+        pattern counts. The model is optimized on the first tree (as raxml -f g)"""
+        if not self._raxml.loaded:
+            self._load(trees[0])
+        lnl = []
+        for i, gt in enumerate(trees):
+            Profiler.count("raxml_calls")
+            with Profiler.timer("lkl_library"):
+                lnl.append(self._raxml.site_likelihoods(gt, reestimate=(i == 0)))
+        return np.array(lnl), np.array(self._raxml.site_weights(), dtype=float)
+
+    def _reference_site_likelihoods(self, reference):
+        """The tests use their own copy of the data, with the model optimized
+        once on the reference tree: optimize_model does not change it"""
+        self._tests = RAxML()
+        Profiler.count("raxml_calls")
+        with Profiler.timer("lkl_library"):
+            self._load(reference, self._tests, self.title + "_tests")
+            lnl = self._tests.site_likelihoods(reference)
+        return np.array(lnl), np.array(self._tests.site_weights(), dtype=float)
+
+    def _other_site_likelihoods(self, reference, trees):
+        lnl = []
+        for gt in trees:
+            Profiler.count("raxml_calls")
+            with Profiler.timer("lkl_library"):
+                lnl.append(self._tests.site_likelihoods(gt))
+        return np.array(lnl), np.array(self._tests.site_weights(), dtype=float)
 
     def print_raxml_tree(self, *args, **kargs):
         """Draw raxml tr -- adef and tr must have been previously defined"""
@@ -354,6 +316,8 @@ class RAxML:
         raxml.init_adef(self.adef)
         self.tr = raxml.new_tree()
         self.optimal = False
+        self.loaded = False
+        self.seqfile = None
         self.best_LH = None; self.weight_sum = None; self.best_vector = None
 
     def __del__(self):
@@ -376,11 +340,16 @@ class RAxML:
         raxml.read_tree(fr, self.tr, self.adef)
         fr.close()
 
+    def tree_to_string(self):
+        """Return the newick of the current raxml tr, with its branch lengths"""
+        return raxml.tree_to_string(self.tr, self.adef)
+
     #=========================================
     # model optimization
 
-    def optimize_model(self, treefile, seqfile, extra="-m GTRGAMMA -n test"):
-        """Optimizes the RAxML model"""
+    def load_data(self, treefile, seqfile, extra="-m GTRGAMMA -n test"):
+        """Loads the alignment and optimizes the model on the tree in treefile.
+        The data stay in memory until the wrapper is deleted"""
 
         # default model to use is GTRGAMMA
         # initialize parameters based on input
@@ -388,9 +357,14 @@ class RAxML:
               (treefile, seqfile, extra)
         raxml.init_program(self.adef, self.tr, cmd.split(' '))
 
-        # optimize
+        # read data and optimize
         raxml.optimize_model(self.adef, self.tr)
+        self.loaded = True
+        self.seqfile = seqfile
+        self._set_best()
 
+    def _set_best(self):
+        """Set the current tr as the reference for the likelihood tests"""
         # reset best LH
         if self.best_vector is not None:
             raxml.delete_best_vector(self.best_vector)
@@ -399,6 +373,44 @@ class RAxML:
         # set flags
         self.optimal = True
 
+    def evaluate_tree(self, tree, reestimate=False):
+        """Score a treelib tree on the loaded data and return its likelihood.
+        Branch lengths are always optimized, the model parameters only
+        if reestimate is set"""
+        if not self.loaded:
+            raise Exception("No data loaded: call load_data.\n")
+        fp = tempfile.TemporaryFile()
+        fp.write(tree.write() + "\n")
+        fp.seek(0)
+        lh = raxml.evaluate_tree(self.adef, self.tr, fp, int(reestimate))
+        fp.close()
+        return lh
+
+    def site_likelihoods(self, tree, reestimate=False):
+        """Score a treelib tree on the loaded data and return the
+        log-likelihoods of the alignment patterns"""
+        self.evaluate_tree(tree, reestimate)
+        return raxml.site_LH(self.tr)
+
+    def site_weights(self):
+        """Number of sites of each alignment pattern"""
+        return raxml.site_weights(self.tr)
+
+    def set_best_tree(self, tree):
+        """Optimize the model on tree and use it as reference for the tests"""
+        self.evaluate_tree(tree, reestimate=True)
+        self._set_best()
+        return self.best_LH
+
+    def optimize_model(self, treefile, seqfile, extra="-m GTRGAMMA -n test"):
+        """Optimizes the RAxML model"""
+        if self.loaded and self.seqfile == seqfile:
+            with open(treefile) as fp:
+                raxml.evaluate_tree(self.adef, self.tr, fp, 1)
+            self._set_best()
+        else:
+            self.load_data(treefile, seqfile, extra)
+
     #=========================================
     # test statistics
 
@@ -0,0 +1,154 @@
+import numpy as np
+from collections import OrderedDict
+from treetests import RellBootstrap, topology_tests
+from ..TreeLib import TreeUtils
+from ..ga.evolve import Profiler
+
+# number of site log-likelihood vectors kept for the tests
+SITE_CACHE_SIZE = 1000
+
+
+class LikelihoodModel(object):
+    """Interface of the sequence likelihood models scoring the trees of the GA
+
+    The GA only uses optimize_model (and optimize_batch when reestimate is
+    set), the other methods are used by the stopping criteria and the
+    initial trees construction. The likelihoods are log-likelihoods, higher
+    is better.
+
+    """
+    # set when the branch lengths of the trees are optimized with the model,
+    # the GA then evaluates the whole population with optimize_batch
+    reestimate = False
+    title = ""
+    # RELL replicates of the tests, drawn at the first test
+    _rell = None
+    # site log-likelihoods of the trees already tested, by topology
+    _site_cache = None
+    _site_reference = None
+    _site_weights = None
+
+    def optimize_model(self, gtree, **args):
+        """Score a tree, or a list of trees
+
+        :param gtree: a TreeClass or a list of TreeClass
+        :param expect_tree: also return the trees with their branch lengths
+        :rtype: (the log-likelihood or the list of log-likelihoods, the trees or None)
+
+        """
+        raise NotImplementedError
+
+    def optimize_batch(self, gtrees, **args):
+        """Optimize the branch lengths of all the trees
+
+        :rtype: (the list of log-likelihoods, the list of trees)
+
+        """
+        raise NotImplementedError
+
+    def site_likelihoods(self, trees):
+        """Site log-likelihoods of the trees, used by the topology tests
+
+        :rtype: (array of shape (ntrees, ncolumns), the number of sites of
+                 each column, or None for one site per column)
+
+        """
+        raise NotImplementedError("%s does not compute the site likelihoods" % self.__class__.__name__)
+
+    def _reference_site_likelihoods(self, reference):
+        """Site log-likelihoods of the reference tree of the tests, with the
+        number of sites of each column"""
+        lnl, weights = self.site_likelihoods([reference])
+        return lnl[0], weights
+
+    def _other_site_likelihoods(self, reference, trees):
+        """Site log-likelihoods of the trees, with the model optimized on the
+        reference tree. The reference is scored again with the trees"""
+        lnl, weights = self.site_likelihoods([reference] + trees)
+        return lnl[1:], weights
+
+    def cached_site_likelihoods(self, trees):
+        """Site log-likelihoods of the trees, the first one is the reference
+        of the tests (the known best tree). Its vector is computed once for
+        the run, and the vectors of the other trees are cached by topology,
+        so only the new topologies are scored
+
+        :rtype: as site_likelihoods
+
+        """
+        keys = [TreeUtils.canonicalTreeHash(t) for t in trees]
+        if self._site_cache is None or self._site_reference != keys[0]:
+            lnl, self._site_weights = self._reference_site_likelihoods(trees[0])
+            self._site_cache = OrderedDict([(keys[0], lnl)])
+            self._site_reference = keys[0]
+        cache = self._site_cache
+        missing = OrderedDict((key, t) for key, t in zip(keys, trees) if key not in cache)
+        Profiler.count("site_cache_hits", len(keys) - len(missing))
+        if missing:
+            lnl, _ = self._other_site_likelihoods(trees[0], missing.values())
+            cache.update(zip(missing.keys(), lnl))
+        rows = []
+        # most recently used last, the reference is never dropped
+        for key in keys[1:] + keys[:1]:
+            rows.append(cache.pop(key))
+            cache[key] = rows[-1]
+        rows.insert(0, rows.pop())
+        while len(cache) > SITE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return np.array(rows), self._site_weights
+
+    def topology_tests(self, *trees):
+        """KH, SH and AU tests of the trees, computed as consel (see treetests).
+        The first tree is the reference of cached_site_likelihoods
+
+        :rtype: a dict of arrays in the order of the trees, with the keys obs,
+                au, np, bp, pp, kh and sh
+
+        """
+        return self._topology_tests(*self.cached_site_likelihoods(list(trees)))
+
+    def _topology_tests(self, lnl, weights):
+        if weights is None:
+            weights = np.ones(len(lnl[0]))
+        if self._rell is None or not np.array_equal(self._rell.weights, weights):
+            self._rell = RellBootstrap(weights)
+        return topology_tests(lnl, self._rell)
+
+    def compute_lik_test(self, besttree, tree, test="SH", alpha=0.05):
+        """Test if tree is significantly worse than besttree (SH or KH test)
+
+        :rtype: (the log-likelihood of besttree, True if tree is not rejected,
+                 the log-likelihood difference)
+
+        """
+        if test not in ("SH", "KH"):
+            raise NotImplementedError("%s test statistic not implemented" % test)
+        lnl, weights = self.cached_site_likelihoods([besttree, tree])
+        tests = self._topology_tests(lnl, weights)
+        bestlk, treelk = np.dot(lnl, self._rell.weights)
+        return bestlk, tests[test.lower()][1] > alpha, treelk - bestlk
+
+    def compute_consel_test(self, *trees, **kwargs):
+        """AU test of the trees, True if none is rejected
+
+        :param alpha: level of the test
+        :param compare_np: also reject if the naive p-value of the tree at
+            position querypos (from 1) is not within 2*alpha of the naive
+            p-value of the best tree
+
+        """
+        alpha = kwargs.get('alpha', 0.05)
+        querypos = kwargs.get('querypos', 1)
+        tests = self.topology_tests(*trees)
+        accept = True
+        if kwargs.get('compare_np', False):
+            best = np.argmin(tests['obs'])
+            accept = abs(tests['np'][best] - tests['np'][querypos - 1]) < alpha*2
+        return bool(np.all(tests['au'] > alpha)) and accept
+
+    def generate_bootstrap(self, nboot, **kwargs):
+        """Return nboot trees built from bootstrap replicates of the alignment"""
+        raise NotImplementedError("%s can not build bootstrap trees" % self.__class__.__name__)
+
+    def print_raxml_tree(self, *args, **kwargs):
+        raise NotImplementedError
@@ -0,0 +1,298 @@
+"""Sequence likelihood of the trees computed with NumPy, without the raxml
+binaries or library.
+
+The trees are scored on the site patterns of the alignment (see patterns)
+by Felsenstein pruning under JC69 (the Poisson model for proteins) or GTR,
+with or without a discrete gamma model of rate variation, or by their
+Fitch parsimony length. Neither the model parameters nor the
+branch lengths are optimized: the base frequencies and the GTR rates are
+estimated once from the alignment, and the branch lengths of each tree are
+given by the changes of its parsimony reconstruction. The scores are meant
+to rank many trees quickly, before a refinement with raxml.
+"""
+
+import numpy as np
+from scipy.special import gammainc
+from scipy.stats import gamma as gammadist
+from ..ga.evolve import Profiler
+from model import LikelihoodModel
+from patterns import site_patterns
+
+DNA_STATES = "ACGT"
+PROTEIN_STATES = "ARNDCQEGHILKMFPSTWYV"
+# IUPAC ambiguity codes, the other characters (gaps, N, X, ?) are missing data
+DNA_AMBIGUITY = {'U': 'T', 'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+                 'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG'}
+PROTEIN_AMBIGUITY = {'B': 'ND', 'Z': 'QE', 'J': 'IL'}
+MIN_BRLEN = 1e-6
+# number of sequence pairs compared to estimate the GTR rates
+GTR_PAIRS = 2000
+
+# model name: (substitution model, gamma rate categories)
+MODELS = {'JC69': ('JC69', 1), 'JC69GAMMA': ('JC69', 4),
+          'GTR': ('GTR', 1), 'GTRGAMMA': ('GTR', 4),
+          'PARS': ('PARS', 0)}
+PREFIX = "NP-"
+
+
+def is_numpy_model(name):
+    """True if the --seqmodel name selects a NumpyModel (NP-JC69, NP-GTRGAMMA, ...)"""
+    return bool(name) and name.upper().startswith(PREFIX)
+
+
+def encode_patterns(patterns, datatype='dna'):
+    """Encode the site patterns of the alignment as bit masks of their
+    possible states
+
+    :rtype: (the (nseqs, npatterns) masks, the states)
+
+    """
+    states = DNA_STATES if datatype == 'dna' else PROTEIN_STATES
+    ambiguity = DNA_AMBIGUITY if datatype == 'dna' else PROTEIN_AMBIGUITY
+    table = np.empty(256, dtype=np.uint32)
+    table.fill((1 << len(states)) - 1)
+    for i, state in enumerate(states):
+        table[ord(state)] = table[ord(state.lower())] = 1 << i
+    for code, chars in ambiguity.items():
+        mask = sum(1 << states.index(c) for c in chars)
+        table[ord(code)] = table[ord(code.lower())] = mask
+    return table[patterns.columns], states
+
+
+def gamma_rates(alpha, ncat):
+    """Mean rates of the ncat equiprobable categories of a gamma distribution of mean 1"""
+    if ncat <= 1:
+        return np.ones(1)
+    bounds = gammadist.ppf(np.arange(1, ncat) / float(ncat), alpha, scale=1.0/alpha)
+    cdf = np.concatenate(([0.0], gammainc(alpha + 1, bounds*alpha), [1.0]))
+    return np.diff(cdf)*ncat
+
+
+def lowest_state(masks):
+    """Lowest state of each mask"""
+    return masks & (~masks + np.uint32(1))
+
+
+class SubstitutionModel(object):
+    """Reversible substitution model, with the eigen decomposition of its
+    rate matrix (normalized to one substitution per unit of time)"""
+
+    def __init__(self, freqs, exchange=None):
+        k = len(freqs)
+        rates = np.ones((k, k)) if exchange is None else np.array(exchange, dtype=np.float)
+        np.fill_diagonal(rates, 0)
+        Q = rates*freqs[None, :]
+        np.fill_diagonal(Q, -Q.sum(axis=1))
+        Q /= -np.dot(freqs, np.diag(Q))
+        # symmetric form D^1/2 Q D^-1/2 of the reversible matrix
+        sq = np.sqrt(freqs)
+        evals, U = np.linalg.eigh(sq[:, None]*Q/sq[None, :])
+        self.freqs = freqs
+        self.evals = evals
+        self.left = U/sq[:, None]
+        self.right = U.T*sq[None, :]
+
+    def probs(self, t, rates):
+        """Transposed transition probabilities P(t*r).T of each rate r, (ncat, k, k)"""
+        expl = np.exp(self.evals[None, :]*(t*rates)[:, None])
+        P = np.matmul(self.left[None, :, :]*expl[:, None, :], self.right)
+        return np.maximum(P, 0).transpose(0, 2, 1)
+
+
+class NumpyModel(LikelihoodModel):
+    """Scores the trees with the likelihood computed by NumpyModel, see the
+    module documentation. The model is one of MODELS (PARS for the parsimony
+    length, reported as a negative score)."""
+
+    def __init__(self, alignment, model="GTRGAMMA", datatype='dna', alpha=1.0, brlen='pars', title="", reestimate=False):
+        name = model.upper()
+        if name.startswith(PREFIX):
+            name = name[len(PREFIX):]
+        if name not in MODELS:
+            raise ValueError("Unknown model %s, expected one of %s" % (model, ", ".join(PREFIX + x for x in sorted(MODELS))))
+        subst, ncat = MODELS[name]
+        if subst == 'GTR' and datatype != 'dna':
+            raise ValueError("The GTR model is only available for nucleotides")
+        self.alignment = alignment
+        self.model = name
+        self.title = title
+        self.reestimate = reestimate
+        self.brlen = brlen
+        self.currLH = 0
+        self.patterns = site_patterns(alignment)
+        self.names = self.patterns.names
+        self.masks, self.states = encode_patterns(self.patterns, datatype)
+        self.weights = self.patterns.weights.astype(np.float)
+        self.site_pattern = self.patterns.site_pattern
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.nsites = self.weights.sum()
+        self.nstates = len(self.states)
+        self.parsimony = (subst == 'PARS')
+        if not self.parsimony:
+            self.freqs = self._state_freqs()
+            exchange = self._gtr_rates() if subst == 'GTR' else None
+            self.submodel = SubstitutionModel(self.freqs, exchange)
+            self.rates = gamma_rates(alpha, ncat)
+            self.catweights = np.ones(len(self.rates)) / len(self.rates)
+            bits = np.arange(self.nstates, dtype=np.uint32)
+            self.tips = ((self.masks[:, :, None] >> bits) & 1).astype(np.float)
+
+    def _unambiguous(self):
+        """State index of each (sequence, pattern), -1 when ambiguous"""
+        codes = np.empty(self.masks.shape, dtype=np.int64)
+        codes.fill(-1)
+        for i in xrange(self.nstates):
+            codes[self.masks == (1 << i)] = i
+        return codes
+
+    def _state_freqs(self):
+        codes = self._unambiguous()
+        counts = np.ones(self.nstates)
+        for i in xrange(self.nstates):
+            counts[i] += np.dot((codes == i).sum(axis=0), self.weights)
+        return counts / counts.sum()
+
+    def _gtr_rates(self):
+        """Exchangeabilities estimated from the differences between pairs of
+        sequences (all the pairs, or GTR_PAIRS random ones)"""
+        n = len(self.names)
+        codes = self._unambiguous()
+        first, second = np.triu_indices(n, 1)
+        if len(first) > GTR_PAIRS:
+            pick = np.random.RandomState(len(first)).choice(len(first), GTR_PAIRS, replace=False)
+            first, second = first[pick], second[pick]
+        a, b = codes[first], codes[second]
+        valid = (a >= 0) & (b >= 0)
+        k = self.nstates
+        pairs = np.bincount((a*k + b)[valid], weights=np.broadcast_to(self.weights, a.shape)[valid], minlength=k*k)
+        pairs = pairs.reshape(k, k)
+        exchange = (pairs + pairs.T + 1.0) / np.outer(self.freqs, self.freqs)
+        return exchange / exchange[-1, -2]
+
+    def _leaf(self, node):
+        try:
+            return self.index[node.name]
+        except KeyError:
+            raise ValueError("Leaf %s is not in the alignment" % node.name)
+
+    def _fitch(self, tree):
+        """Fitch parsimony: the number of changes of each pattern, and the
+        weighted number of changes on the branch above each node"""
+        sets = {}
+        changes = np.zeros(self.masks.shape[1])
+        for node in tree.traverse("postorder"):
+            if node.is_leaf():
+                sets[node] = self.masks[self._leaf(node)]
+                continue
+            children = node.children
+            cur = sets[children[0]]
+            for child in children[1:]:
+                other = sets[child]
+                inter = cur & other
+                empty = (inter == 0)
+                changes += empty
+                cur = np.where(empty, cur | other, inter)
+            sets[node] = cur
+        branches = {}
+        state = {tree: lowest_state(sets[tree])}
+        for node in tree.iter_descendants("preorder"):
+            up = state[node.up]
+            keep = (up & sets[node]) != 0
+            state[node] = np.where(keep, up, lowest_state(sets[node]))
+            branches[node] = np.dot(self.weights, ~keep)
+        return changes, branches
+
+    def branch_lengths(self, tree, changes=None):
+        """Branch length above each node: the Jukes-Cantor distance of the
+        proportion of sites changing on the branch in the parsimony
+        reconstruction, or the length of the tree branch (brlen='tree')"""
+        if self.brlen == 'tree':
+            return dict((node, max(node.dist, MIN_BRLEN)) for node in tree.iter_descendants())
+        if changes is None:
+            changes = self._fitch(tree)[1]
+        b = (self.nstates - 1.0) / self.nstates
+        lengths = {}
+        for node, n in changes.iteritems():
+            p = min(n / self.nsites, 0.95*b)
+            lengths[node] = max(-b*np.log(1 - p/b), MIN_BRLEN)
+        return lengths
+
+    def pattern_scores(self, tree):
+        """Log-likelihood of each site pattern (minus its parsimony length
+        for PARS), and the branch lengths used"""
+        changes, branches = self._fitch(tree)
+        if self.parsimony:
+            return -changes, None
+        lengths = self.branch_lengths(tree, branches)
+        partial = {}
+        logscale = np.zeros(self.masks.shape[1])
+        for node in tree.traverse("postorder"):
+            if node.is_leaf():
+                partial[node] = self.tips[self._leaf(node)]
+                continue
+            cur = None
+            for child in node.children:
+                contrib = np.matmul(partial.pop(child), self.submodel.probs(lengths[child], self.rates))
+                cur = contrib if cur is None else cur*contrib
+            # rescale to avoid underflows on large trees
+            scale = cur.max(axis=2).max(axis=0)
+            scale[scale == 0] = 1.0
+            cur /= scale[None, :, None]
+            logscale += np.log(scale)
+            partial[node] = cur
+        sitelk = np.dot(self.catweights, np.dot(partial[tree], self.freqs))
+        return np.log(sitelk) + logscale, lengths
+
+    def site_scores(self, tree):
+        """Log-likelihood of each site of the alignment"""
+        return self.pattern_scores(tree)[0][self.site_pattern]
+
+    def _score(self, tree):
+        Profiler.count("numpy_evaluations")
+        with Profiler.timer("lkl_numpy"):
+            scores, lengths = self.pattern_scores(tree)
+            return np.dot(self.weights, scores), lengths
+
+    def _with_lengths(self, tree, lengths):
+        other = tree.copy()
+        if lengths is not None:
+            for node, onode in zip(tree.iter_descendants("postorder"), other.iter_descendants("postorder")):
+                onode.dist = lengths[node]
+        return other
+
+    def optimize_model(self, gtree, **args):
+        """Score the tree or the list of trees. The trees, with their branch
+        lengths, are only returned with forcelog (as LklModel)"""
+        trees = gtree if isinstance(gtree, list) else [gtree]
+        likelihoods = []
+        best_trees = []
+        for gt in trees:
+            lk, lengths = self._score(gt)
+            likelihoods.append(lk)
+            if args.get('expect_tree', False) and (args.get('forcelog', False) or self.reestimate):
+                best_trees.append(self._with_lengths(gt, lengths))
+        self.currLH = likelihoods if isinstance(gtree, list) else likelihoods[0]
+        return self.currLH, (best_trees or None)
+
+    def optimize_batch(self, gtrees, **args):
+        likelihoods, best_trees = [], []
+        for gt in gtrees:
+            lk, lengths = self._score(gt)
+            likelihoods.append(lk)
+            best_trees.append(self._with_lengths(gt, lengths))
+        self.currLH = likelihoods
+        return likelihoods, best_trees
+
+    def site_likelihoods(self, trees):
+        """Log-likelihoods of the site patterns of the trees, with the pattern counts"""
+        return np.array([self.pattern_scores(gt)[0] for gt in trees]), self.weights
+
+    def _other_site_likelihoods(self, reference, trees):
+        # the model does not depend on the reference
+        return self.site_likelihoods(trees)
+
+    def print_raxml_tree(self, *args, **kwargs):
+        print(self.currLH)
+
+    def __eq__(self, other):
+        return isinstance(other, NumpyModel) and self.alignment is other.alignment and self.model == other.model
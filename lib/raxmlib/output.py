@@ -0,0 +1,99 @@
+"""Readers of the output files of the raxml binaries
+
+The likelihoods are returned as NumPy arrays, and the number of values
+read is checked against the number of trees given to raxml: a failed or
+truncated run raises a ValueError instead of returning fewer scores.
+"""
+
+import os
+import numpy as np
+
+BLOCKSIZE = 1 << 16
+
+
+def reverse_lines(handle, blocksize=BLOCKSIZE):
+    """Lines of a file opened in binary mode, from the last one. The file is
+    read by blocks from its end, only the blocks reached are read"""
+    handle.seek(0, os.SEEK_END)
+    pos = handle.tell()
+    tail = ""
+    while pos > 0:
+        step = min(blocksize, pos)
+        pos -= step
+        handle.seek(pos)
+        lines = (handle.read(step) + tail).split("\n")
+        # the first line may start in the previous block
+        tail = lines.pop(0)
+        for line in reversed(lines):
+            yield line
+    yield tail
+
+
+def _tree_likelihood(line):
+    """The likelihood of a "Tree <i>: <lnl>" line of the info file, or None"""
+    if not line.startswith("Tree "):
+        return None
+    index, sep, value = line[5:].partition(":")
+    if not sep or not index.isdigit():
+        return None
+    return float(value.split(":")[0])
+
+
+def read_tree_likelihoods(filename, ntrees):
+    """Likelihoods of the ntrees trees of a run, from the last "Tree <i>:"
+    lines of its info file, reading the file backward from its end"""
+    likelihoods = np.empty(ntrees)
+    found = 0
+    with open(filename, 'rb') as handle:
+        for line in reverse_lines(handle):
+            if found == ntrees:
+                break
+            value = _tree_likelihood(line)
+            if value is not None:
+                found += 1
+                likelihoods[ntrees - found] = value
+    if found != ntrees:
+        raise ValueError("Expected the likelihoods of %d trees in %s, found %d" % (ntrees, filename, found))
+    return likelihoods
+
+
+def read_log_likelihoods(filename, ntrees):
+    """Likelihoods (last column) of the first ntrees lines of a log file"""
+    likelihoods = np.empty(ntrees)
+    found = 0
+    with open(filename, 'rb') as handle:
+        for line in handle:
+            if found == ntrees:
+                break
+            if line.strip():
+                likelihoods[found] = float(line.rsplit(None, 1)[-1])
+                found += 1
+    if found != ntrees:
+        raise ValueError("Expected the likelihoods of %d trees in %s, found %d" % (ntrees, filename, found))
+    return likelihoods
+
+
+def read_persite_likelihoods(filename, ntrees=None):
+    """Site log-likelihoods of the perSiteLLs file (Tree-Puzzle format), as an
+    array of shape (ntrees, nsites)"""
+    with open(filename, 'rb') as handle:
+        nrows, nsites = [int(x) for x in handle.readline().split()]
+        lnl = np.empty((nrows, nsites))
+        found = 0
+        for line in handle:
+            # "tr<i>\t<site values>"
+            label, sep, values = line.partition("\t")
+            if not sep:
+                continue
+            if found == nrows:
+                found += 1
+                break
+            row = np.fromstring(values, sep=" ")
+            if len(row) != nsites:
+                raise ValueError("Expected %d sites for %s in %s, found %d" % (nsites, label, filename, len(row)))
+            lnl[found] = row
+            found += 1
+    if found != nrows or (ntrees is not None and nrows != ntrees):
+        raise ValueError("Expected the site likelihoods of %d trees in %s, found %d"
+                         % (nrows if ntrees is None else ntrees, filename, found))
+    return lnl
@@ -0,0 +1,62 @@
+"""Site patterns of an alignment, shared by the likelihood models
+
+The alignment is compressed once into its unique columns (the site
+patterns) and the number of sites of each pattern. The models only work
+on the patterns: NumpyModel scores them directly, and the raxml binaries
+and library read the patterns with their weights (-a weight file) instead
+of the full alignment, so their parsing and compression cost scales with
+the number of patterns.
+"""
+
+import numpy as np
+
+
+class SitePatterns(object):
+    """Unique columns of an alignment, in the order of their first site
+
+    :param alignment: a Biopython alignment
+
+    """
+
+    def __init__(self, alignment):
+        self.names = [rec.id for rec in alignment]
+        chars = np.array([np.fromstring(str(rec.seq).upper(), dtype=np.uint8) for rec in alignment])
+        self.nsites = chars.shape[1]
+        columns = np.ascontiguousarray(chars.T).view(np.dtype((np.void, chars.shape[0])))
+        _, first, inverse, counts = np.unique(columns.ravel(), return_index=True,
+                                              return_inverse=True, return_counts=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        # (nseqs, npatterns) characters
+        self.columns = chars[:, first[order]]
+        self.weights = counts[order]
+        # pattern of each site of the alignment
+        self.site_pattern = rank[inverse]
+
+    def __len__(self):
+        return self.columns.shape[1]
+
+    def sequences(self):
+        """(name, sequence of the patterns) of each sequence"""
+        for name, row in zip(self.names, self.columns):
+            yield name, row.tostring()
+
+    def write_phylip(self, filename):
+        """Write the patterns in the sequential relaxed phylip format"""
+        with open(filename, 'w') as handle:
+            handle.write("%d %d\n" % self.columns.shape)
+            for name, seq in self.sequences():
+                handle.write("%s %s\n" % (name, seq))
+
+    def write_weights(self, filename):
+        """Write the weights of the patterns, in the format of raxml -a"""
+        with open(filename, 'w') as handle:
+            handle.write("\n".join(str(w) for w in self.weights) + "\n")
+
+
+def site_patterns(alignment):
+    """The SitePatterns of the alignment, which can already be a SitePatterns"""
+    if isinstance(alignment, SitePatterns):
+        return alignment
+    return SitePatterns(alignment)
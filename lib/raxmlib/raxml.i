@@ -95,6 +95,24 @@ void optimize_model(analdef *adef, tree *tr)
 }
 %}
 
+%inline %{
+/* raxml axml.c: main -> TREE_EVALUATION, reusing the data loaded by optimize_model */
+double evaluate_tree(analdef *adef, tree *tr, FILE *fp, int reestimate)
+{
+    treeReadLen(fp, tr, adef);
+
+    if(reestimate)
+        modOpt(tr, adef);
+    else
+        treeEvaluate(tr, 2);
+
+    tr->start = tr->nodep[1];
+    evaluateGenericInitrav(tr, tr->start);
+
+    return tr->likelihood;
+}
+%}
+
 %newobject compute_best_LH;
 %delobject delete_best_vector;
 %apply double *OUTPUT { double *bestLH, double *weightSum };
@@ -180,3 +198,31 @@ void compute_LH(analdef *adef, tree *tr,
 %}
 %clear double *zscore, double *Dlnl;
 
+%inline %{
+/* raxml axml.c: computePerSiteLLs, on the tree evaluated by evaluate_tree */
+PyObject *site_LH(tree *tr)
+{
+    int i;
+    double *vector = (double*)malloc(sizeof(double) * tr->cdta->endsite);
+    PyObject *values = PyList_New(tr->cdta->endsite);
+
+    evaluateGenericVector(tr, tr->start, vector);
+    for(i = 0; i < tr->cdta->endsite; i++)
+        PyList_SET_ITEM(values, i, PyFloat_FromDouble(vector[i]));
+
+    free(vector);
+    return values;
+}
+
+/* number of sites of each alignment pattern */
+PyObject *site_weights(tree *tr)
+{
+    int i;
+    PyObject *values = PyList_New(tr->cdta->endsite);
+
+    for(i = 0; i < tr->cdta->endsite; i++)
+        PyList_SET_ITEM(values, i, PyInt_FromLong(tr->cdta->aliaswgt[i]));
+
+    return values;
+}
+%}
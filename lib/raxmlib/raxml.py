@@ -135,6 +135,10 @@ def optimize_model(adef, tr):
     return _raxml.optimize_model(adef, tr)
 optimize_model = _raxml.optimize_model
 
+def evaluate_tree(adef, tr, fp, reestimate):
+    return _raxml.evaluate_tree(adef, tr, fp, reestimate)
+evaluate_tree = _raxml.evaluate_tree
+
 def compute_best_LH(tr):
     return _raxml.compute_best_LH(tr)
 compute_best_LH = _raxml.compute_best_LH
@@ -146,6 +150,14 @@ delete_best_vector = _raxml.delete_best_vector
 def compute_LH(adef, tr, bestLH, weightSum, bestVector):
     return _raxml.compute_LH(adef, tr, bestLH, weightSum, bestVector)
 compute_LH = _raxml.compute_LH
+
+def site_LH(tr):
+    return _raxml.site_LH(tr)
+site_LH = _raxml.site_LH
+
+def site_weights(tr):
+    return _raxml.site_weights(tr)
+site_weights = _raxml.site_weights
 # This file is compatible with both classic and new-style classes.
 
 
@@ -0,0 +1,81 @@
+"""Scratch directory of the raxml runs
+
+The alignment, the tree files and the outputs of the raxml binaries are
+written in a private directory created under a RAM-backed filesystem
+(/dev/shm) when there is one, instead of the current (possibly network)
+directory. Each raxml call gets a deterministic run name, so its output
+files are known in advance: they are read and removed by name, without
+listing or globbing the directory.
+
+The root of the scratch directories is, in order of preference, the root
+given to :class:`Scratch`, the GATC_SCRATCH environment variable, the
+first writable directory of RAM_DIRS and the default temporary directory.
+"""
+
+import os
+import shutil
+import tempfile
+
+SCRATCH_ENV = "GATC_SCRATCH"
+RAM_DIRS = ("/dev/shm", "/run/shm")
+# the output files of raxml are RAxML_<kind>.<run name>
+RAXML_OUTPUTS = ('info', 'log', 'result', 'perSiteLLs', 'bootstrap', 'bestTree',
+                 'parsimonyTree', 'randomTree', 'checkpoint', 'bipartitions',
+                 'perSiteRates', 'treeLength', 'treeLengthModel', 'binaryModelParameters')
+
+
+def default_root():
+    """Root of the scratch directories when none is given"""
+    root = os.environ.get(SCRATCH_ENV)
+    if root:
+        return root
+    for path in RAM_DIRS:
+        if os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK):
+            return path
+    return tempfile.gettempdir()
+
+
+class Scratch(object):
+    """Private scratch directory of a likelihood model
+
+    :param prefix: prefix of the directory name
+    :param root: directory in which it is created (see default_root)
+
+    """
+
+    def __init__(self, prefix="gatc", root=None):
+        self.root = os.path.abspath(root or default_root())
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        self.path = tempfile.mkdtemp(prefix=prefix + "_", dir=self.root)
+        # -w of raxml, older versions expect the trailing separator
+        self.workdir = os.path.join(self.path, "")
+        self.pid = os.getpid()
+        self.nruns = 0
+
+    def filename(self, name):
+        return os.path.join(self.path, name)
+
+    def run_name(self, kind="run"):
+        """Name of a new raxml run (-n), unique in the processes sharing the
+        directory (the forked evaluation workers)"""
+        self.nruns += 1
+        return "%s%d_%d" % (kind, os.getpid(), self.nruns)
+
+    def output(self, kind, run):
+        """Path of the RAxML_<kind> output file of the run"""
+        return self.filename("RAxML_%s.%s" % (kind, run))
+
+    def discard(self, run, *files):
+        """Remove the output files of the run and the given files"""
+        for name in [self.output(kind, run) for kind in RAXML_OUTPUTS] + list(files):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    def close(self):
+        """Remove the directory, only in the process that created it"""
+        if self.path is not None and self.pid == os.getpid():
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
@@ -0,0 +1,164 @@
+"""Tree topology tests computed from the site log-likelihoods of the trees,
+without consel.
+
+The KH, SH and AU tests (and the bootstrap probabilities reported by consel)
+use the RELL bootstrap: the replicates resample the site log-likelihoods
+instead of the alignment, so they do not need any likelihood computation.
+The AU test fits the multiscale bootstrap probabilities of each tree, at
+the scales of makermt, as in Shimodaira (2002).
+
+The resampling counts only depend on the site weights, they are drawn once
+(with a fixed seed) and all the tests reuse them: a test is then a few
+matrix products over the replicates of every scale.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+# scales (replicate size / alignment size) of the multiscale bootstrap, as makermt
+SCALES = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4)
+NBOOT = 1000
+SEED = 12345
+
+
+class RellBootstrap(object):
+    """RELL bootstrap replicates of the sites of an alignment
+
+    :param weights: the number of sites of each column of the site
+        log-likelihoods (the site pattern counts, or ones for per-site values)
+    :param nboot: number of replicates at each scale
+    :param scales: the scales of the multiscale bootstrap, 1.0 is always added
+    :param seed: seed of the resampling, the tests are reproducible
+
+    """
+
+    def __init__(self, weights, nboot=NBOOT, scales=SCALES, seed=SEED):
+        self.weights = np.asarray(weights, dtype=float)
+        self.nsites = int(round(self.weights.sum()))
+        self.nboot = nboot
+        self.scales = tuple(sorted(set(scales) | set([1.0])))
+        self.seed = seed
+        self._counts = {}
+
+    def counts(self, scale):
+        """Site counts of the replicates at scale, shape (nboot, ncolumns)"""
+        if scale not in self._counts:
+            size = max(int(round(scale * self.nsites)), 1)
+            # one stream per scale, the counts do not depend on the order of the calls
+            rng = np.random.RandomState([self.seed, int(round(scale * 1000))])
+            draws = rng.multinomial(size, self.weights / self.weights.sum(), size=self.nboot)
+            self._counts[scale] = draws.astype(np.min_scalar_type(size))
+        return self._counts[scale]
+
+    def replicates(self, lnl, scale=1.0):
+        """Log-likelihoods of the trees in the replicates, shape (nboot, ntrees)
+
+        :param lnl: the site log-likelihoods of the trees, shape (ntrees, ncolumns)
+
+        """
+        return np.dot(self.counts(scale), np.asarray(lnl, dtype=float).T)
+
+    def check(self, lnl):
+        """Return lnl as an array, after checking its shape"""
+        lnl = np.asarray(lnl, dtype=float)
+        if lnl.ndim != 2 or lnl.shape[1] != len(self.weights):
+            raise ValueError("Expected the site log-likelihoods of the trees, shape (ntrees, %d), got %s"
+                             % (len(self.weights), lnl.shape))
+        if lnl.shape[0] < 2:
+            raise ValueError("At least two trees are needed to compare their topologies")
+        return lnl
+
+
+def bootstrap_probability(replicates):
+    """Proportion of the replicates where each tree is the best one"""
+    best = np.argmax(replicates, axis=1)
+    return np.bincount(best, minlength=replicates.shape[1]) / float(replicates.shape[0])
+
+
+def kh_test(total, replicates):
+    """KH test of each tree against the best of the other trees (one-sided)
+
+    :param total: the log-likelihoods of the trees
+    :param replicates: their RELL replicates at scale 1
+    :rtype: (the log-likelihood differences, the p-values)
+
+    """
+    other = np.argmax(np.where(np.eye(len(total), dtype=bool), -np.inf, total), axis=1)
+    obs = total[other] - total
+    centered = replicates - replicates.mean(axis=0)
+    diff = centered[:, other] - centered
+    return obs, (diff >= obs).mean(axis=0)
+
+
+def sh_test(total, replicates):
+    """SH test of each tree against the set of trees"""
+    obs = total.max() - total
+    centered = replicates - replicates.mean(axis=0)
+    stat = centered.max(axis=1)[:, None] - centered
+    return (stat >= obs).mean(axis=0)
+
+
+def au_test(bps, scales, nboot):
+    """Approximately unbiased p-values from the multiscale bootstrap probabilities
+
+    The normalized bootstrap z-values z(r) = qnorm(1 - bp(r)) of each tree
+    are fitted by weighted least squares to v*sqrt(r) + c/sqrt(r), the AU
+    p-value is then 1 - pnorm(v - c) and the naive one 1 - pnorm(v + c)
+
+    :param bps: bootstrap probabilities, shape (nscales, ntrees)
+    :rtype: (the AU p-values, the naive p-values)
+
+    """
+    bps = np.asarray(bps, dtype=float)
+    sr = np.sqrt(np.asarray(scales, dtype=float))
+    design = np.column_stack([sr, 1.0 / sr])
+    ntrees = bps.shape[1]
+    au = np.empty(ntrees)
+    naive = np.empty(ntrees)
+    for i in xrange(ntrees):
+        bp = bps[:, i]
+        usable = (bp > 0) & (bp < 1)
+        if usable.sum() < 3:
+            # always (or never) the best tree at almost every scale: two
+            # points would fix v and c from a few replicates of the tails
+            au[i] = naive[i] = 1.0 if bp.mean() >= 0.5 else 0.0
+            continue
+        z = norm.isf(bp[usable])
+        # inverse of the variance of z, from the binomial variance of bp
+        w = nboot * norm.pdf(z)**2 / (bp[usable] * (1 - bp[usable]))
+        sw = np.sqrt(w)
+        (v, c), _, _, _ = np.linalg.lstsq(design[usable] * sw[:, None], z * sw, rcond=-1)
+        au[i] = norm.sf(v - c)
+        naive[i] = norm.sf(v + c)
+    return au, naive
+
+
+def topology_tests(lnl, rell):
+    """Compute the tests of consel for the trees
+
+    :param lnl: the site log-likelihoods of the trees, shape (ntrees, ncolumns)
+    :param rell: the RellBootstrap of the columns
+    :rtype: a dict of arrays in the order of the trees, with the columns of
+        catpv: obs (log-likelihood difference with the best other tree),
+        au, np, bp, pp, kh and sh
+
+    """
+    lnl = rell.check(lnl)
+    bps = []
+    reference = None
+    for scale in rell.scales:
+        replicates = rell.replicates(lnl, scale)
+        bps.append(bootstrap_probability(replicates))
+        if scale == 1.0:
+            reference = replicates
+    au, naive = au_test(bps, rell.scales, rell.nboot)
+    total = np.dot(lnl, rell.weights)
+    pp = np.exp(total - total.max())
+    obs, kh = kh_test(total, reference)
+    return {'obs': obs,
+            'au': au,
+            'np': naive,
+            'bp': bps[rell.scales.index(1.0)],
+            'pp': pp / pp.sum(),
+            'kh': kh,
+            'sh': sh_test(total, reference)}
@@ -1,2 +1,8 @@
-from computeLKL import computeQe, get_discr_size, computeProb, nodeLimitter
-__all__ = ["computeQe", "get_discr_size", "computeProb", "nodeLimitter"]
\ No newline at end of file
+from computeLKL import computeQe, get_discr_size, computeProb, nodeLimitter, getQef
+try:
+    from reconDL import computeDL
+except ImportError:
+    # the compiled dup/loss kernel was not built,
+    # the reconciliation will fallback to TreeUtils
+    computeDL = None
+__all__ = ["computeQe", "getQef", "get_discr_size", "computeProb", "nodeLimitter", "computeDL"]
@@ -42,11 +42,13 @@ raxml_module = [ Extension('lib.raxmlib._raxml',
 if USE_CYTHON:
     recon_module += [
         Extension("lib.reclkl.computeLKL", sources=[ "src/recon/computeLKL.pyx"], include_dirs=[numpy.get_include()]),
+        Extension("lib.reclkl.reconDL", sources=[ "src/recon/reconDL.pyx"], include_dirs=[numpy.get_include()]),
     ]
     cmdclass.update({ 'build_ext': build_ext })
 else:
     recon_module += [
         Extension("lib.reclkl.computeLKL", sources=[ "src/recon/computeLKL.c" ], include_dirs=[numpy.get_include()]),
+        Extension("lib.reclkl.reconDL", sources=[ "src/recon/reconDL.c" ], include_dirs=[numpy.get_include()]),
     ]
 
 modules = raxml_module + recon_module
@@ -12,45 +12,108 @@ def computeQe(dict slicelist, list node_data, int discrsize, float drate, float
 def nodeLimitter(genetree, int discrsize, int leafslice):
     return c_nodeLimitter(genetree, discrsize, leafslice)
 
-def computeProb(rateDens, genetree not None, dict name2node, dict rankedge, list node_data, int discrsize, float stemlen, float drate, float trate, np.ndarray[np.float_t, ndim=4] Qef):
-    return c_computeProb(rateDens, genetree, name2node, rankedge, node_data, discrsize, stemlen, drate, trate, Qef)
+def computeProb(rateDens, genetree not None, dict name2node, dict rankedge, list node_data, int discrsize, float stemlen, float drate, float trate, tuple Qef, tables=None):
+    """tables is an optional pair of zeroed (gsize, tot_edge, discrsize) arrays
+    used for prob_Ax and prob_Se, instead of allocating them"""
+    return c_computeProb(rateDens, genetree, name2node, rankedge, node_data, discrsize, stemlen, drate, trate, Qef, tables)
+
+def getQef(tuple Qef, int e, int f):
+    """Return the (discrsize+1, discrsize+1) matrix of the pair of edges (e, f)
+    from the packed Qef returned by computeQe"""
+    qidx, qdata = Qef
+    if qidx[e, f] < 0:
+        return np.zeros(qdata.shape[1:], dtype=np.float)
+    return qdata[qidx[e, f]]
+
+cdef tuple pack_pairs(dict slicelist, list node_data, bint transfers):
+    # Qef(e, f) is only non zero for the pairs reached by the recursion of
+    # c_computeQe: the contemporaneous pairs (only e == f without transfers)
+    # and the edges f below the slice of e reached through the speciation
+    # of the slice or through the contemporaneous edges updated before e.
+    # The pairs are found with the same recursion on booleans: without
+    # transfers they are the edges of the lineages below the speciations,
+    # with transfers a lineage can move to any contemporaneous edge, so
+    # almost every edge of the slices below is reached. Each edge e gets a
+    # block of rows for its pairs in the packed data, qidx[e, f] is the row
+    # of the pair or -1
+    cdef int n_edges = len(node_data)
+    cdef int rank, e, hh, g_ind
+    pairs = np.zeros((n_edges, n_edges), dtype=np.bool)
+    below = np.zeros(n_edges, dtype=np.bool)
+    for rank in xrange(max(slicelist.keys()), -1, -1):
+        edgelist = slicelist[rank]
+        ctmp = np.asarray(edgelist, dtype=np.int64)
+        if transfers and len(edgelist) > 1:
+            pairs[np.ix_(ctmp, ctmp)] = True
+        else:
+            pairs[ctmp, ctmp] = True
+        g_ind = -1
+        for e, edge_e in enumerate(edgelist):
+            if len(node_data[edge_e].get_children()) == 2:
+                g_ind = e
+                break
+        if g_ind >= 0:
+            gp_edge, gpp_edge = [child.edge_i for child in node_data[edgelist[g_ind]].get_children()]
+            spec = (pairs[gp_edge] | pairs[gpp_edge]) & below
+            for e, edge_e in enumerate(edgelist):
+                row = np.zeros(n_edges, dtype=np.bool)
+                if pairs[edge_e, edgelist[g_ind]]:
+                    row |= spec
+                for hh in range(e):
+                    if hh != g_ind and pairs[edge_e, edgelist[hh]]:
+                        row |= pairs[edgelist[hh]] & below
+                pairs[edge_e] |= row
+        below[ctmp] = True
+    qidx = np.full((n_edges, n_edges), -1, dtype=np.int32)
+    npairs = int(np.count_nonzero(pairs))
+    qidx[pairs] = np.arange(npairs, dtype=np.int32)
+    return qidx, npairs
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef np.ndarray[np.float_t, ndim=4] c_computeQe(dict slicelist, list node_data, int discrsize, float drate, float trate, float lrate, float stemlen):
-    # should return a numpy array
+cdef tuple c_computeQe(dict slicelist, list node_data, int discrsize, float drate, float trate, float lrate, float stemlen):
+    # return the packed Qef (qidx, qdata), see pack_pairs
     cdef:
         int ctmp_size
-        int t
-        int s
+        int t, s, e, f, hh, k, rank
+        int e_edge, f_edge, g_edge, gp_edge, gpp_edge, g_ind
         float h
-        int e_ind
-        int f_ind
         float wnorm
         int n_edges = len(node_data)
-        float qehf_sum
+        int maxsize = max([len(v) for v in slicelist.values()])
         float rates = drate + trate + lrate
-    # link view to numpy array
+        double rowsum, qe, qfe, colex, a, k1, k2, qsum, qpp, qp
+        int p, pg
+    qidx_arr, npairs = pack_pairs(slicelist, node_data, trate > 0)
+    cdef int[:, ::1] qidx = qidx_arr
+    qdata_arr = np.zeros((npairs, discrsize+1, discrsize+1), dtype=np.float)
+    cdef double[:, :, ::1] qdata = qdata_arr
     # Q_e should contains the value for t_end (parent node for the edge e)
-    cdef np.ndarray[np.float_t, ndim=2, mode='c'] Qe = np.zeros((n_edges, discrsize+1), dtype=np.float)
-    cdef np.ndarray[np.float_t, ndim=4, mode='c'] Qef = np.zeros((n_edges, n_edges, discrsize+1, discrsize+1), dtype=np.float)
+    cdef double[:, ::1] Qe = np.zeros((n_edges, discrsize+1), dtype=np.float)
+
+    # buffers for one time slice, allocated once
+    cdef double[:, ::1] Qe_t = np.zeros((maxsize, discrsize+1), dtype=np.float)
+    cdef double[::1] qe_buf = np.zeros(maxsize, dtype=np.float)
+    cdef double[::1] colsum = np.zeros(maxsize, dtype=np.float)
+    cdef double[::1] Qe_k = np.zeros(4, dtype=np.float)
+    cdef double[:, ::1] Qcur = np.zeros((maxsize, maxsize), dtype=np.float)
+    cdef int[:, ::1] pidx = np.zeros((maxsize, maxsize), dtype=np.int32)
+    cdef int[::1] edges = np.zeros(maxsize, dtype=np.int32)
+    cdef int[::1] below
+    cdef double[:, ::1] spec_b
 
-    cdef np.ndarray[np.float_t, ndim=2, mode='c'] Qe_t, Qe_k1, Qe_k2, Qe_k3, Qe_k4, Qef_k1, Qef_k2, Qef_k3, Qef_k4
-    cdef np.ndarray[np.float_t, ndim=3, mode='c'] Qef_st
-    cdef np.ndarray[np.float_t, ndim=2, mode='c'] tmpmask
-    
     for rank in xrange(max(slicelist.keys()), -1, -1):
         edgelist = slicelist[rank]
         # corresponding node is node_data[edgelist[0]]
-        
+
         tmpnode = node_data[edgelist[0]]
-        t_start = tmpnode.time        
+        t_start = tmpnode.time
         if tmpnode.up:
             t_end = tmpnode.up.time
         else:
             t_end = t_start + stemlen
-        
+
         ctmp_size = len(edgelist)
         wnorm = 0.0
         if ctmp_size -1 > 0:
@@ -59,18 +122,14 @@ cdef np.ndarray[np.float_t, ndim=4] c_computeQe(dict slicelist, list node_data,
         h = (t_end - t_start)*1.0/discrsize # important since time step
         # can change between two different slice
 
-        Qe_t = np.zeros((ctmp_size, discrsize+1), dtype=np.float)
-        Qe_k1 = np.zeros((ctmp_size, discrsize), dtype=np.float)
-        Qe_k2 = np.zeros((ctmp_size, discrsize), dtype=np.float)
-        Qe_k3 = np.zeros((ctmp_size, discrsize), dtype=np.float)
-        Qe_k4 = np.zeros((ctmp_size, discrsize), dtype=np.float)
-        
-        Qef_st = np.zeros((ctmp_size**2, discrsize+1, discrsize+1), dtype=np.float)
-        
-        tmpmask = np.ones((ctmp_size,ctmp_size))
-        np.fill_diagonal(tmpmask,0)
+        for e, edge_e in enumerate(edgelist):
+            edges[e] = edge_e
+        for e in range(ctmp_size):
+            for f in range(ctmp_size):
+                pidx[e, f] = qidx[edges[e], edges[f]]
+
         # initial condition
-        for e_ind, edge_e in enumerate(edgelist):           
+        for e_ind, edge_e in enumerate(edgelist):
             node_e = node_data[edge_e]
             # basic initial condition
             if node_e.is_leaf():
@@ -80,78 +139,65 @@ cdef np.ndarray[np.float_t, ndim=4] c_computeQe(dict slicelist, list node_data,
             elif len(node_e.get_children()) == 1:
                 Qe_t[e_ind, 0] =  Qe[node_e.children[0].edge_i, discrsize]
             else:
-                Qe_t[e_ind, 0] = Qe[node_e.children[0].edge_i, discrsize] *  Qe[node_e.children[1].edge_i, discrsize]  
-            
+                Qe_t[e_ind, 0] = Qe[node_e.children[0].edge_i, discrsize] *  Qe[node_e.children[1].edge_i, discrsize]
+
+        with nogil:
             # initialisation of Qef(t,t) if e==f
-            for t in xrange(discrsize+1):
-                Qef_st[e_ind*ctmp_size + e_ind, t, t] = 1
-
-        # discretisation to compute Qe(t)
-        for t in xrange(discrsize):
-            # t start at 0 which was already computed
-            rowsum = np.sum(Qe_t[:, t])
-            # Qe_t was computed for all edges under the initial conditions
-            # here we compute Qeki for all edges
-            qe_t = Qe_t[:, t]
-            # compute k1
-            Qe_k1[:, t] = drate*(qe_t**2) + lrate - rates*qe_t + wnorm*(rowsum - qe_t)*qe_t 
-            # compute k2
-            qe_t = Qe_t[:, t] + 0.5*h*Qe_k1[:, t]
-            Qe_k2[:, t] = drate*(qe_t**2) + lrate - rates*qe_t + wnorm*(rowsum - qe_t)*qe_t 
-            # compute k3
-            qe_t = Qe_t[:, t] + 0.5*h*Qe_k2[:, t]
-            Qe_k3[:, t] = drate*(qe_t**2) + lrate - rates*qe_t + wnorm*(rowsum - qe_t)*qe_t 
-            # compute k4
-            qe_t = Qe_t[:, t] + h*Qe_k3[:, t]
-            Qe_k4[:, t] = drate*(qe_t**2) + lrate - rates*qe_t + wnorm*(rowsum - qe_t)*qe_t
-            # compute Qe_t        
-            Qe_t[:,t+1] = Qe_t[:, t] + h*(Qe_k1[:, t] + 2*Qe_k2[:, t] + 2*Qe_k3[:, t] + Qe_k4[:, t])/6.0
-
-        # this value will change at each loop
-        # so no need to initialize multiple time
-        Qef_k1 = np.zeros((ctmp_size**2, discrsize), dtype=np.float)
-        Qef_k2 = np.zeros((ctmp_size**2, discrsize), dtype=np.float)
-        Qef_k3 = np.zeros((ctmp_size**2, discrsize), dtype=np.float)
-        Qef_k4 = np.zeros((ctmp_size**2, discrsize), dtype=np.float)
-        for t in xrange(discrsize):
-            # for s > t
-            for s in xrange(t, discrsize):
-                qe_s = Qe_t[:, s] # this is the value for Qe(s), which is Qe(t) at the start
-                qef_st = Qef_st[:, t, s] # this is the previous value
-                # of Qef(s,t)
-                # for the first value, s=t and Qef(s,t) = {0,1}
-                qef_st_r = qef_st.reshape((ctmp_size, ctmp_size))
-                qeqef_st = ((qe_s*qef_st_r).T).ravel()
-                
-                # compute k1
-                Qef_k1[:, s] = 2*drate*qeqef_st - rates*qef_st + wnorm*((np.dot(tmpmask, qef_st_r)*qe_s[:, None]).ravel() + qef_st*sum(qe_s) - qeqef_st)
-                
-                #  compute k2
-                qef_st = Qef_st[:, t, s] + 0.5*h*Qef_k1[:, s]               
-                Qef_k2[:, s] = 2*drate*qeqef_st - rates*qef_st + wnorm*((np.dot(tmpmask, qef_st_r)*qe_s[:, None]).ravel() + qef_st*sum(qe_s) - qeqef_st)
-                
-                # compute k3
-                qef_s = Qef_st[:, t, s] + 0.5*h*Qef_k2[:, s]
-                Qef_k3[:, s] = 2*drate*qeqef_st - rates*qef_st + wnorm*((np.dot(tmpmask, qef_st_r)*qe_s[:, None]).ravel() + qef_st*sum(qe_s) - qeqef_st)
-                
-                # compute k4
-                qef_s = Qef_st[:, t, s] + h*Qef_k2[:, s]
-                Qef_k4[:, s] = 2*drate*qeqef_st - rates*qef_st + wnorm*((np.dot(tmpmask, qef_st_r)*qe_s[:, None]).ravel() + qef_st*sum(qe_s) - qeqef_st)
-            
-                Qef_st[:,t, s+1] = Qef_st[:, t, s] + h*(Qef_k1[:, s] + 2*Qef_k2[:, s] + 2*Qef_k3[:, s] + Qef_k4[:, s])/6.0
-
-        for e_ind, edge_e in enumerate(edgelist): 
-            # this is the value at t_end (parent node) of the edge
-            # for leaves, Qe[edge] is expected to be 0 
-            #print Qe[edge_e, :].size
-            #print Qe_t[e_ind, :].size
-            Qe[edge_e, :] = Qe_t[e_ind, :]
-            for f_ind, edge_f in enumerate(edgelist): 
-                Qef[edge_e, edge_f, :, :] = Qef_st[e_ind*ctmp_size + f_ind, :, :]
-            
+            for e in range(ctmp_size):
+                for t in range(discrsize+1):
+                    qdata[pidx[e, e], t, t] = 1
+
+            # discretisation to compute Qe(t), Runge-Kutta order 4
+            for t in range(discrsize):
+                rowsum = 0
+                for e in range(ctmp_size):
+                    rowsum += Qe_t[e, t]
+                for e in range(ctmp_size):
+                    qe = Qe_t[e, t]
+                    for k in range(4):
+                        Qe_k[k] = drate*(qe*qe) + lrate - rates*qe + wnorm*(rowsum - qe)*qe
+                        if k < 2:
+                            qe = Qe_t[e, t] + 0.5*h*Qe_k[k]
+                        else:
+                            qe = Qe_t[e, t] + h*Qe_k[k]
+                    Qe_t[e, t+1] = Qe_t[e, t] + h*(Qe_k[0] + 2*Qe_k[1] + 2*Qe_k[2] + Qe_k[3])/6.0
+
+            # Qef(t, s) for the contemporaneous edges, s >= t
+            # (same update as the previous numpy version: k3 and k4 were computed
+            # with the value used for k2)
+            for t in range(discrsize):
+                for s in range(t, discrsize):
+                    qsum = 0
+                    for e in range(ctmp_size):
+                        qe_buf[e] = Qe_t[e, s]
+                        qsum += qe_buf[e]
+                    for f in range(ctmp_size):
+                        colsum[f] = 0
+                    for e in range(ctmp_size):
+                        for f in range(ctmp_size):
+                            Qcur[e, f] = 0
+                            if pidx[e, f] >= 0:
+                                Qcur[e, f] = qdata[pidx[e, f], t, s]
+                            colsum[f] += Qcur[e, f]
+                    for e in range(ctmp_size):
+                        qe = qe_buf[e]
+                        for f in range(ctmp_size):
+                            if pidx[e, f] < 0:
+                                continue
+                            qfe = qe*Qcur[f, e]
+                            colex = qe*(colsum[f] - Qcur[e, f])
+                            k1 = 2*drate*qfe - rates*Qcur[e, f] + wnorm*(colex + Qcur[e, f]*qsum - qfe)
+                            a = Qcur[e, f] + 0.5*h*k1
+                            k2 = 2*drate*qfe - rates*a + wnorm*(colex + a*qsum - qfe)
+                            qdata[pidx[e, f], t, s+1] = Qcur[e, f] + h*(k1 + 2*k2 + 2*k2 + k2)/6.0
+
+        for e in range(ctmp_size):
+            for t in range(discrsize+1):
+                Qe[edges[e], t] = Qe_t[e, t]
+
         # update Qef for  --e-->v--f-->
         # start by finding the speciation time
-        snode, g_edge = None, None # for time slice
+        snode, g_edge = None, -1 # for time slice
         all_leaves = True
         for edge in edgelist:
             corr_node = node_data[edge]
@@ -165,25 +211,54 @@ cdef np.ndarray[np.float_t, ndim=4] c_computeQe(dict slicelist, list node_data,
         # then something is wrong with the slice
         if snode:
             gp_edge, gpp_edge = [child.edge_i for child in snode.get_children()]
-            for e_edge in edgelist:
-                for below_rank in xrange(max(slicelist.keys()), rank, -1):
-                    # f is the direct child of e
-                    for f_edge in slicelist[below_rank]:
-                        # outgoing edge interval discr (f)
-                        # speciation time is either 0 or 10. 
-                        for t in xrange(discrsize+1):
-                            # incoming edge (e) discr
-                            for s in xrange(discrsize+1):
-                                # sum over contemporain to g edge
-                                qehf_sum = sum([Qef[e_edge, int(h_edge), 0, s]*Qef[int(h_edge), f_edge, t, discrsize] for h_edge in edgelist if h_edge != g_edge])
-                                # compute rest
-                                Qef[e_edge, f_edge, t, s] =  qehf_sum + Qef[e_edge, g_edge, 0, s]*(Qef[gp_edge, f_edge, t, discrsize]*Qe[gpp_edge, discrsize] + Qef[gpp_edge, f_edge, t, discrsize]*Qe[gp_edge, discrsize])
+            g_ind = edgelist.index(g_edge)
+            below = np.asarray([fe for below_rank in xrange(max(slicelist.keys()), rank, -1) for fe in slicelist[below_rank]], dtype=np.int32)
+            spec_b = np.zeros((below.shape[0], discrsize+1), dtype=np.float)
+            with nogil:
+                # contribution of the speciation at the end of g
+                for f in range(below.shape[0]):
+                    f_edge = below[f]
+                    for t in range(discrsize+1):
+                        qp = 0
+                        qpp = 0
+                        if qidx[gp_edge, f_edge] >= 0:
+                            qp = qdata[qidx[gp_edge, f_edge], t, discrsize]
+                        if qidx[gpp_edge, f_edge] >= 0:
+                            qpp = qdata[qidx[gpp_edge, f_edge], t, discrsize]
+                        spec_b[f, t] = qp*Qe[gpp_edge, discrsize] + qpp*Qe[gp_edge, discrsize]
+                # the edges e are updated in the slice order, the sum over the
+                # contemporaneous edges h only use the ones already updated
+                for e in range(ctmp_size):
+                    e_edge = edges[e]
+                    pg = pidx[e, g_ind]
+                    for f in range(below.shape[0]):
+                        f_edge = below[f]
+                        p = qidx[e_edge, f_edge]
+                        if p < 0:
+                            continue
+                        for t in range(discrsize+1):
+                            for s in range(discrsize+1):
+                                qsum = 0
+                                for hh in range(e):
+                                    if hh != g_ind and pidx[e, hh] >= 0 and qidx[edges[hh], f_edge] >= 0:
+                                        qsum = qsum + qdata[pidx[e, hh], 0, s]*qdata[qidx[edges[hh], f_edge], t, discrsize]
+                                if pg >= 0:
+                                    qsum = qsum + qdata[pg, 0, s]*spec_b[f, t]
+                                qdata[p, t, s] = qsum
         elif not all_leaves:
             #print [node_data[edg] for edg in edgelist]
             raise ValueError("time slice without a speciation delimiting it")
-    return Qef
+    return qidx_arr, qdata_arr
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double qef_value(const int[:, ::1] qidx, const double[:, :, ::1] qdata, int e, int f, int t, int s) nogil:
+    # value of Qef(e, f, t, s) in the packed storage
+    if qidx[e, f] < 0:
+        return 0
+    return qdata[qidx[e, f], t, s]
+
 cpdef int get_discr_size(int gsize, int discrsize, int leafslice):
     while (discrsize-1)*leafslice < gsize:
         discrsize += 1
@@ -236,18 +311,24 @@ cdef void c_nodeLimitter(genetree, int discrsize, int leafslice):
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef np.float_t [:, :, :] c_computeProb(rateDens, genetree, dict name2node, dict rankedge, list node_data, int discrsize, float stemlen, float drate, float trate, np.ndarray[np.float_t, ndim=4] Qef):
+cdef np.float_t [:, :, :] c_computeProb(rateDens, genetree, dict name2node, dict rankedge, list node_data, int discrsize, float stemlen, float drate, float trate, tuple Qef, tuple tables):
                         
     cdef int gsize = len([gnode for gnode in genetree.traverse()])
     cdef int tot_edge = len(node_data)
     cdef int maxrank = int(max(rankedge.keys()))    
 
-    cprobAx = np.zeros((gsize, tot_edge, discrsize), dtype=np.float)
-    cprobSe = np.zeros((gsize, tot_edge, discrsize), dtype=np.float)
+    if tables is None:
+        cprobAx = np.zeros((gsize, tot_edge, discrsize), dtype=np.float)
+        cprobSe = np.zeros((gsize, tot_edge, discrsize), dtype=np.float)
+    else:
+        cprobAx, cprobSe = tables
     #cdef np.float_t cprobAx[gsize][tot_edge][discrsize]
     #cdef double cprobSe[gsize][tot_edge][discrsize]
     cdef np.float_t [:, :, :] prob_Ax = cprobAx
     cdef np.float_t [:, :, :] prob_Se = cprobSe
+    # read only views, Qef can be memory mapped from the disk cache
+    cdef const int[:, ::1] qidx = Qef[0]
+    cdef const double[:, :, ::1] qdata = Qef[1]
     # start by labelling each node of the genetree
     # set species should have been
     # genetree should be labelled also
@@ -300,7 +381,7 @@ cdef np.float_t [:, :, :] c_computeProb(rateDens, genetree, dict name2node, dict
                         # nor adjacent. 
                         # e = <y, z>
                         # linked_s_node = x and f = <xx, x>
-                        prob_Se[gnode.ind, e, e_discr] = Qef[e, linked_s_node, 0, e_discr+1]*sigma
+                        prob_Se[gnode.ind, e, e_discr] = qef_value(qidx, qdata, e, linked_s_node, 0, e_discr+1)*sigma
                         #print 'mapping node'
                         #print linked_s_node
                         #print 'gnode'
@@ -374,7 +455,7 @@ cdef np.float_t [:, :, :] c_computeProb(rateDens, genetree, dict name2node, dict
                         # p11[e, z] = Qef[e, zedge, t_z, t_x] # i correct
                         # e = <x, y> , t_x is glt and t_y is glt+1, assuming that glt max value is discrsize -1 
                         #print '*** Qef', Qef[e, zedge, zlt, glt+1]
-                        prob_Se[gnode.ind, e, glt] += Qef[e, zedge, zlt, glt+1]*sigma*prob_Ax[gnode.ind, zedge, zlt]
+                        prob_Se[gnode.ind, e, glt] += qef_value(qidx, qdata, e, zedge, zlt, glt+1)*sigma*prob_Ax[gnode.ind, zedge, zlt]
                         
                         #print '*** a(x,u)',zedge, zls, zlt, prob_Ax[gnode.ind, zedge, zlt], Qef[e, zedge, zlt, glt+1]
                         #print node_data[zedge]
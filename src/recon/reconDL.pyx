@@ -0,0 +1,104 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+# Compiled lca mapping and duplication/loss scoring.
+# The gene tree is given in postorder as a parent array and the species id
+# of its leaves (-1 for internal nodes). The species tree is given by the
+# arrays of its TreeIndex: parent, euler tour, first occurrence in the tour,
+# sparse table of the tour depth and node depth.
+
+def computeDL(np.ndarray[np.int32_t, ndim=1] gparent, np.ndarray[np.int32_t, ndim=1] gleafsp,
+                np.ndarray[np.int32_t, ndim=1] spparent, np.ndarray[np.int32_t, ndim=1] euler,
+                np.ndarray[np.int32_t, ndim=1] efirst, np.ndarray[np.int32_t, ndim=2] sparse,
+                np.ndarray[np.int32_t, ndim=1] depth, np.ndarray[np.float_t, ndim=1] dupw,
+                np.ndarray[np.uint8_t, ndim=1] dupflag, np.ndarray[np.float_t, ndim=1] sibloss,
+                np.ndarray[np.int32_t, ndim=1] sibcount):
+    """Return (number of dup, number of loss, dup cost, loss cost) of the
+    reconciliation of the gene tree with the species tree. dupw is the cost of
+    a duplication mapped to each species node, dupflag tell whether a dup on a
+    species node is considered as a dup for the losses, sibloss and sibcount are
+    the loss cost and number of the siblings of each species node"""
+    return c_computeDL(gparent, gleafsp, spparent, euler, efirst, sparse, depth, dupw, dupflag, sibloss, sibcount)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline int c_lca(int a, int b, int[:] euler, int[:] efirst, int[:, :] sparse, int[:] depth) nogil:
+    cdef:
+        int i = efirst[a]
+        int j = efirst[b]
+        int k = 0
+        int left, right
+    if a == b:
+        return a
+    if i > j:
+        i, j = j, i
+    while (2 << k) <= j - i + 1:
+        k += 1
+    left = sparse[k, i]
+    right = sparse[k, j - (1 << k) + 1]
+    if depth[euler[right]] < depth[euler[left]]:
+        return euler[right]
+    return euler[left]
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef tuple c_computeDL(int[:] gparent, int[:] gleafsp, int[:] spparent, int[:] euler, int[:] efirst,
+                        int[:, :] sparse, int[:] depth, double[:] dupw, np.uint8_t[:] dupflag,
+                        double[:] sibloss, int[:] sibcount):
+    cdef:
+        int n = gparent.shape[0]
+        int i, p, x, target
+        int ndup = 0
+        int nloss = 0
+        double dupscore = 0
+        double lossscore = 0
+        np.ndarray[np.int32_t, ndim=1] mapping = np.empty(n, dtype=np.int32)
+        np.ndarray[np.uint8_t, ndim=1] isdup = np.zeros(n, dtype=np.uint8)
+        int[:] lcamap = mapping
+        np.uint8_t[:] dup = isdup
+
+    with nogil:
+        for i in range(n):
+            lcamap[i] = -1
+        # lca mapping, children come before their parent in postorder
+        for i in range(n):
+            if gleafsp[i] >= 0:
+                lcamap[i] = gleafsp[i]
+            p = gparent[i]
+            if p >= 0:
+                if lcamap[p] < 0:
+                    lcamap[p] = lcamap[i]
+                else:
+                    lcamap[p] = c_lca(lcamap[p], lcamap[i], euler, efirst, sparse, depth)
+
+        for i in range(n):
+            p = gparent[i]
+            if p >= 0 and lcamap[p] == lcamap[i]:
+                dup[p] = 1
+
+        for i in range(n):
+            if dup[i]:
+                ndup += 1
+                dupscore += dupw[lcamap[i]]
+            p = gparent[i]
+            if p < 0:
+                continue
+            # losses on the path from the child mapping to the parent mapping
+            # (dup) or to the children of the parent mapping (speciation)
+            x = lcamap[i]
+            target = lcamap[p]
+            if dup[p] and dupflag[target]:
+                while x != target and spparent[x] >= 0:
+                    nloss += sibcount[x]
+                    lossscore += sibloss[x]
+                    x = spparent[x]
+            else:
+                while spparent[x] != target and spparent[x] >= 0:
+                    nloss += sibcount[x]
+                    lossscore += sibloss[x]
+                    x = spparent[x]
+
+    return ndup, nloss, dupscore, lossscore
@@ -0,0 +1,126 @@
+import unittest
+
+import numpy as np
+
+from lib.ga.ReconParams import ReconParams
+from lib.reclkl import computeQe, getQef
+from lib.TreeLib.SimulModel import SimulModel
+
+
+def f32(x):
+    # the rates and time steps are C floats in the solvers
+    return float(np.float32(x))
+
+
+def dense_qef(slicelist, node_data, discrsize, drate, trate, lrate, stemlen):
+    """The dense (n_edges, n_edges, d+1, d+1) Qef of the NumPy solver
+    replaced by the packed one (same updates, including its Runge-Kutta
+    steps for Qef)"""
+    drate, trate, lrate = f32(drate), f32(trate), f32(lrate)
+    rates = f32(drate + trate + lrate)
+    n_edges = len(node_data)
+    Qe = np.zeros((n_edges, discrsize+1))
+    Qef = np.zeros((n_edges, n_edges, discrsize+1, discrsize+1))
+    for rank in xrange(max(slicelist.keys()), -1, -1):
+        edgelist = slicelist[rank]
+        tmpnode = node_data[edgelist[0]]
+        t_start = tmpnode.time
+        t_end = tmpnode.up.time if tmpnode.up else t_start + f32(stemlen)
+        n = len(edgelist)
+        wnorm = f32(trate / (n - 1)) if n > 1 else 0.0
+        h = f32((t_end - t_start)*1.0/discrsize)
+        Qe_t = np.zeros((n, discrsize+1))
+        Qef_st = np.zeros((n*n, discrsize+1, discrsize+1))
+        mask = np.ones((n, n))
+        np.fill_diagonal(mask, 0)
+        for e_ind, edge_e in enumerate(edgelist):
+            node_e = node_data[edge_e]
+            if node_e.is_leaf():
+                Qe_t[e_ind, 0] = 0
+            elif len(node_e.get_children()) == 1:
+                Qe_t[e_ind, 0] = Qe[node_e.children[0].edge_i, discrsize]
+            else:
+                Qe_t[e_ind, 0] = Qe[node_e.children[0].edge_i, discrsize]*Qe[node_e.children[1].edge_i, discrsize]
+            for t in xrange(discrsize+1):
+                Qef_st[e_ind*n + e_ind, t, t] = 1
+
+        def dqe(qe, rowsum):
+            return drate*qe**2 + lrate - rates*qe + wnorm*(rowsum - qe)*qe
+        for t in xrange(discrsize):
+            rowsum = np.sum(Qe_t[:, t])
+            k1 = dqe(Qe_t[:, t], rowsum)
+            k2 = dqe(Qe_t[:, t] + 0.5*h*k1, rowsum)
+            k3 = dqe(Qe_t[:, t] + 0.5*h*k2, rowsum)
+            k4 = dqe(Qe_t[:, t] + h*k3, rowsum)
+            Qe_t[:, t+1] = Qe_t[:, t] + h*(k1 + 2*k2 + 2*k3 + k4)/6.0
+
+        for t in xrange(discrsize):
+            for s in xrange(t, discrsize):
+                qe_s = Qe_t[:, s]
+                qef_r = Qef_st[:, t, s].reshape((n, n))
+                qeqef = ((qe_s*qef_r).T).ravel()
+                other = (np.dot(mask, qef_r)*qe_s[:, None]).ravel()
+                k1 = 2*drate*qeqef - rates*Qef_st[:, t, s] + wnorm*(other + Qef_st[:, t, s]*qe_s.sum() - qeqef)
+                a = Qef_st[:, t, s] + 0.5*h*k1
+                k2 = 2*drate*qeqef - rates*a + wnorm*(other + a*qe_s.sum() - qeqef)
+                Qef_st[:, t, s+1] = Qef_st[:, t, s] + h*(k1 + 5*k2)/6.0
+
+        for e_ind, edge_e in enumerate(edgelist):
+            Qe[edge_e] = Qe_t[e_ind]
+            for f_ind, edge_f in enumerate(edgelist):
+                Qef[edge_e, edge_f] = Qef_st[e_ind*n + f_ind]
+
+        g_edge = None
+        for edge in edgelist:
+            if len(node_data[edge].get_children()) == 2:
+                g_edge = edge
+                break
+        if g_edge is None:
+            continue
+        gp_edge, gpp_edge = [child.edge_i for child in node_data[g_edge].get_children()]
+        for e_edge in edgelist:
+            for below_rank in xrange(max(slicelist.keys()), rank, -1):
+                for f_edge in slicelist[below_rank]:
+                    for t in xrange(discrsize+1):
+                        for s in xrange(discrsize+1):
+                            qsum = sum(Qef[e_edge, h_edge, 0, s]*Qef[h_edge, f_edge, t, discrsize]
+                                       for h_edge in edgelist if h_edge != g_edge)
+                            Qef[e_edge, f_edge, t, s] = qsum + Qef[e_edge, g_edge, 0, s]*(
+                                Qef[gp_edge, f_edge, t, discrsize]*Qe[gpp_edge, discrsize] +
+                                Qef[gpp_edge, f_edge, t, discrsize]*Qe[gp_edge, discrsize])
+    return Qef
+
+
+class ComputeQeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        sptree = SimulModel(seed=3).pure_birth_tree(birth=1.0, nsize=8)
+        sptree.label_internal_node()
+        cls.recparam = ReconParams(sptree.write(format=5), 10, discrsize=4, parcim=False)
+
+    def check(self, drate, trate, lrate):
+        data = self.recparam.data
+        args = (data['slicelist'], data['node_d'], self.recparam.discrsize, drate, trate, lrate, self.recparam.stemlen)
+        Qef = computeQe(*args)
+        dense = dense_qef(*args)
+        n_edges = len(data['node_d'])
+        for e in xrange(n_edges):
+            for f in xrange(n_edges):
+                # single precision rates and time steps
+                np.testing.assert_allclose(getQef(Qef, e, f), dense[e, f], rtol=1e-6, atol=1e-9)
+        # the pairs of edges without time order are not packed
+        self.assertLess(Qef[1].shape[0], n_edges*n_edges)
+        return Qef
+
+    def test_transfers(self):
+        self.check(0.3, 0.2, 0.4)
+
+    def test_without_transfers(self):
+        Qef = self.check(0.3, 0.0, 0.4)
+        # only the lineages below the speciations are kept
+        self.assertLess(Qef[1].shape[0], len(self.recparam.data['node_d'])*4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import random
+import unittest
+
+import numpy as np
+
+from lib.TreeLib import TreeUtils
+from lib.TreeLib.SimulModel import SimulModel
+from lib.TreeLib.TreeIndex import TreeIndex
+
+# (dup, transfer, loss) costs
+COSTS = [(1, 1, 1), (2, 3, 1), (3, 1, 2), (1, 5, 0.5)]
+
+
+def simulate(seed, spsize=8, gsize=25):
+    """Species tree and a gene tree of gsize leaves simulated inside it, the
+    gene leaves have their species feature set"""
+    random.seed(seed)
+    np.random.seed(seed)
+    model = SimulModel(seed=seed)
+    sptree = model.pure_birth_tree(birth=1.0, nsize=spsize)
+    sptree.label_internal_node()
+    while True:
+        gtree, _ = model.dlt_tree_from_sptree(sptree, 1.0, 0.3, 0.3)
+        if len(gtree) >= gsize:
+            break
+    leaves = gtree.get_leaves()
+    random.shuffle(leaves)
+    gtree.prune(leaves[:gsize], preserve_branch_length=True)
+    for leaf in gtree:
+        leaf.add_features(species=leaf.name.rsplit('_', 1)[0])
+    return sptree, gtree
+
+
+class DTLArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trees = [simulate(seed) for seed in (1, 2, 3)]
+
+    def test_array_matches_matrix(self):
+        for sptree, gtree in self.trees:
+            spindex = TreeIndex(sptree)
+            for dup, trf, loss in COSTS:
+                for flag in (True, False):
+                    expected = TreeUtils.computeDTLMat(gtree, sptree, dup, trf, loss, flag=flag)
+                    row = TreeUtils.computeDTLArray(gtree, spindex, dup, trf, loss, flag=flag)
+                    np.testing.assert_allclose(row, expected)
+                    self.assertEqual(TreeUtils.computeDTLArrayScore(gtree, spindex, dup, trf, loss, flag=flag),
+                                     np.min(expected))
+
+    def test_incremental_matches_matrix(self):
+        for sptree, gtree in self.trees:
+            spindex = TreeIndex(sptree)
+            for dup, trf, loss in COSTS:
+                expected = TreeUtils.computeDTLMat(gtree, sptree, dup, trf, loss)
+                np.testing.assert_allclose(TreeUtils.computeDTLArrayInc(gtree, spindex, dup, trf, loss), expected)
+
+    def _swap_leaves(self, gtree):
+        """Exchange two leaves of different species under different parents,
+        return their old parents"""
+        leaves = gtree.get_leaves()
+        a = leaves[0]
+        b = [l for l in leaves if l.species != a.species and l.up is not a.up][-1]
+        pa, pb = a.up, b.up
+        a.detach()
+        b.detach()
+        pa.add_child(b)
+        pb.add_child(a)
+        return pa, pb
+
+    def test_invalidate_rows(self):
+        sptree, gtree = self.trees[0]
+        spindex = TreeIndex(sptree)
+        TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1)
+        rows = dict((node, node.dtlrows) for node in gtree.traverse())
+        pa, pb = self._swap_leaves(gtree)
+        TreeUtils.invalidateRows(pa)
+        TreeUtils.invalidateRows(pb)
+        expected = TreeUtils.computeDTLMat(gtree, sptree, 2, 3, 1)
+        np.testing.assert_allclose(TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1), expected)
+        # only the paths from the modified nodes to the root are recomputed
+        path = set(pa.get_ancestors() + pb.get_ancestors() + [pa, pb])
+        for node in gtree.traverse():
+            if node not in path:
+                self.assertIs(node.dtlrows, rows[node])
+
+    def test_invalidate_changed_rows(self):
+        sptree, gtree = self.trees[1]
+        spindex = TreeIndex(sptree)
+        TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1)
+        self._swap_leaves(gtree)
+        TreeUtils.invalidateChangedRows(gtree)
+        expected = TreeUtils.computeDTLMat(gtree, sptree, 2, 3, 1)
+        np.testing.assert_allclose(TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1), expected)
+
+    def test_reroot(self):
+        sptree, gtree = self.trees[2]
+        spindex = TreeIndex(sptree)
+        TreeUtils.computeDTLArrayInc(gtree, spindex, 2, 3, 1)
+        for i, tree in enumerate(gtree.edge_reroot()):
+            if i >= 10:
+                break
+            TreeUtils.invalidateChangedRows(tree)
+            expected = TreeUtils.computeDTLMat(tree, sptree, 2, 3, 1)
+            np.testing.assert_allclose(TreeUtils.computeDTLArrayInc(tree, spindex, 2, 3, 1), expected)
+
+    def test_non_binary_species_tree(self):
+        sptree, gtree = self.trees[0]
+        sptree = sptree.copy()
+        node = sptree.get_children()[0]
+        if not node.is_leaf():
+            node.delete()
+        else:
+            sptree.get_children()[1].delete()
+        self.assertRaises(ValueError, TreeUtils.computeDTLArray, gtree, TreeIndex(sptree))
+
+
+if __name__ == '__main__':
+    unittest.main()
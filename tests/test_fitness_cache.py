@@ -0,0 +1,90 @@
+import unittest
+
+from lib.ga.evolve import GPopulation, Util
+from lib.ga.evolve.GenomeBase import GenomeBase
+
+EVALUATED = []
+
+
+def evaluate(genome, **args):
+    """Score of the genome, its evaluation also changes it (as the branch
+    lengths optimization)"""
+    EVALUATED.append(genome.key)
+    genome.tree = "optimized " + genome.key
+    return float(len(genome.key))
+
+
+class KeyGenome(GenomeBase):
+    """Genome identified by its key, as a tree by its topology"""
+
+    def __init__(self, key, tree=None):
+        GenomeBase.__init__(self)
+        self.key = key
+        self.tree = tree or key
+        self.evaluator.set(evaluate)
+
+    def get_cache_key(self):
+        return self.key
+
+    def encode(self):
+        return self.key, self.tree
+
+    def decode(self, code):
+        return KeyGenome(*code)
+
+
+class FitnessCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        cache = Util.FitnessCache(2)
+        cache.set('a', [1.0], 'code a')
+        cache.set('b', [2.0])
+        self.assertEqual(cache.get('a'), ([1.0], 'code a'))
+        cache.set('c', [3.0])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), ([3.0], None))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(len(cache), 2)
+
+
+class PopulationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        del EVALUATED[:]
+        self.pop = GPopulation.GPopulation(KeyGenome('x'))
+        self.cache = Util.FitnessCache(100)
+        self.pop.setFitnessCache(self.cache)
+
+    def evaluate(self, keys):
+        self.pop.internalPop = [KeyGenome(key) for key in keys]
+        self.pop.evaluate()
+        return self.pop.internalPop
+
+    def test_duplicates_evaluated_once(self):
+        pop = self.evaluate(['ab', 'c', 'ab', 'ab'])
+        self.assertEqual(EVALUATED, ['ab', 'c'])
+        self.assertEqual([ind.key for ind in pop], ['ab', 'c', 'ab', 'ab'])
+        self.assertEqual([ind.score for ind in pop], [[2.0], [1.0], [2.0], [2.0]])
+        # the duplicates get the evaluated genome
+        self.assertEqual([ind.tree for ind in pop], ['optimized ab', 'optimized c'] + ['optimized ab'] * 2)
+
+    def test_cache_hits(self):
+        self.evaluate(['ab', 'c'])
+        pop = self.evaluate(['c', 'def', 'ab'])
+        self.assertEqual(EVALUATED, ['ab', 'c', 'def'])
+        self.assertEqual([ind.key for ind in pop], ['c', 'def', 'ab'])
+        self.assertEqual([ind.score for ind in pop], [[1.0], [3.0], [2.0]])
+        self.assertEqual([ind.tree for ind in pop], ['optimized c', 'optimized def', 'optimized ab'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 3))
+
+    def test_large_population(self):
+        keys = ['k%d' % (i % 50) for i in range(1000)]
+        self.evaluate(keys)
+        pop = self.evaluate(keys[::-1])
+        self.assertEqual(len(EVALUATED), 50)
+        self.assertEqual([ind.key for ind in pop], keys[::-1])
+        self.assertTrue(all(ind.tree == 'optimized ' + ind.key for ind in pop))
+
+
+if __name__ == '__main__':
+    unittest.main()
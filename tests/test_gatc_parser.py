@@ -0,0 +1,54 @@
+import imp
+import os
+import unittest
+
+import matplotlib
+matplotlib.use('Agg')
+
+GATC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin', 'gatc')
+gatc = imp.load_source('gatc', GATC)
+
+
+class ParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = gatc.build_parser()
+
+    def test_batch_options_before_command(self):
+        # documented in the README
+        args = self.parser.parse_args("--sptree sptree.nw --timelim 5 batch --manifest families.txt "
+                                      "--outdir results --workers 8 --family_timelim 2".split())
+        self.assertEqual(args.command, 'batch')
+        self.assertEqual(args.sptree, 'sptree.nw')
+        self.assertEqual(args.timelim, 5)
+        self.assertEqual(args.workers, 8)
+        self.assertEqual(args.family_timelim, 2)
+
+    def test_options_after_command(self):
+        args = self.parser.parse_args("batch --manifest families.txt --outdir results --sptree sptree.nw".split())
+        self.assertEqual(args.sptree, 'sptree.nw')
+        self.assertEqual(args.timelim, None)
+
+    def test_defaults(self):
+        args = self.parser.parse_args("correct -t trees.nw".split())
+        self.assertEqual(args.command, 'correct')
+        self.assertEqual(args.ngen, 10)
+        self.assertEqual(args.dtlrate, ["1f", "0f", "1f"])
+        self.assertFalse(args.verbose)
+
+    def test_numpy_model_options_before_command(self):
+        # documented in the README
+        args = self.parser.parse_args("-m NP-JC69GAMMA --popsize 200 --gen 50 correct -t trees.nw".split())
+        self.assertEqual(args.command, 'correct')
+        self.assertEqual(args.raxmlmodel, 'NP-JC69GAMMA')
+        self.assertEqual(args.popsize, 200)
+        self.assertEqual(args.ngen, 50)
+        self.assertEqual(args.trees, 'trees.nw')
+
+    def test_command_overrides_global(self):
+        args = self.parser.parse_args("--gen 5 correct -t trees.nw --gen 7".split())
+        self.assertEqual(args.ngen, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import unittest
+
+from Bio import AlignIO
+
+from lib import TreeClass
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+# raxml binary supporting -f N (RAxML 8), the LklModel test is skipped without it
+RAXML = os.environ.get("GATC_TEST_RAXML")
+
+try:
+    from lib.raxmlib import LklModel, RAxMLModel
+    from lib.raxmlib import raxml
+except ImportError:
+    raxml = None
+
+
+def read_trees(ntrees=4):
+    trees = [TreeClass(os.path.join(EXAMPLE, 'mltree.nw'))]
+    with open(os.path.join(EXAMPLE, 'gtree.trees')) as handle:
+        for line in handle:
+            if line.strip() and not line.startswith(">"):
+                trees.append(TreeClass(line.strip()))
+            if len(trees) == ntrees:
+                break
+    return trees
+
+
+class BatchScoresMixin(object):
+    """The batch evaluation of the trees must give their one-tree scores"""
+
+    def make_model(self, alignment):
+        raise NotImplementedError
+
+    def test_batch_scores(self):
+        alignment = AlignIO.read(os.path.join(EXAMPLE, 'aln.fasta'), 'fasta')
+        trees = read_trees()
+        single = [self.make_model(alignment).optimize_model(tree.copy())[0] for tree in trees]
+        scores, batch_trees = self.make_model(alignment).optimize_batch([tree.copy() for tree in trees])
+        self.assertEqual(len(scores), len(trees))
+        self.assertEqual(len(batch_trees), len(trees))
+        for one, batch in zip(single, scores):
+            self.assertAlmostEqual(one, batch, delta=0.5)
+
+
+@unittest.skipIf(raxml is None, "the RAxML library is not built")
+class RAxMLModelBatchTest(BatchScoresMixin, unittest.TestCase):
+
+    def make_model(self, alignment):
+        return RAxMLModel(alignment, "PROTGAMMAJTT", 0.1, reestimate=True)
+
+
+@unittest.skipIf(raxml is None or not RAXML, "set GATC_TEST_RAXML to a raxml 8 binary")
+class LklModelBatchTest(BatchScoresMixin, unittest.TestCase):
+
+    def make_model(self, alignment):
+        return LklModel(alignment, RAXML, "PROTGAMMAJTT", 0.1, reestimate=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.TreeLib.memorize import LRUCache, DiskCache, memorize, sizeof
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxbytes=3 * sizeof(np.zeros(100)))
+        for i in range(3):
+            self.assertEqual(cache.set(i, np.zeros(100)), [])
+        cache.get(0)
+        evicted = cache.set(3, np.zeros(100))
+        self.assertEqual([key for key, _ in evicted], [1])
+        self.assertRaises(KeyError, cache.get, 1)
+        self.assertEqual(len(cache), 3)
+
+    def test_value_larger_than_limit(self):
+        cache = LRUCache(maxbytes=10)
+        self.assertEqual(len(cache.set('big', np.zeros(100))), 1)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_resize(self):
+        cache = LRUCache()
+        for i in range(4):
+            cache.set(i, np.zeros(100))
+        self.assertEqual(len(cache.resize(2 * sizeof(np.zeros(100)))), 2)
+        self.assertEqual(sorted(cache.data), [2, 3])
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname, ignore_errors=True)
+
+    def test_round_trip(self):
+        cache = DiskCache(self.dirname)
+        arr = np.arange(12.0).reshape(3, 4)
+        cache.set('array', arr)
+        cache.set('tuple', (arr, arr + 1))
+        cache.set('other', {'a': 1})
+        np.testing.assert_array_equal(cache.get('array'), arr)
+        first, second = cache.get('tuple')
+        np.testing.assert_array_equal(second, arr + 1)
+        self.assertEqual(cache.get('other'), {'a': 1})
+        self.assertRaises(KeyError, cache.get, 'missing')
+
+    def test_close_keeps_given_directory(self):
+        cache = DiskCache(self.dirname)
+        cache.set('x', 1)
+        cache.close()
+        self.assertTrue(os.path.isdir(self.dirname))
+
+    def test_close_removes_temporary_directory(self):
+        cache = DiskCache()
+        cache.set('x', np.zeros(3))
+        self.assertTrue(os.path.isdir(cache.dirname))
+        cache.close()
+        self.assertFalse(os.path.exists(cache.dirname))
+
+
+class MemorizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def square(x):
+            self.calls.append(x)
+            return np.array([x * x])
+        self.square = memorize(square)
+
+    def tearDown(self):
+        memorize.close()
+        memorize.instances.remove(self.square)
+
+    def test_hits_and_misses(self):
+        self.square(2, 2)
+        self.square(2, 2)
+        self.square(3, 3)
+        self.assertEqual(self.calls, [2, 3])
+        self.assertEqual((self.square.hits, self.square.misses), (1, 2))
+        # unhashable keys are not cached
+        self.square([4], 4)
+        self.square([4], 4)
+        self.assertEqual(self.calls, [2, 3, 4, 4])
+
+    def test_disk_hits(self):
+        memorize.configure(disk=True)
+        dirname = memorize.diskcache.dirname
+        self.square(2, 2)
+        self.square.clear()
+        self.assertEqual(self.square(2, 2)[0], 4)
+        self.assertEqual(self.calls, [2])
+        self.assertEqual(self.square.diskhits, 1)
+        memorize.close()
+        self.assertIsNone(memorize.diskcache)
+        self.assertFalse(os.path.exists(dirname))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import random
+import unittest
+
+from lib.ga.evolve import Util
+
+
+class Individual(object):
+
+    def __init__(self, score):
+        self.score = score
+        self.fitness = None
+
+
+def peeled_ranks(pop):
+    """Pareto fronts of the replaced compNextGen: the non-dominated
+    individuals of the remaining ones are peeled one front at a time"""
+    ranks = {}
+    remaining = list(pop)
+    front = 1
+    while remaining:
+        current = [p for p in remaining
+                   if not any(q.score[0] < p.score[0] and q.score[1] < p.score[1] for q in remaining)]
+        for p in current:
+            ranks[id(p)] = front
+        remaining = [p for p in remaining if id(p) not in ranks]
+        front += 1
+    return [ranks[id(p)] for p in pop]
+
+
+def population(seed, size, values):
+    # few distinct values, so there are ties on each score
+    rng = random.Random(seed)
+    return [Individual([rng.randint(0, values), rng.randint(0, values)]) for i in xrange(size)]
+
+
+class ParetoTest(unittest.TestCase):
+
+    def test_ranks(self):
+        for seed in xrange(20):
+            for values in (3, 20, 1000):
+                pop = population(seed, 60, values)
+                self.assertEqual(Util.nonDominatedRanks(pop), peeled_ranks(pop))
+
+    def test_next_generation(self):
+        for seed in xrange(5):
+            new, old = population(seed, 30, 10), population(seed + 100, 30, 10)
+            ranks = peeled_ranks(new + old)
+            expected = sorted(zip(ranks, [p.score for p in new + old]), key=lambda x: (x[0], x[1][-1], x[1][0]))
+            selected = Util.compNextGen(new, old, 25)
+            self.assertEqual([(p.fitness, p.score) for p in selected], expected[:25])
+
+    def test_crowding(self):
+        front = [Individual([0, 4]), Individual([1, 2]), Individual([2, 1]), Individual([4, 0])]
+        dist = Util.crowdingDistance(front)
+        self.assertEqual(dist[0], float('inf'))
+        self.assertEqual(dist[3], float('inf'))
+        self.assertAlmostEqual(dist[1], 2/4.0 + 3/4.0)
+        self.assertAlmostEqual(dist[2], 3/4.0 + 2/4.0)
+        # the extreme individuals of each front are kept first
+        selected = Util.compNextGen(front, [Individual([5, 5])], 2, crowding=True)
+        self.assertEqual(sorted(p.score for p in selected), [[0, 4], [4, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from Bio import AlignIO
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from lib.raxmlib.patterns import SitePatterns, site_patterns
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example', 'aln.fasta')
+
+
+def alignment(*seqs):
+    return MultipleSeqAlignment([SeqRecord(Seq(s), id="s%d" % i) for i, s in enumerate(seqs)])
+
+
+class SitePatternsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_patterns(self):
+        patterns = SitePatterns(alignment("ACAGAC", "AcTGAC", "GTTGGT"))
+        self.assertEqual(patterns.nsites, 6)
+        self.assertEqual(len(patterns), 4)
+        # in the order of their first site, the case is ignored
+        self.assertEqual(list(patterns.sequences()), [("s0", "ACAG"), ("s1", "ACTG"), ("s2", "GTTG")])
+        np.testing.assert_array_equal(patterns.weights, [2, 2, 1, 1])
+        np.testing.assert_array_equal(patterns.site_pattern, [0, 1, 2, 3, 0, 1])
+
+    def test_example(self):
+        aln = AlignIO.read(EXAMPLE, 'fasta')
+        patterns = SitePatterns(aln)
+        self.assertEqual(patterns.names, [rec.id for rec in aln])
+        self.assertEqual(patterns.weights.sum(), aln.get_alignment_length())
+        self.assertEqual(len(set(map(tuple, patterns.columns.T))), len(patterns))
+        chars = np.array([np.fromstring(str(rec.seq).upper(), dtype=np.uint8) for rec in aln])
+        np.testing.assert_array_equal(patterns.columns[:, patterns.site_pattern], chars)
+        self.assertIs(site_patterns(patterns), patterns)
+
+    def test_write(self):
+        patterns = SitePatterns(AlignIO.read(EXAMPLE, 'fasta'))
+        phylip = os.path.join(self.tmpdir, 'aln.phy')
+        weights = os.path.join(self.tmpdir, 'weights')
+        patterns.write_phylip(phylip)
+        patterns.write_weights(weights)
+        aln = AlignIO.read(phylip, 'phylip-relaxed')
+        self.assertEqual([(rec.id, str(rec.seq)) for rec in aln], list(patterns.sequences()))
+        with open(weights) as handle:
+            self.assertEqual([int(w) for w in handle.read().split()], list(patterns.weights))
+
+
+if __name__ == '__main__':
+    unittest.main()
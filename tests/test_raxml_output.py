@@ -0,0 +1,87 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from lib.raxmlib import output
+
+
+def old_tree_likelihoods(filename, n):
+    """extractRAXMLikelihood, replaced by read_tree_likelihoods"""
+    likelihoods = []
+    with open(filename) as IN:
+        patern = re.compile('Tree [0-9]+: ')
+        for line in reversed(IN.readlines()):
+            if (patern.match(line)):
+                likelihoods.append(float(line.split(':')[1].strip()))
+                n -= 1
+            if(n <= 0):
+                break
+    return list(reversed(likelihoods))
+
+
+class OutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, lines):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'w') as handle:
+            handle.write("\n".join(lines) + "\n")
+        return filename
+
+    def info_file(self, ntrees, nruns=3, padding=2000):
+        # the info file of several runs, each with a long log before its scores
+        lines = []
+        for run in xrange(nruns):
+            lines.extend("Iteration %d: model parameters, tree 12: -1.0" % i for i in xrange(padding))
+            lines.extend("Tree %d: %.6f" % (i, -1000.0*(run + 1) - i*1.5) for i in xrange(ntrees))
+            lines.append("Overall Time for Tree Evaluation 1.0")
+        return self.write("RAxML_info.test", lines)
+
+    def test_reverse_lines(self):
+        lines = ["line %d" % i for i in xrange(500)]
+        filename = self.write("lines", lines)
+        with open(filename, 'rb') as handle:
+            # small blocks, most lines are split between two blocks
+            self.assertEqual(list(output.reverse_lines(handle, blocksize=7)), [""] + lines[::-1])
+
+    def test_tree_likelihoods(self):
+        filename = self.info_file(50)
+        for ntrees in (1, 20, 50):
+            np.testing.assert_array_equal(output.read_tree_likelihoods(filename, ntrees),
+                                          old_tree_likelihoods(filename, ntrees))
+
+    def test_tree_likelihoods_block(self):
+        # the scores of the last run span several blocks
+        filename = self.info_file(5000, nruns=2, padding=10)
+        self.assertGreater(os.path.getsize(filename), 2*output.BLOCKSIZE)
+        np.testing.assert_array_equal(output.read_tree_likelihoods(filename, 5000),
+                                      old_tree_likelihoods(filename, 5000))
+
+    def test_truncated(self):
+        filename = self.info_file(10, nruns=1)
+        self.assertRaises(ValueError, output.read_tree_likelihoods, filename, 11)
+        log = self.write("RAxML_log.test", ["0.1 -10.5", "0.2 -11.25", ""])
+        np.testing.assert_array_equal(output.read_log_likelihoods(log, 2), [-10.5, -11.25])
+        self.assertRaises(ValueError, output.read_log_likelihoods, log, 3)
+
+    def test_persite_likelihoods(self):
+        lnl = -np.arange(12, dtype=float).reshape((3, 4)) / 7.0
+        lines = ["3 4"] + ["tr%d\t%s" % (i + 1, " ".join(repr(x) for x in row)) for i, row in enumerate(lnl)]
+        filename = self.write("RAxML_perSiteLLs.test", lines)
+        np.testing.assert_array_equal(output.read_persite_likelihoods(filename, 3), lnl)
+        self.assertRaises(ValueError, output.read_persite_likelihoods, filename, 2)
+        truncated = self.write("RAxML_perSiteLLs.truncated", lines[:-1])
+        self.assertRaises(ValueError, output.read_persite_likelihoods, truncated)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from lib.ga.ReconParams import ReconParams
+from lib.reclkl import computeDL
+from lib.TreeLib import TreeUtils
+from tests.test_dtl_array import simulate
+
+# (dup, loss) costs, None takes the costs of the params module
+COSTS = [(None, None), (1, 1), (2, 1), (3, 0.5)]
+
+
+@unittest.skipIf(computeDL is None, "the reconDL module is not built")
+class DLCostTest(unittest.TestCase):
+
+    def check(self, recparam, gtree):
+        lcamap = TreeUtils.lcaMapping(gtree, recparam.sptree)
+        for dup, loss in COSTS:
+            expected = sum(TreeUtils.computeDLScore(gtree, lcamap, dup, loss))
+            self.assertAlmostEqual(recparam.computeDLCost(gtree, dup, loss), expected)
+
+    def test_cost_matches_score(self):
+        for seed in (1, 2, 3):
+            sptree, gtree = simulate(seed, spsize=10, gsize=30)
+            self.check(ReconParams(sptree.write(format=5), len(gtree), parcim=True), gtree)
+
+    def test_gene_polytomy(self):
+        sptree, gtree = simulate(4, spsize=10, gsize=30)
+        recparam = ReconParams(sptree.write(format=5), len(gtree), parcim=True)
+        for node in gtree.get_descendants():
+            if not node.is_leaf() and not node.up.is_root():
+                node.delete()
+                break
+        self.check(recparam, gtree)
+
+
+if __name__ == '__main__':
+    unittest.main()
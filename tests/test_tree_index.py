@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from lib.TreeLib.SimulModel import SimulModel
+from lib.TreeLib.TreeIndex import TreeIndex
+
+
+def species_tree(seed, size=15):
+    tree = SimulModel(seed=seed).pure_birth_tree(birth=1.0, nsize=size)
+    tree.label_internal_node()
+    return tree
+
+
+class IncomparableTest(unittest.TestCase):
+
+    def check(self, tree, **kwargs):
+        index = TreeIndex(tree, lca=False)
+        for i, node in enumerate(index.nodes):
+            # get_incomparable_list fails on the root, comparable with every node
+            expected = node.get_incomparable_list(**kwargs) if i != index.root else set()
+            self.assertEqual(set(index.nodes[j] for j in index.incomparable(i, **kwargs)), expected)
+
+    def test_incomparable(self):
+        for seed in (1, 2):
+            tree = species_tree(seed)
+            self.check(tree)
+            self.check(tree, exclude_sis=True)
+            self.check(tree, timeconsistent=True)
+            self.check(tree, timeconsistent=True, wtime=0.05)
+
+    def test_non_binary(self):
+        tree = species_tree(3)
+        for node in tree.get_descendants():
+            if not node.is_leaf():
+                node.delete()
+                break
+        self.check(tree)
+        self.check(tree, exclude_sis=True)
+
+    def test_incomparable_min(self):
+        rng = np.random.RandomState(4)
+        index = TreeIndex(species_tree(4, size=30), lca=False)
+        values = rng.rand(index.size)
+        expected = [values[index.incomparable(i)].min() if len(index.incomparable(i)) else np.inf
+                    for i in xrange(index.size)]
+        np.testing.assert_array_equal(index.incomparable_min(values), expected)
+        for i in xrange(index.size):
+            sub = np.arange(index.first[i], i + 1)
+            self.assertEqual(index.subtree_min(values)[i], values[sub].min())
+            for j in xrange(index.size):
+                self.assertEqual(index.is_incomparable(i, j), j in index.incomparable(i))
+
+
+if __name__ == '__main__':
+    unittest.main()
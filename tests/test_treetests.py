@@ -0,0 +1,106 @@
+import unittest
+
+import numpy as np
+from scipy.stats import norm
+
+from lib.raxmlib import treetests
+from lib.raxmlib.treetests import RellBootstrap, topology_tests
+
+NSITES = 500
+
+
+def site_lnl(seed, shift=0.0, noise=0.05):
+    """Site log-likelihoods of a reference tree and of a second tree, worse
+    by shift per site on average"""
+    rng = np.random.RandomState(seed)
+    best = -rng.gamma(2.0, 2.0, NSITES)
+    other = best - shift + noise*rng.randn(NSITES)
+    return np.array([best, other])
+
+
+class RellBootstrapTest(unittest.TestCase):
+
+    def test_counts(self):
+        weights = np.array([3, 1, 5, 1])
+        rell = RellBootstrap(weights, nboot=200)
+        self.assertEqual(rell.nsites, 10)
+        self.assertIn(1.0, rell.scales)
+        for scale in rell.scales:
+            counts = rell.counts(scale)
+            self.assertEqual(counts.shape, (200, 4))
+            self.assertTrue(np.all(counts.sum(axis=1) == max(int(round(scale*10)), 1)))
+
+    def test_reproducible(self):
+        weights = np.ones(NSITES)
+        first = RellBootstrap(weights, nboot=100)
+        second = RellBootstrap(weights, nboot=100)
+        # the counts of a scale do not depend on the previous draws
+        second.counts(0.5)
+        np.testing.assert_array_equal(first.counts(1.0), second.counts(1.0))
+        self.assertFalse(np.array_equal(first.counts(1.0), RellBootstrap(weights, nboot=100, seed=1).counts(1.0)))
+        lnl = site_lnl(0, 0.01)
+        tests = topology_tests(lnl, first)
+        for key, value in topology_tests(lnl, second).items():
+            np.testing.assert_array_equal(value, tests[key])
+
+    def test_check(self):
+        rell = RellBootstrap(np.ones(NSITES))
+        self.assertRaises(ValueError, rell.check, site_lnl(0)[:1])
+        self.assertRaises(ValueError, rell.check, site_lnl(0)[:, :-1])
+
+
+class TopologyTestsTest(unittest.TestCase):
+
+    def test_close_trees(self):
+        tests = topology_tests(site_lnl(1, 0.0), RellBootstrap(np.ones(NSITES)))
+        for key in ('au', 'np', 'kh', 'sh'):
+            self.assertTrue(np.all(tests[key] > 0.05), key)
+        self.assertAlmostEqual(tests['bp'].sum(), 1.0)
+        self.assertAlmostEqual(tests['pp'].sum(), 1.0)
+
+    def test_worse_tree(self):
+        # the second tree is sometimes the best one at the small scales
+        # with the smaller shift, only in a few replicates with the larger one
+        for shift in (0.12, 0.2):
+            lnl = site_lnl(2, shift, noise=1.0)
+            tests = topology_tests(lnl, RellBootstrap(np.ones(NSITES)))
+            total = lnl.sum(axis=1)
+            np.testing.assert_allclose(tests['obs'], [total[1] - total[0], total[0] - total[1]])
+            for key in ('au', 'np', 'kh', 'sh', 'bp'):
+                self.assertLess(tests[key][1], 0.05, key)
+                self.assertGreater(tests[key][0], 0.5, key)
+
+    def test_site_patterns(self):
+        # the same sites, as patterns with their counts
+        lnl = site_lnl(3, 0.05, noise=1.0)[:, :50]
+        counts = np.arange(1, 51) % 4 + 1
+        sites = np.repeat(lnl, counts, axis=1)
+        per_site = topology_tests(sites, RellBootstrap(np.ones(sites.shape[1])))
+        patterns = topology_tests(lnl, RellBootstrap(counts))
+        np.testing.assert_allclose(patterns['obs'], per_site['obs'])
+        np.testing.assert_allclose(patterns['pp'], per_site['pp'])
+        for key in ('au', 'kh', 'sh', 'bp'):
+            np.testing.assert_allclose(patterns[key], per_site[key], atol=0.1)
+
+
+class AUTest(unittest.TestCase):
+
+    def test_fit(self):
+        # exact multiscale bootstrap probabilities of the model fitted by the test
+        scales = treetests.SCALES
+        sr = np.sqrt(scales)
+        params = [(0.5, 0.2), (-1.0, 0.3), (2.0, -0.1)]
+        bps = np.column_stack([norm.sf(v*sr + c/sr) for v, c in params])
+        au, naive = treetests.au_test(bps, scales, 1000)
+        np.testing.assert_allclose(au, [norm.sf(v - c) for v, c in params])
+        np.testing.assert_allclose(naive, [norm.sf(v + c) for v, c in params])
+
+    def test_degenerate(self):
+        bps = np.array([[1.0, 0.0]]*len(treetests.SCALES))
+        au, naive = treetests.au_test(bps, treetests.SCALES, 1000)
+        np.testing.assert_array_equal(au, [1.0, 0.0])
+        np.testing.assert_array_equal(naive, [1.0, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()